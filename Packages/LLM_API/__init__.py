@@ -1 +1,10 @@
-from .llm import LLM, MultiLLM
\ No newline at end of file
+from .llm import LLM, MultiLLM
+from .transport import get_session, get_async_client, aclose_async_client, deadline, remaining_time
+from .cache import ResponseCache
+from .embedding_store import EmbeddingStore
+from .rate_limiter import RateLimiter, get_rate_limiter
+from .qwen import QwenLLM
+from .router import LLMRouter
+from .hedging import HedgedLLM
+from .metrics import MetricsRegistry, get_metrics
+from .stand_in import StandInServer
\ No newline at end of file
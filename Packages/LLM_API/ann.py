@@ -0,0 +1,174 @@
+import os
+import math
+import concurrent.futures
+import numpy as np
+
+from .similarity import normalize_rows, block_neighbours, greedy_merge, tile_shape, DEFAULT_MEMORY_BUDGET
+
+CHUNK_ROWS = 1024
+
+
+class IVFIndex:
+    """
+    倒排文件（IVF）式的近似近邻索引：用球面 k-means 把向量划分到 nlist 个簇，
+    每个向量同时挂到最近的 nprobe 个簇里，只在同簇向量之间精确计算相似度。
+    nprobe 是召回率/速度的调节旋钮：越大召回越高、越慢。
+
+    参数:
+    nlist (int): 簇数，None 表示取 4 * sqrt(n)。
+    nprobe (int): 每个向量挂入的簇数。
+    n_iter (int): k-means 迭代次数。
+    sample_size (int): 训练 k-means 的采样数，None 表示取 16 * nlist。
+    n_jobs (int): 并行线程数，None 表示使用全部 CPU 核。
+    seed (int): 随机种子。
+    """
+
+    def __init__(self, nlist=None, nprobe=3, n_iter=10, sample_size=None, n_jobs=None, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.sample_size = sample_size
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.seed = seed
+        self.centroids = None
+        self.lists = []
+
+    def _nearest(self, normed, k):
+        # 分块计算每行最近的 k 个簇
+        k = min(k, self.centroids.shape[0])
+        assignments = np.empty((normed.shape[0], k), dtype=np.int64)
+        for start in range(0, normed.shape[0], CHUNK_ROWS):
+            scores = normed[start:start + CHUNK_ROWS] @ self.centroids.T
+            if k == 1:
+                assignments[start:start + CHUNK_ROWS, 0] = np.argmax(scores, axis=1)
+            else:
+                assignments[start:start + CHUNK_ROWS] = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        return assignments
+
+    def fit(self, normed):
+        n = normed.shape[0]
+        nlist = self.nlist or max(1, int(4 * math.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(self.seed)
+
+        sample_size = min(n, self.sample_size or 16 * nlist)
+        sample = normed[rng.choice(n, size=sample_size, replace=False)]
+        self.centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+
+        for _ in range(self.n_iter):
+            labels = self._nearest(sample, 1)[:, 0]
+            order = np.argsort(labels, kind='stable')
+            sorted_labels = labels[order]
+            starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+            # 空簇保留原中心
+            sums = self.centroids.copy()
+            sums[sorted_labels[starts]] = np.add.reduceat(sample[order], starts, axis=0)
+            self.centroids = normalize_rows(sums)
+
+        assignments = self._nearest(normed, self.nprobe)
+        members = np.repeat(np.arange(n), assignments.shape[1])
+        list_ids = assignments.ravel()
+        order = np.argsort(list_ids, kind='stable')
+        members, list_ids = members[order], list_ids[order]
+        bounds = np.searchsorted(list_ids, np.arange(nlist + 1))
+        self.lists = [members[bounds[k]:bounds[k + 1]] for k in range(nlist)]
+        return self
+
+    def _list_pairs(self, normed, indices, threshold):
+        pairs_i = []
+        pairs_j = []
+        for start in range(0, len(indices), CHUNK_ROWS):
+            chunk = indices[start:start + CHUNK_ROWS]
+            tile = normed[chunk] @ normed[indices].T
+            r, c = np.nonzero(tile >= threshold)
+            i, j = chunk[r], indices[c]
+            keep = i != j
+            pairs_i.append(i[keep])
+            pairs_j.append(j[keep])
+        if not pairs_i:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+    def neighbours(self, normed, threshold):
+        """
+        返回每一行相似度 >= threshold 的近邻下标（升序，不含自身），只在同簇向量间计算。
+        """
+        n = normed.shape[0]
+        if self.centroids is None:
+            self.fit(normed)
+
+        lists = [indices for indices in self.lists if len(indices) > 1]
+        if self.n_jobs > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+                parts = list(executor.map(lambda indices: self._list_pairs(normed, indices, threshold), lists))
+        else:
+            parts = [self._list_pairs(normed, indices, threshold) for indices in lists]
+
+        if parts:
+            i = np.concatenate([p[0] for p in parts])
+            j = np.concatenate([p[1] for p in parts])
+        else:
+            i = j = np.empty(0, dtype=np.int64)
+        # 同一对可能出现在多个簇中，去重并按 (行, 列) 排序
+        codes = np.unique(i.astype(np.int64) * n + j)
+        i, j = codes // n, codes % n
+        bounds = np.searchsorted(i, np.arange(n + 1))
+        return [j[bounds[k]:bounds[k + 1]] for k in range(n)]
+
+
+def measure_recall(normed, approx_neighbours, threshold, sample_size=1000, memory_budget=DEFAULT_MEMORY_BUDGET, seed=0):
+    """
+    随机抽取若干行，用精确分块计算核对近似近邻的召回率。
+
+    返回:
+    float: 召回率（近似结果找到的真实近邻数 / 真实近邻数），没有真实近邻时为 1.0。
+    """
+    n = normed.shape[0]
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(n, size=min(sample_size, n), replace=False))
+    _, col_block = tile_shape(n, memory_budget)
+    exact = block_neighbours(normed, rows, threshold, col_block)
+
+    found = 0
+    total = 0
+    for i, exact_indices in zip(rows, exact):
+        total += len(exact_indices)
+        found += len(np.intersect1d(exact_indices, approx_neighbours[i], assume_unique=True))
+    return found / total if total else 1.0
+
+
+def ann_partition_by_similarity(keys, matrix, threshold=0.8, nlist=None, nprobe=3, n_jobs=None,
+                                check_recall=False, recall_sample=1000, seed=0):
+    """
+    partition_by_similarity 的近似版本：用 IVFIndex 找出相似度 >= threshold 的近邻后做同样的贪心合并，
+    返回格式与精确版本相同。近邻都经过精确相似度校验，只可能漏合并，不会误合并。
+
+    参数:
+    keys (list of str): 词列表。
+    matrix (array-like): 与 keys 对应的向量矩阵。
+    threshold (float): 相似度阈值。
+    nlist (int): 簇数，None 表示自动选择。
+    nprobe (int): 每个向量挂入的簇数，越大召回越高。
+    n_jobs (int): 并行线程数。
+    check_recall (bool): 为 True 时抽样与精确结果对比并打印召回率。
+    recall_sample (int): 召回率抽样行数。
+
+    返回:
+    dict: {主词: {'Similar_keys': [相似词, ...]}}。
+    """
+    n = len(keys)
+    result = {}
+    if n == 0:
+        return result
+
+    normed = normalize_rows(matrix)
+    index = IVFIndex(nlist=nlist, nprobe=nprobe, n_jobs=n_jobs, seed=seed).fit(normed)
+    neighbours = index.neighbours(normed, threshold)
+
+    if check_recall:
+        recall = measure_recall(normed, neighbours, threshold, recall_sample, seed=seed)
+        print(f"ANN recall@{threshold}: {recall:.4f} (nlist={len(index.lists)}, nprobe={nprobe})")
+
+    valid = np.ones(n, dtype=bool)
+    greedy_merge(keys, np.arange(n), neighbours, valid, result)
+    return result
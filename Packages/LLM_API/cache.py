@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+class ResponseCache:
+    """
+    基于 SQLite 的持久化响应缓存，以 (model, messages, parameters) 的哈希为键。
+    使用 WAL 模式，可在多线程、多进程之间共享同一个缓存文件。
+
+    参数:
+    path (str): 缓存数据库文件路径。
+    max_bytes (int): 缓存内容总大小上限，超出后按最近访问时间（LRU）淘汰。
+    ttl (float): 条目有效期（秒），None 表示永不过期。
+    """
+
+    EVICT_CHECK_INTERVAL = 64  # 每写入多少条检查一次总大小
+
+    def __init__(self, path=os.path.join('cache', 'llm_cache.sqlite'), max_bytes=1 << 30, ttl=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        cache_dir = os.path.dirname(self.path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed)")
+        conn.commit()
+
+    def _connect(self):
+        # sqlite3 连接不能跨线程共享，每个线程各开一个
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(model, messages, **params):
+        payload = json.dumps({'model': model, 'messages': messages, 'params': params},
+                             ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        读取缓存，未命中或已过期时返回 None。
+        """
+        conn = self._connect()
+        row = conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            row = None
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        with self._lock:
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        encoded = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, encoded, len(encoded.encode('utf-8')), now, now)
+        )
+        with self._lock:
+            self._puts += 1
+            check = self._puts % self.EVICT_CHECK_INTERVAL == 0
+        if check:
+            self.evict()
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def evict(self):
+        """
+        总大小超过 max_bytes 时，按最近访问时间从旧到新删除条目，直到降到上限的 90%。
+        """
+        conn = self._connect()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        keys = []
+        for key, size in conn.execute("SELECT key, size FROM cache ORDER BY accessed ASC"):
+            keys.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        conn.executemany("DELETE FROM cache WHERE key = ?", keys)
+        with self._lock:
+            self.evictions += len(keys)
+        return len(keys)
+
+    def clear(self):
+        self._connect().execute("DELETE FROM cache")
+
+    def stats(self):
+        conn = self._connect()
+        entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': entries,
+                'bytes': total,
+            }
@@ -0,0 +1,216 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+
+
+class EmbeddingStore:
+    """
+    磁盘上的向量库：float32 归一化向量矩阵（可内存映射）+ 文本哈希到行号的索引。
+    已经嵌入过的文本不会再次请求接口，相似度计算都是归一化向量上的批量矩阵乘法。
+
+    参数:
+    path (str): 向量库目录，包含 vectors.f32、index.jsonl、meta.json。
+    embedder: 提供 embed_list(texts) 的对象，一般是 MultiLLM。
+    """
+
+    def __init__(self, path='embedding_store', embedder=None):
+        self.path = path
+        self.embedder = embedder
+        self.vectors_path = os.path.join(path, 'vectors.f32')
+        self.index_path = os.path.join(path, 'index.jsonl')
+        self.meta_path = os.path.join(path, 'meta.json')
+        self.dim = None
+        self.index = {}
+        self.texts = []
+        self._matrix = None
+        self._lock = threading.RLock()
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def text_hash(text):
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _load(self):
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                self.dim = json.load(f)['dim']
+
+        if os.path.exists(self.index_path):
+            valid_bytes = 0
+            with open(self.index_path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # 写入中断留下的半行
+                    try:
+                        record = json.loads(line.decode('utf-8'))
+                    except (UnicodeDecodeError, json.JSONDecodeError):
+                        break
+                    self.index[record['hash']] = record['row']
+                    self.texts.append(record['text'])
+                    valid_bytes += len(line)
+            # 截掉半行，否则之后追加的记录会接在半行后面，下次加载时全部丢失
+            if os.path.getsize(self.index_path) > valid_bytes:
+                with open(self.index_path, 'r+b') as f:
+                    f.truncate(valid_bytes)
+
+        # 向量先于索引写入，截掉索引中没有记录的多余行
+        if self.dim is not None and os.path.exists(self.vectors_path):
+            expected = len(self.texts) * self.dim * 4
+            if os.path.getsize(self.vectors_path) > expected:
+                with open(self.vectors_path, 'r+b') as f:
+                    f.truncate(expected)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __contains__(self, text):
+        return self.text_hash(text) in self.index
+
+    @property
+    def matrix(self):
+        """
+        以只读内存映射方式返回全部向量，形状为 (n, dim)。
+        """
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[0] != len(self.texts):
+                if not self.texts:
+                    return np.zeros((0, self.dim or 0), dtype=np.float32)
+                self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r',
+                                         shape=(len(self.texts), self.dim))
+            return self._matrix
+
+    def add(self, texts, embeddings):
+        """
+        追加新的文本及其向量，已存在或向量为 None 的文本会被跳过。
+        """
+        with self._lock:
+            new_texts = []
+            new_rows = []
+            for text, embedding in zip(texts, embeddings):
+                if embedding is None or text in self:
+                    continue
+                new_texts.append(text)
+                new_rows.append(embedding)
+            if not new_texts:
+                return 0
+
+            vectors = np.asarray(new_rows, dtype=np.float32)
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self.meta_path, 'w', encoding='utf-8') as f:
+                    json.dump({'dim': self.dim}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"向量维度不一致：库中为 {self.dim}，新向量为 {vectors.shape[1]}")
+
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1, norms)
+
+            with open(self.vectors_path, 'ab') as f:
+                f.write(vectors.tobytes())
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                for text in new_texts:
+                    row = len(self.texts)
+                    text_hash = self.text_hash(text)
+                    f.write(json.dumps({'hash': text_hash, 'row': row, 'text': text}, ensure_ascii=False) + '\n')
+                    self.index[text_hash] = row
+                    self.texts.append(text)
+            self._matrix = None
+            return len(new_texts)
+
+    def ensure(self, texts):
+        """
+        只为库中还没有的文本请求 embedding。
+        """
+        missing = [text for text in dict.fromkeys(texts) if text not in self]
+        if missing:
+            if self.embedder is None:
+                raise ValueError("EmbeddingStore 未设置 embedder，无法嵌入新文本。")
+            embeddings = self.embedder.embed_list(missing)
+            self.add(missing, [embeddings.get(text) for text in missing])
+        return len(missing)
+
+    def rows(self, texts):
+        self.ensure(texts)
+        return [self.index.get(self.text_hash(text)) for text in texts]
+
+    def get(self, texts):
+        """
+        返回 texts 对应的归一化向量矩阵，嵌入失败的文本对应全零行。
+        """
+        rows = self.rows(texts)
+        matrix = self.matrix
+        result = np.zeros((len(texts), self.dim or 0), dtype=np.float32)
+        valid = [i for i, row in enumerate(rows) if row is not None]
+        if valid:
+            result[valid] = matrix[[rows[i] for i in valid]]
+        return result
+
+    def _query_vector(self, query):
+        # 查询文本只用来检索，不写入库：已在库中时直接取向量，否则临时嵌入
+        row = self.index.get(self.text_hash(query))
+        if row is not None:
+            return np.array(self.matrix[row])
+        if self.embedder is None:
+            raise ValueError("EmbeddingStore 未设置 embedder，无法嵌入新文本。")
+        embedding = self.embedder.embed_list([query]).get(query)
+        if embedding is None:
+            raise ValueError(f"查询文本嵌入失败：{query}")
+        vector = np.asarray(embedding, dtype=np.float32)
+        if self.dim is not None and vector.shape[0] != self.dim:
+            raise ValueError(f"向量维度不一致：库中为 {self.dim}，新向量为 {vector.shape[0]}")
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def top_k(self, query, k=10, candidates=None, block_rows=65536):
+        """
+        返回与 query 最相似的 k 个文本及余弦相似度，结果不含 query 本身，query 也不会被加入库中。
+
+        参数:
+        query (str): 查询文本。
+        k (int): 返回条数。
+        candidates (list of str): 候选文本，None 表示在整个库中检索。
+        block_rows (int): 分块计算时每块的行数，控制内存占用。
+
+        返回:
+        list of tuple: [(text, score), ...]，按相似度从高到低排列。
+        """
+        query_vector = self._query_vector(query)
+        if candidates is not None:
+            candidate_texts = [text for text in candidates if text != query]
+            scores = self.get(candidate_texts) @ query_vector
+        else:
+            candidate_texts = self.texts
+            matrix = self.matrix
+            scores = np.empty(matrix.shape[0], dtype=np.float32)
+            for start in range(0, matrix.shape[0], block_rows):
+                scores[start:start + block_rows] = matrix[start:start + block_rows] @ query_vector
+            query_row = self.index.get(self.text_hash(query))
+            if query_row is not None:
+                scores[query_row] = -np.inf
+
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(candidate_texts[i], float(scores[i])) for i in top]
+
+    def pairwise(self, texts_a, texts_b):
+        """
+        返回 texts_a 与 texts_b 两两之间的余弦相似度矩阵，形状为 (len(texts_a), len(texts_b))。
+        """
+        self.ensure(list(texts_a) + list(texts_b))
+        return self.get(texts_a) @ self.get(texts_b).T
+
+    def as_dict(self, texts):
+        """
+        返回与 MultiLLM.embed_list 相同格式的 {text: vector} 字典，值为 float32 向量。
+        """
+        rows = self.rows(texts)
+        matrix = self.matrix
+        return {text: np.array(matrix[row]) for text, row in zip(texts, rows) if row is not None}
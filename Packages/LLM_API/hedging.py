@@ -0,0 +1,202 @@
+import time
+import asyncio
+import threading
+import contextvars
+import collections
+import concurrent.futures
+
+from .router import client_name
+
+
+class HedgedLLM:
+    """
+    对冲请求包装：主客户端在最近延迟的某个分位数（默认 p90）内还没有返回时，
+    把同一请求发给备用客户端，取先成功返回的结果，另一个结果被丢弃（异步模式下直接取消）。
+    分位数只统计主客户端自身的延迟（从请求真正开始时计时），主请求输给对冲请求时也会记录。
+    对外提供与 LLM 相同的 ask / ask_async 接口。
+
+    参数:
+    primary: 主客户端。
+    secondary: 对冲用的客户端，None 表示向主客户端再发一次。
+    percentile (float): 触发对冲的延迟分位数。
+    budget (float): 对冲请求数占总请求数的上限，控制额外花费。
+    min_samples (int): 延迟样本少于该数时不对冲。
+    window (int): 延迟统计窗口大小。
+    max_workers (int): 同步模式下同时在途的对冲请求数上限，没有空闲名额时不对冲。
+    """
+
+    def __init__(self, primary, secondary=None, percentile=90, budget=0.1, min_samples=20, window=200, max_workers=256):
+        self.primary = primary
+        self.secondary = secondary if secondary is not None else primary
+        self.provider = getattr(primary, 'provider', 'hedged')
+        self.model = client_name(primary).split('/', 1)[1]
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.latencies = collections.deque(maxlen=window)
+        self.requests = 0
+        self.hedges_fired = 0
+        self.hedge_wins = 0
+        self.budget_skipped = 0
+        self.slots_skipped = 0
+        self._lock = threading.Lock()
+        # 对冲请求数不超过线程数，提交后立即执行，不会在线程池中排队
+        self._hedge_slots = threading.BoundedSemaphore(max_workers)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    @property
+    def total_tokens_used(self):
+        tokens = getattr(self.primary, 'total_tokens_used', 0)
+        if self.secondary is not self.primary:
+            tokens += getattr(self.secondary, 'total_tokens_used', 0)
+        return tokens
+
+    def hedge_delay(self):
+        """
+        返回触发对冲的等待秒数，样本不足时返回 None（不对冲）。
+        """
+        with self._lock:
+            if len(self.latencies) < self.min_samples:
+                return None
+            ordered = sorted(self.latencies)
+        position = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return ordered[position]
+
+    def _begin(self):
+        with self._lock:
+            self.requests += 1
+
+    def _allow_hedge(self):
+        with self._lock:
+            if self.hedges_fired + 1 > self.budget * self.requests:
+                self.budget_skipped += 1
+                return False
+            if not self._hedge_slots.acquire(blocking=False):
+                self.slots_skipped += 1
+                return False
+            self.hedges_fired += 1
+            return True
+
+    def _record_latency(self, latency):
+        with self._lock:
+            self.latencies.append(latency)
+
+    def _finish(self, hedge_won):
+        if hedge_won:
+            with self._lock:
+                self.hedge_wins += 1
+
+    def _ask_primary(self, prompt):
+        start = time.perf_counter()
+        answer = self.primary.ask(prompt)
+        self._record_latency(time.perf_counter() - start)
+        return answer
+
+    def _start_primary(self, prompt):
+        # 主请求使用独立线程而不是共享线程池，提交后立即开始，不会因排队被误判为慢请求
+        future = concurrent.futures.Future()
+        context = contextvars.copy_context()
+
+        def run():
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(context.run(self._ask_primary, prompt))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name='hedged-primary', daemon=True).start()
+        return future
+
+    def _submit_hedge(self, prompt):
+        # 在调用方的上下文中执行，任务截止时间同样作用于对冲请求
+        future = self._executor.submit(contextvars.copy_context().run, self.secondary.ask, prompt)
+        future.add_done_callback(lambda _: self._hedge_slots.release())
+        return future
+
+    def ask(self, prompt):
+        self._begin()
+        delay = self.hedge_delay()
+        if delay is None:
+            # 样本不足时不会对冲，直接在调用方线程中请求
+            answer = self._ask_primary(prompt)
+            self._finish(False)
+            return answer
+
+        primary = self._start_primary(prompt)
+        done, _ = concurrent.futures.wait([primary], timeout=delay)
+        if done or not self._allow_hedge():
+            answer = primary.result()
+            self._finish(False)
+            return answer
+
+        hedge = self._submit_hedge(prompt)
+        pending = {primary, hedge}
+        last_error = None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                try:
+                    answer = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                # 落后的请求无法中断，在后台线程中结束；主请求输了也会在结束时记录延迟
+                self._finish(future is hedge)
+                return answer
+        raise last_error
+
+    async def _call_async(self, client, prompt):
+        if hasattr(client, 'ask_async'):
+            return await client.ask_async(prompt)
+        return await asyncio.to_thread(client.ask, prompt)
+
+    async def _ask_primary_async(self, prompt, started):
+        started.append(time.perf_counter())
+        answer = await self._call_async(self.primary, prompt)
+        self._record_latency(time.perf_counter() - started[0])
+        return answer
+
+    async def ask_async(self, prompt):
+        self._begin()
+        started = []
+        primary = asyncio.ensure_future(self._ask_primary_async(prompt, started))
+        delay = self.hedge_delay()
+        if delay is not None:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        if delay is None or done or not self._allow_hedge():
+            answer = await primary
+            self._finish(False)
+            return answer
+
+        hedge = asyncio.ensure_future(self._call_async(self.secondary, prompt))
+        pending = {primary, hedge}
+        last_error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        continue
+                    self._finish(task is hedge)
+                    return task.result()
+            raise last_error
+        finally:
+            self._hedge_slots.release()
+            # 取消落后的请求，连接随之关闭；被取消的主请求按已耗时记录（实际延迟至少这么长）
+            if primary in pending and started:
+                self._record_latency(time.perf_counter() - started[0])
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedges_fired': self.hedges_fired,
+                'hedge_wins': self.hedge_wins,
+                'budget_skipped': self.budget_skipped,
+                'slots_skipped': self.slots_skipped,
+                'hedge_rate': self.hedges_fired / self.requests if self.requests else 0.0,
+                'hedge_win_rate': self.hedge_wins / self.hedges_fired if self.hedges_fired else 0.0,
+            }
@@ -1,67 +1,316 @@
 import os
+import json
+import time
+import threading
+import collections
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, RateLimitError
 import requests
+import httpx
+import weakref
 import base64
 import numpy as np
 import concurrent.futures
 from tqdm import tqdm
+from .transport import get_session, get_async_client, timeout_kwargs, httpx_timeout_kwargs, check_deadline, read_body, within_deadline
+from .tokens import pack_batches, estimate_tokens
+from .cache import ResponseCache
+from .similarity import partition_by_similarity, DEFAULT_MEMORY_BUDGET
+from .ann import ann_partition_by_similarity
+from .rate_limiter import RateLimiter, get_rate_limiter, DEFAULT_COMPLETION_TOKENS
+from .metrics import get_metrics
+
+STREAM_STATS_MAXLEN = 1000
+IMAGE_TOKENS = 765  # 一张图片按 1024x1024 高清图估算的 token 数
+
+
+def stream_call_stats(start, first_token_time, end, completion_tokens):
+    """
+    汇总一次流式调用的首 token 延迟（ttft）、总耗时和生成速度（tokens/s）。
+    """
+    generation_time = end - first_token_time if first_token_time is not None else 0.0
+    return {
+        'ttft': first_token_time - start if first_token_time is not None else None,
+        'duration': end - start,
+        'completion_tokens': completion_tokens,
+        'tokens_per_second': completion_tokens / generation_time if generation_time > 0 else 0.0,
+    }
 
 class LLM:
-    def __init__(self, version='coder', api_key=None):
+    def __init__(self, version='coder', api_key=None, cache=None, rate_limiter=None, metrics=None, base_url=None):
         load_dotenv()
         self.version = 'deepseek-' + version
+        self.provider = 'deepseek'
+        self.cache = cache
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.metrics = metrics or get_metrics()
         self.client = None
         self.initialized = False
         self.total_tokens_used = 0
+        self._usage_lock = threading.Lock()
+        # 最近若干次流式调用的 ttft / tokens_per_second
+        self.stream_stats = collections.deque(maxlen=STREAM_STATS_MAXLEN)
+        # 每个共享的 httpx.AsyncClient 对应一个 AsyncOpenAI 实例
+        self._async_clients = weakref.WeakKeyDictionary()
 
         if api_key:
             self.api_key = api_key
         else:
             self.api_key = os.getenv('DEEPSEEK_API', None)
         
-        base_url = 'https://api.deepseek.com'
-        self.init_service(self.api_key, base_url)
+        # base_url 可指向 StandInServer 等 OpenAI 兼容服务
+        self.init_service(self.api_key, base_url or 'https://api.deepseek.com')
 
     def init_service(self, api_key: str, base_url: str) -> bool:
         self.client = OpenAI(
             api_key=api_key,
             base_url=base_url
         )
+        self.base_url = base_url
+        self._async_clients = weakref.WeakKeyDictionary()
         self.initialized = True
         return True
 
-    def ask(self, prompt: str) -> str:
+    def _check_service(self):
         if not self.initialized:
             raise ValueError("服务未初始化，请先调用 init_service 方法初始化服务。")
 
         if not self.client:
             raise ValueError("OpenAI 客户端未正确初始化，请检查初始化过程。")
 
-        response = self.client.chat.completions.create(
-            model=self.version,
-            messages=[{"role": "user", "content": prompt}]
-        )
+    def _get_async_client(self) -> AsyncOpenAI:
+        http_client = get_async_client()
+        client = self._async_clients.get(http_client)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=http_client
+            )
+            self._async_clients[http_client] = client
+        return client
 
-        if response:
-            total_tokens = response.usage.total_tokens
+    def _record_usage(self, reserved_tokens, total_tokens):
+        with self._usage_lock:
             self.total_tokens_used += total_tokens
+        self.rate_limiter.record_usage(self.provider, self.version, reserved_tokens, total_tokens)
+
+    def _parse_response(self, response, reserved_tokens=0, call=None) -> str:
+        if response:
+            usage = response.usage
+            self._record_usage(reserved_tokens, usage.total_tokens)
+            if call is not None:
+                call.prompt_tokens = usage.prompt_tokens
+                call.completion_tokens = usage.completion_tokens
             return response.choices[0].message.content
         else:
             return ""
 
+    @staticmethod
+    def _reserved_tokens(messages):
+        return estimate_tokens(messages[-1]['content']) + DEFAULT_COMPLETION_TOKENS
+
+    @staticmethod
+    def _request_bytes(messages):
+        return len(json.dumps(messages, ensure_ascii=False).encode('utf-8'))
+
+    @staticmethod
+    def _with_deadline(client):
+        # 设置了截止时间时按剩余时间超时，且不让 SDK 自动重试拖过截止时间
+        options = httpx_timeout_kwargs()
+        return client.with_options(max_retries=0, **options) if options else client
+
+    def _create(self, messages, **kwargs):
+        try:
+            return self._with_deadline(self.client).chat.completions.create(model=self.version, messages=messages, **kwargs)
+        except RateLimitError as e:
+            self.rate_limiter.pause(self.provider, self.version, RateLimiter.parse_retry_after(e.response.headers))
+            raise
+
+    async def _create_async(self, messages, **kwargs):
+        try:
+            client = self._with_deadline(self._get_async_client())
+            return await client.chat.completions.create(model=self.version, messages=messages, **kwargs)
+        except RateLimitError as e:
+            self.rate_limiter.pause(self.provider, self.version, RateLimiter.parse_retry_after(e.response.headers))
+            raise
+
+    def _cache_key(self, messages):
+        if self.cache is None:
+            return None
+        return ResponseCache.make_key(self.version, messages, request_type='ask')
+
+    def _new_stream_state(self, messages):
+        return {'start': time.perf_counter(), 'first_token_time': None, 'parts': [], 'usage': None,
+                'reserved_tokens': self._reserved_tokens(messages), 'error': None}
+
+    def _stream_chunk(self, chunk, state):
+        if getattr(chunk, 'usage', None):
+            state['usage'] = chunk.usage
+        if chunk.choices:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if state['first_token_time'] is None:
+                    state['first_token_time'] = time.perf_counter()
+                state['parts'].append(delta)
+                return delta
+        return None
+
+    def _finish_stream(self, messages, key, state, completed):
+        answer = ''.join(state['parts'])
+        usage = state['usage']
+        if usage is not None:
+            prompt_tokens = usage.prompt_tokens
+            completion_tokens = usage.completion_tokens
+        else:
+            # 提前取消或服务端未返回 usage 时按文本估算
+            prompt_tokens = estimate_tokens(messages[-1]['content'])
+            completion_tokens = estimate_tokens(answer) if answer else 0
+        self._record_usage(state['reserved_tokens'], prompt_tokens + completion_tokens)
+        end = time.perf_counter()
+        self.stream_stats.append(stream_call_stats(state['start'], state['first_token_time'], end, completion_tokens))
+        error = None if completed else (state['error'] or 'cancelled')
+        self.metrics.record(self.provider, self.version, 'ask', end - state['start'], prompt_tokens, completion_tokens,
+                            self._request_bytes(messages), error=error)
+        if completed and key is not None and answer:
+            self.cache.put(key, answer)
+
+    def _ask_stream(self, messages, key):
+        state = self._new_stream_state(messages)
+        self.rate_limiter.acquire(self.provider, self.version, state['reserved_tokens'])
+        state['start'] = time.perf_counter()
+        completed = False
+        response = None
+        try:
+            response = self._create(
+                messages,
+                stream=True,
+                extra_body={"stream_options": {"include_usage": True}}
+            )
+            for chunk in response:
+                delta = self._stream_chunk(chunk, state)
+                if delta:
+                    yield delta
+            completed = True
+        except Exception as e:
+            state['error'] = e
+            raise
+        finally:
+            # 调用方关闭生成器时同时断开连接，不再为剩余输出付费
+            if response is not None:
+                response.response.close()
+            self._finish_stream(messages, key, state, completed)
+
+    def ask(self, prompt: str, stream: bool = False):
+        """
+        stream=True 时返回逐段产出内容增量的生成器，关闭生成器即取消本次生成。
+        """
+        self._check_service()
+
+        messages = [{"role": "user", "content": prompt}]
+        key = self._cache_key(messages)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return iter([cached]) if stream else cached
+
+        if stream:
+            return self._ask_stream(messages, key)
+
+        reserved_tokens = self._reserved_tokens(messages)
+        self.rate_limiter.acquire(self.provider, self.version, reserved_tokens)
+        with self.metrics.track(self.provider, self.version, 'ask') as call:
+            call.bytes_sent = self._request_bytes(messages)
+            response = self._create(messages)
+            answer = self._parse_response(response, reserved_tokens, call)
+
+        if key is not None and answer:
+            self.cache.put(key, answer)
+        return answer
+
+    async def ask_async(self, prompt: str) -> str:
+        self._check_service()
+
+        messages = [{"role": "user", "content": prompt}]
+        key = self._cache_key(messages)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        reserved_tokens = self._reserved_tokens(messages)
+        await self.rate_limiter.acquire_async(self.provider, self.version, reserved_tokens)
+        with self.metrics.track(self.provider, self.version, 'ask') as call:
+            call.bytes_sent = self._request_bytes(messages)
+            response = await self._create_async(messages)
+            answer = self._parse_response(response, reserved_tokens, call)
+
+        if key is not None and answer:
+            self.cache.put(key, answer)
+        return answer
+
+    async def ask_stream_async(self, prompt: str):
+        """
+        ask(stream=True) 的异步版本，是一个异步生成器。
+        """
+        self._check_service()
+
+        messages = [{"role": "user", "content": prompt}]
+        key = self._cache_key(messages)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        state = self._new_stream_state(messages)
+        await self.rate_limiter.acquire_async(self.provider, self.version, state['reserved_tokens'])
+        state['start'] = time.perf_counter()
+        completed = False
+        response = None
+        try:
+            response = await self._create_async(
+                messages,
+                stream=True,
+                extra_body={"stream_options": {"include_usage": True}}
+            )
+            async for chunk in response:
+                delta = self._stream_chunk(chunk, state)
+                if delta:
+                    yield delta
+            completed = True
+        except Exception as e:
+            state['error'] = e
+            raise
+        finally:
+            if response is not None:
+                await response.response.aclose()
+            self._finish_stream(messages, key, state, completed)
+
 class MultiLLM:
-    def __init__(self, model='deepseek-coder', vision_model='gpt-4o-mini', embed_model='text-embedding-3-large'):
+    def __init__(self, model='deepseek-coder', vision_model='gpt-4o-mini', embed_model='text-embedding-3-large', cache=None, embedding_store=None, rate_limiter=None, metrics=None, api_key=None, base_url='https://api.openai-next.com'):
         load_dotenv()
         self.model = model
+        self.provider = 'openai-next'
+        self.cache = cache
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.metrics = metrics or get_metrics()
+        self.total_tokens_used = 0
+        self._usage_lock = threading.Lock()
+        self.stream_stats = collections.deque(maxlen=STREAM_STATS_MAXLEN)
+        # 设置 EmbeddingStore 后，calculate_similarity 直接使用库中已有的向量
+        self.embedding_store = embedding_store
+        if embedding_store is not None and embedding_store.embedder is None:
+            embedding_store.embedder = self
         self.vision_model = vision_model
         self.embed_model = embed_model
-        self.api_key = os.getenv('MULTI_LLM_API', None)
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key or os.getenv('MULTI_LLM_API', None)
         if not self.api_key:
             raise ValueError("API key not found. Please set the MULTI_LLM_API environment variable.")
 
-    def ask(self, prompt):
-        url = "https://api.openai-next.com/v1/chat/completions"
+    def _ask_request(self, prompt):
+        url = f"{self.base_url}/v1/chat/completions"
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
@@ -73,11 +322,23 @@ class MultiLLM:
                 {"role": "user", "content": prompt}
             ]
         }
-        
+        return url, headers, data
+
+    def ask(self, prompt, stream=False):
+        """
+        stream=True 时返回逐段产出内容增量的生成器，关闭生成器即取消本次生成。
+        """
+        url, headers, data = self._ask_request(prompt)
+        if stream:
+            return self._make_stream_request(url, headers, data, prompt)
         return self._make_request(url, headers, data, 'ask')
 
-    def look(self, image_path, prompt="What's in this image?"):
-        url = "https://api.openai-next.com/v1/chat/completions"
+    async def ask_async(self, prompt):
+        url, headers, data = self._ask_request(prompt)
+        return await self._make_request_async(url, headers, data, 'ask')
+
+    def _look_request(self, image_path, prompt):
+        url = f"{self.base_url}/v1/chat/completions"
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
@@ -105,16 +366,23 @@ class MultiLLM:
                 }
             ],
         }
+        return url, headers, payload
 
+    def look(self, image_path, prompt="What's in this image?"):
+        url, headers, payload = self._look_request(image_path, prompt)
         return self._make_request(url, headers, payload, 'look')
 
+    async def look_async(self, image_path, prompt="What's in this image?"):
+        url, headers, payload = self._look_request(image_path, prompt)
+        return await self._make_request_async(url, headers, payload, 'look')
+
     @staticmethod
     def _encode_image(image_path):
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode('utf-8')
 
-    def embed_text(self, input_text):
-        url = "https://api.openai-next.com/v1/embeddings"
+    def _embed_request(self, input_text):
+        url = f"{self.base_url}/v1/embeddings"
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
@@ -124,57 +392,80 @@ class MultiLLM:
             "model": self.embed_model,
             "input": input_text
         }
-        
-        return self._make_request(url, headers, data, 'embed')
-
-    def embed_list(self, texts, num_threads=200):
-        def process_text(text):
-            embedding = self.embed_text(text)
-            return text, embedding
-
-        embeddings = {}
-        with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
-            future_to_text = {executor.submit(process_text, text): text for text in texts}
-            for future in tqdm(concurrent.futures.as_completed(future_to_text), total=len(texts), desc="Embedding texts"):
-                text = future_to_text[future]
-                try:
-                    _, embedding = future.result()
-                    embeddings[text] = embedding
-                except Exception as exc:
-                    embeddings[text] = None
-                    print(f'Text {text} generated an exception: {exc}')
-        
-        return embeddings
-    
-    def partition_by_similarity(self, embeddings_dict, threshold=0.8):
-        def cosine_similarity_matrix(matrix):
-            norm = np.linalg.norm(matrix, axis=1)
-            return np.dot(matrix, matrix.T) / np.outer(norm, norm)
+        return url, headers, data
 
-        keys = list(embeddings_dict.keys())
-        embeddings = np.array([embeddings_dict[key] for key in keys])
+    def embed_text(self, input_text):
+        url, headers, data = self._embed_request(input_text)
+        return self._make_request(url, headers, data, 'embed')
 
-        similarity_matrix = cosine_similarity_matrix(embeddings)
-        np.fill_diagonal(similarity_matrix, 0)
+    async def embed_async(self, input_text):
+        url, headers, data = self._embed_request(input_text)
+        return await self._make_request_async(url, headers, data, 'embed')
 
-        result = {}
-        valid_indices = set(range(len(keys)))
+    def embed_batch(self, input_texts):
+        url, headers, data = self._embed_request(list(input_texts))
+        return self._make_request(url, headers, data, 'embed_batch')
 
-        for i in range(len(keys)):
-            if i not in valid_indices:
-                continue
+    def embed_list(self, texts, num_threads=8, batch_size=256, max_batch_tokens=50000):
+        embeddings = {}
+        # 去重后按条数和估算 token 打包，每个批次一次请求
+        unique_texts = list(dict.fromkeys(texts))
+        if self.cache is not None:
+            missing_texts = []
+            for text in unique_texts:
+                cached = self.cache.get(self._embed_cache_key(text))
+                if cached is not None:
+                    embeddings[text] = cached
+                else:
+                    missing_texts.append(text)
+            unique_texts = missing_texts
+        batches = pack_batches(unique_texts, batch_size, max_batch_tokens)
 
-            similar_indices = np.where(similarity_matrix[i] >= threshold)[0]
-            similar_keys = [keys[j] for j in similar_indices if j in valid_indices]
+        def process_batch(batch):
+            return self.embed_batch([unique_texts[i] for i in batch])
 
-            for idx in similar_indices:
-                valid_indices.discard(idx)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor:
+            future_to_batch = {executor.submit(process_batch, batch): batch for batch in batches}
+            with tqdm(total=len(unique_texts), desc="Embedding texts") as pbar:
+                for future in concurrent.futures.as_completed(future_to_batch):
+                    batch = future_to_batch[future]
+                    try:
+                        batch_embeddings = future.result()
+                        # 返回条数不符时无法确定向量与文本的对应关系，整批按失败处理
+                        if len(batch_embeddings) != len(batch):
+                            raise ValueError(f"expected {len(batch)} embeddings, got {len(batch_embeddings)}")
+                        for i, embedding in zip(batch, batch_embeddings):
+                            embeddings[unique_texts[i]] = embedding
+                            if self.cache is not None:
+                                self.cache.put(self._embed_cache_key(unique_texts[i]), embedding)
+                    except Exception as exc:
+                        for i in batch:
+                            embeddings[unique_texts[i]] = None
+                        print(f'Batch of {len(batch)} texts starting with {unique_texts[batch[0]]} generated an exception: {exc}')
+                    pbar.update(len(batch))
 
-            result[keys[i]] = {'Similar_keys': similar_keys}
+        return embeddings
+    
+    def partition_by_similarity(self, embeddings_dict, threshold=0.8, memory_budget=DEFAULT_MEMORY_BUDGET, n_jobs=None,
+                                method='exact', nprobe=3, check_recall=False):
+        # 嵌入失败（值为 None）的词不参与合并
+        keys = [key for key, embedding in embeddings_dict.items() if embedding is not None]
+        if not keys:
+            return {}
+        embeddings = np.array([embeddings_dict[key] for key in keys], dtype=np.float32)
 
-        return result
+        if method == 'ann':
+            return ann_partition_by_similarity(keys, embeddings, threshold, nprobe=nprobe, n_jobs=n_jobs,
+                                               check_recall=check_recall)
+        elif method == 'exact':
+            return partition_by_similarity(keys, embeddings, threshold, memory_budget, n_jobs)
+        else:
+            raise ValueError(f"Unknown similarity method: {method}")
 
     def calculate_similarity(self, text1, text2):
+        if self.embedding_store is not None:
+            return float(self.embedding_store.pairwise([text1], [text2])[0, 0])
+
         embedding1 = self.embed_text(text1)
         embedding2 = self.embed_text(text2)
 
@@ -187,23 +478,249 @@ class MultiLLM:
         similarity = np.dot(embedding1, embedding2) / (np.linalg.norm(embedding1) * np.linalg.norm(embedding2))
         return similarity
 
+    def _parse_response(self, response_json, request_type):
+        if request_type == 'ask' or request_type == 'look':
+            if 'choices' in response_json and len(response_json['choices']) > 0:
+                return response_json['choices'][0]['message']['content']
+            else:
+                raise ValueError("No response content found in the API response.")
+        elif request_type == 'embed':
+            if 'data' in response_json and len(response_json['data']) > 0:
+                return response_json['data'][0]['embedding']
+            else:
+                raise ValueError("No embedding found in the API response.")
+        elif request_type == 'embed_batch':
+            if 'data' in response_json and len(response_json['data']) > 0:
+                # 按 index 字段映射回输入顺序
+                items = sorted(response_json['data'], key=lambda item: item.get('index', 0))
+                return [item['embedding'] for item in items]
+            else:
+                raise ValueError("No embedding found in the API response.")
+        else:
+            raise ValueError(f"Unknown request type: {request_type}")
+
+    def _cache_key(self, request_type, data):
+        # embed_batch 的结果由 embed_list 逐条缓存
+        if self.cache is None or request_type == 'embed_batch':
+            return None
+        return ResponseCache.make_key(data['model'], data.get('messages', data.get('input')), request_type=request_type)
+
+    def _embed_cache_key(self, text):
+        return self._cache_key('embed', {'model': self.embed_model, 'input': text})
+
+    @staticmethod
+    def _reserved_tokens(data):
+        if 'input' in data:
+            texts = data['input'] if isinstance(data['input'], list) else [data['input']]
+            return sum(estimate_tokens(text) for text in texts)
+        tokens = DEFAULT_COMPLETION_TOKENS
+        for message in data['messages']:
+            content = message['content']
+            if isinstance(content, str):
+                tokens += estimate_tokens(content)
+            else:
+                for part in content:
+                    tokens += estimate_tokens(part['text']) if part.get('type') == 'text' else IMAGE_TOKENS
+        return tokens
+
+    def _check_throttled(self, model, status_code, headers):
+        # 429 时按 Retry-After 暂停该模型的所有请求
+        if status_code == 429:
+            self.rate_limiter.pause(self.provider, model, RateLimiter.parse_retry_after(headers))
+
+    def _record_usage(self, model, reserved_tokens, usage, call=None):
+        usage = usage or {}
+        total_tokens = usage.get('total_tokens', 0)
+        with self._usage_lock:
+            self.total_tokens_used += total_tokens
+        self.rate_limiter.record_usage(self.provider, model, reserved_tokens, total_tokens)
+        if call is not None:
+            call.prompt_tokens = usage.get('prompt_tokens', total_tokens)
+            call.completion_tokens = usage.get('completion_tokens', 0)
+
+    @staticmethod
+    def _metric_method(request_type):
+        return 'embed' if request_type == 'embed_batch' else request_type
+
     def _make_request(self, url, headers, data, request_type):
+        key = self._cache_key(request_type, data)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        reserved_tokens = self._reserved_tokens(data)
+        self.rate_limiter.acquire(self.provider, data['model'], reserved_tokens)
+        body = json.dumps(data).encode('utf-8')
+        try:
+            # 在包装成 ValueError 之前按原始异常分类计数
+            with self.metrics.track(self.provider, data['model'], self._metric_method(request_type)) as call:
+                call.bytes_sent = len(body)
+                # 以流的方式读取响应体，读取过程中检查总截止时间
+                response = get_session().post(url, headers=headers, data=body, stream=True, **timeout_kwargs())
+                try:
+                    self._check_throttled(data['model'], response.status_code, response.headers)
+                    response.raise_for_status()
+                    response_json = json.loads(read_body(response))
+                finally:
+                    response.close()
+                result = self._parse_response(response_json, request_type)
+                self._record_usage(data['model'], reserved_tokens, response_json.get('usage'), call)
+        except requests.exceptions.RequestException as e:
+            raise ValueError(f"Error occurred during the API request: {e}")
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+
+    @staticmethod
+    def _parse_sse_line(line):
+        # 解析 OpenAI 兼容接口的一行 server-sent event，返回 (是否结束, chunk)
+        if not line or not line.startswith('data:'):
+            return False, None
+        payload = line[len('data:'):].strip()
+        if payload == '[DONE]':
+            return True, None
+        return False, json.loads(payload)
+
+    def _stream_chunk(self, chunk, state):
+        if chunk.get('usage'):
+            state['usage'] = chunk['usage']
+        choices = chunk.get('choices') or []
+        if choices:
+            delta = (choices[0].get('delta') or {}).get('content')
+            if delta:
+                if state['first_token_time'] is None:
+                    state['first_token_time'] = time.perf_counter()
+                state['parts'].append(delta)
+                return delta
+        return None
+
+    def _finish_stream(self, prompt, key, state, completed):
+        answer = ''.join(state['parts'])
+        usage = state['usage']
+        if usage:
+            completion_tokens = usage.get('completion_tokens', 0)
+        else:
+            completion_tokens = estimate_tokens(answer) if answer else 0
+            prompt_tokens = estimate_tokens(prompt)
+            usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                     'total_tokens': prompt_tokens + completion_tokens}
+        self._record_usage(self.model, state['reserved_tokens'], usage)
+        end = time.perf_counter()
+        self.stream_stats.append(stream_call_stats(state['start'], state['first_token_time'], end, completion_tokens))
+        error = None if completed else (state['error'] or 'cancelled')
+        self.metrics.record(self.provider, self.model, 'ask', end - state['start'], usage.get('prompt_tokens', 0),
+                            completion_tokens, state['bytes_sent'], error=error)
+        if completed and key is not None and answer:
+            self.cache.put(key, answer)
+
+    def _make_stream_request(self, url, headers, data, prompt):
+        key = self._cache_key('ask', data)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        data = dict(data, stream=True, stream_options={"include_usage": True})
+        reserved_tokens = self._reserved_tokens(data)
+        self.rate_limiter.acquire(self.provider, data['model'], reserved_tokens)
+        body = json.dumps(data).encode('utf-8')
+        state = {'start': time.perf_counter(), 'first_token_time': None, 'parts': [], 'usage': None,
+                 'reserved_tokens': reserved_tokens, 'bytes_sent': len(body), 'error': None}
+        completed = False
+        response = None
         try:
-            response = requests.post(url, headers=headers, json=data)
+            response = get_session().post(url, headers=headers, data=body, stream=True, **timeout_kwargs())
+            self._check_throttled(data['model'], response.status_code, response.headers)
             response.raise_for_status()
-            response_json = response.json()
-            
-            if request_type == 'ask' or request_type == 'look':
-                if 'choices' in response_json and len(response_json['choices']) > 0:
-                    return response_json['choices'][0]['message']['content']
-                else:
-                    raise ValueError("No response content found in the API response.")
-            elif request_type == 'embed':
-                if 'data' in response_json and len(response_json['data']) > 0:
-                    return response_json['data'][0]['embedding']
-                else:
-                    raise ValueError("No embedding found in the API response.")
-            else:
-                raise ValueError(f"Unknown request type: {request_type}")
         except requests.exceptions.RequestException as e:
+            # stream=True 的响应不读完也不关闭时连接不会归还连接池
+            if response is not None:
+                response.close()
+            self.metrics.record(self.provider, data['model'], 'ask', time.perf_counter() - state['start'],
+                                bytes_sent=len(body), error=e)
             raise ValueError(f"Error occurred during the API request: {e}")
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                check_deadline()
+                done, chunk = self._parse_sse_line(line)
+                if done:
+                    break
+                if chunk is not None:
+                    delta = self._stream_chunk(chunk, state)
+                    if delta:
+                        yield delta
+            completed = True
+        except Exception as e:
+            state['error'] = e
+            raise
+        finally:
+            response.close()
+            self._finish_stream(prompt, key, state, completed)
+
+    async def ask_stream_async(self, prompt):
+        """
+        ask(stream=True) 的异步版本，是一个异步生成器。
+        """
+        url, headers, data = self._ask_request(prompt)
+        key = self._cache_key('ask', data)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        data = dict(data, stream=True, stream_options={"include_usage": True})
+        reserved_tokens = self._reserved_tokens(data)
+        await self.rate_limiter.acquire_async(self.provider, data['model'], reserved_tokens)
+        body = json.dumps(data).encode('utf-8')
+        state = {'start': time.perf_counter(), 'first_token_time': None, 'parts': [], 'usage': None,
+                 'reserved_tokens': reserved_tokens, 'bytes_sent': len(body), 'error': None}
+        completed = False
+        try:
+            async with get_async_client().stream('POST', url, headers=headers, content=body, **httpx_timeout_kwargs()) as response:
+                self._check_throttled(data['model'], response.status_code, response.headers)
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    check_deadline()
+                    done, chunk = self._parse_sse_line(line)
+                    if done:
+                        break
+                    if chunk is not None:
+                        delta = self._stream_chunk(chunk, state)
+                        if delta:
+                            yield delta
+            completed = True
+        except httpx.HTTPError as e:
+            state['error'] = e
+            raise ValueError(f"Error occurred during the API request: {e}")
+        except Exception as e:
+            state['error'] = e
+            raise
+        finally:
+            self._finish_stream(prompt, key, state, completed)
+
+    async def _make_request_async(self, url, headers, data, request_type):
+        key = self._cache_key(request_type, data)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        reserved_tokens = self._reserved_tokens(data)
+        await self.rate_limiter.acquire_async(self.provider, data['model'], reserved_tokens)
+        body = json.dumps(data).encode('utf-8')
+        try:
+            with self.metrics.track(self.provider, data['model'], self._metric_method(request_type)) as call:
+                call.bytes_sent = len(body)
+                response = await within_deadline(get_async_client().post(url, headers=headers, content=body,
+                                                                         **httpx_timeout_kwargs()))
+                self._check_throttled(data['model'], response.status_code, response.headers)
+                response.raise_for_status()
+                response_json = response.json()
+                result = self._parse_response(response_json, request_type)
+                self._record_usage(data['model'], reserved_tokens, response_json.get('usage'), call)
+        except httpx.HTTPError as e:
+            raise ValueError(f"Error occurred during the API request: {e}")
+        if key is not None:
+            self.cache.put(key, result)
+        return result
@@ -0,0 +1,223 @@
+import json
+import time
+import bisect
+import threading
+import contextlib
+
+# 延迟直方图的桶上界（秒），与 Prometheus histogram 的 le 标签对应
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 8.0,
+                   15.0, 30.0, 60.0, 120.0, float('inf'))
+
+
+def classify_error(error):
+    """
+    把异常归类为 '429'、'5xx'、'4xx'、'timeout'、'connection'、'parse' 或 'other'。
+    包装异常（raise ... from e）本身归为 parse 或 other 时按其原因重新归类，例如包着 HTTP 429 的 ValueError 归为 '429'。
+    """
+    kind = _classify(error)
+    cause = error.__cause__ or error.__context__
+    if kind in ('parse', 'other') and cause is not None and cause is not error:
+        inner = classify_error(cause)
+        if inner not in ('parse', 'other'):
+            return inner
+    return kind
+
+
+def _classify(error):
+    status_code = getattr(error, 'status_code', None)
+    if status_code is None:
+        status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+    if isinstance(status_code, int):
+        if status_code == 429:
+            return '429'
+        if status_code >= 500:
+            return '5xx'
+        if status_code >= 400:
+            return '4xx'
+    if 'Throttling' in str(error):
+        return '429'
+    name = type(error).__name__
+    if 'Timeout' in name:
+        return 'timeout'
+    if 'Connection' in name or 'Connect' in name:
+        return 'connection'
+    if isinstance(error, (ValueError, KeyError, IndexError, TypeError, json.JSONDecodeError)):
+        return 'parse'
+    return 'other'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        按桶内线性插值估算分位数。
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if cumulative + count >= rank and count > 0:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i]
+                if upper == float('inf'):
+                    return lower
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-2]
+
+
+class CallRecord:
+    """
+    一次调用的记录，由 MetricsRegistry.track 创建，调用方在返回前填入 token 和字节数。
+    """
+
+    def __init__(self):
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.bytes_sent = 0
+
+
+class SeriesMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.errors = {}
+        self.latency = Histogram()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.bytes_sent = 0
+
+    def snapshot(self):
+        return {
+            'requests': self.requests,
+            'errors': dict(self.errors),
+            'latency_p50': self.latency.quantile(0.50),
+            'latency_p95': self.latency.quantile(0.95),
+            'latency_p99': self.latency.quantile(0.99),
+            'latency_sum': self.latency.sum,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'bytes_sent': self.bytes_sent,
+        }
+
+
+class MetricsRegistry:
+    """
+    线程安全的 LLM 调用指标表，按 (provider, model, method) 分别统计请求数、延迟直方图、
+    输入/输出 token、发送字节数以及按类别计数的错误。
+    """
+
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _get(self, provider, model, method):
+        key = (provider, model, method)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = SeriesMetrics()
+        return series
+
+    def record(self, provider, model, method, latency, prompt_tokens=0, completion_tokens=0, bytes_sent=0, error=None):
+        with self._lock:
+            series = self._get(provider, model, method)
+            series.requests += 1
+            series.latency.observe(latency)
+            series.prompt_tokens += prompt_tokens
+            series.completion_tokens += completion_tokens
+            series.bytes_sent += bytes_sent
+            if error is not None:
+                error_class = error if isinstance(error, str) else classify_error(error)
+                series.errors[error_class] = series.errors.get(error_class, 0) + 1
+
+    def record_error(self, provider, model, method, error_class):
+        """
+        记录一次不对应独立请求的错误，例如 MultiProcessor 中解析失败的回答。
+        """
+        with self._lock:
+            series = self._get(provider, model, method)
+            series.errors[error_class] = series.errors.get(error_class, 0) + 1
+
+    @contextlib.contextmanager
+    def track(self, provider, model, method):
+        """
+        计时并记录一次调用，调用体抛出的异常会按类别计数后原样抛出。
+        """
+        record = CallRecord()
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            self.record(provider, model, method, time.perf_counter() - start,
+                        record.prompt_tokens, record.completion_tokens, record.bytes_sent,
+                        error=e if isinstance(e, Exception) else 'cancelled')
+            raise
+        self.record(provider, model, method, time.perf_counter() - start,
+                    record.prompt_tokens, record.completion_tokens, record.bytes_sent)
+
+    def snapshot(self):
+        """
+        返回 {"provider/model": {method: {...}}} 形式的指标字典。
+        """
+        with self._lock:
+            result = {}
+            for (provider, model, method), series in self._series.items():
+                result.setdefault(f'{provider}/{model}', {})[method] = series.snapshot()
+            return result
+
+    def to_prometheus(self):
+        """
+        导出 Prometheus 文本格式。
+        """
+        lines = [
+            '# TYPE llm_requests_total counter',
+            '# TYPE llm_errors_total counter',
+            '# TYPE llm_tokens_total counter',
+            '# TYPE llm_bytes_sent_total counter',
+            '# TYPE llm_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            for (provider, model, method), series in sorted(self._series.items()):
+                labels = f'provider="{escape_label(provider)}",model="{escape_label(model)}",method="{escape_label(method)}"'
+                lines.append(f'llm_requests_total{{{labels}}} {series.requests}')
+                for error_class, count in sorted(series.errors.items()):
+                    lines.append(f'llm_errors_total{{{labels},class="{error_class}"}} {count}')
+                lines.append(f'llm_tokens_total{{{labels},type="prompt"}} {series.prompt_tokens}')
+                lines.append(f'llm_tokens_total{{{labels},type="completion"}} {series.completion_tokens}')
+                lines.append(f'llm_bytes_sent_total{{{labels}}} {series.bytes_sent}')
+                cumulative = 0
+                for bound, count in zip(series.latency.buckets, series.latency.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'llm_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f'llm_request_duration_seconds_sum{{{labels}}} {series.latency.sum}')
+                lines.append(f'llm_request_duration_seconds_count{{{labels}}} {series.latency.count}')
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+_metrics = MetricsRegistry()
+
+
+def get_metrics():
+    """
+    返回进程内共享的 MetricsRegistry。
+    """
+    return _metrics
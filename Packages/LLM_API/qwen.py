@@ -0,0 +1,54 @@
+import os
+import json
+import threading
+from dotenv import load_dotenv
+from .tokens import estimate_tokens
+from .rate_limiter import RateLimiter, get_rate_limiter, DEFAULT_COMPLETION_TOKENS
+from .metrics import get_metrics
+
+
+class QwenLLM:
+    """
+    通过 dashscope 调用通义千问，提供与 LLM 相同的 ask 接口，便于放进 LLMRouter 的客户端池。
+    """
+
+    def __init__(self, model='qwen-long', api_key=None, rate_limiter=None, metrics=None):
+        load_dotenv()
+        # dashscope 只在使用千问时需要
+        import dashscope
+        self.model = model
+        self.provider = 'dashscope'
+        self.total_tokens_used = 0
+        self._usage_lock = threading.Lock()
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self.metrics = metrics or get_metrics()
+        self.api_key = api_key or os.getenv('QWEN_API', None)
+        if not self.api_key:
+            raise ValueError("API密钥未在环境变量中设置")
+        dashscope.api_key = self.api_key
+        self.client = dashscope.Generation()
+
+    def ask(self, prompt):
+        messages = [{"role": "user", "content": prompt}]
+        reserved_tokens = estimate_tokens(prompt) + DEFAULT_COMPLETION_TOKENS
+        self.rate_limiter.acquire(self.provider, self.model, reserved_tokens)
+
+        with self.metrics.track(self.provider, self.model, 'ask') as call:
+            call.bytes_sent = len(json.dumps(messages, ensure_ascii=False).encode('utf-8'))
+            response = self.client.call(model=self.model, messages=messages, result_format="message")
+
+            if response['status_code'] == 429:
+                self.rate_limiter.pause(self.provider, self.model, RateLimiter.parse_retry_after(response.get('headers')))
+            if response['status_code'] != 200:
+                error = ValueError(f"Error occurred during the API request: {response['status_code']} {response.get('code')} {response.get('message')}")
+                error.status_code = response['status_code']
+                raise error
+
+            usage = response['usage']
+            call.prompt_tokens = usage['input_tokens']
+            call.completion_tokens = usage['output_tokens']
+            total_tokens = usage['input_tokens'] + usage['output_tokens']
+            with self._usage_lock:
+                self.total_tokens_used += total_tokens
+            self.rate_limiter.record_usage(self.provider, self.model, reserved_tokens, total_tokens)
+            return response['output']['choices'][0]['message']['content']
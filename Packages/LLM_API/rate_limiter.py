@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+
+DEFAULT_COMPLETION_TOKENS = 256  # 请求发出前无法知道输出长度，按该值预留 TPM
+DEFAULT_RETRY_AFTER = 1.0
+
+
+class TokenBucket:
+    """
+    按分钟配额匀速补充的令牌桶。允许余额为负（预约），调用方按返回的等待时间排队，
+    这样并发线程会被错开，而不是同时醒来一起冲向服务端。
+
+    参数:
+    per_minute (float): 每分钟配额。
+    burst (float): 桶容量，None 表示 1 秒的配额（至少 1），保证任意一分钟窗口内不超过配额太多。
+    """
+
+    def __init__(self, per_minute, burst=None):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        self._refill(now)
+        self.tokens -= amount
+        return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, amount, now):
+        # amount > 0 退还多预留的令牌，amount < 0 补扣实际多用的令牌
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    进程内共享的 RPM + TPM 限流器，按 (provider, model) 分别计数。未配置的 key 不限流。
+    """
+
+    def __init__(self):
+        self.limits = {}
+        self._buckets = {}
+        self._blocked_until = {}
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.total_wait_time = 0.0
+
+    @staticmethod
+    def make_key(provider, model):
+        return f'{provider}/{model}'
+
+    def configure(self, provider, model, rpm=None, tpm=None, burst_seconds=None):
+        """
+        设置某个 provider/model 的每分钟请求数和每分钟 token 数上限，None 表示不限制。
+        burst_seconds 为允许的突发量（按秒计的配额），None 表示 1 秒。
+        """
+        key = self.make_key(provider, model)
+        with self._lock:
+            self.limits[key] = {'rpm': rpm, 'tpm': tpm, 'burst_seconds': burst_seconds}
+            self._buckets[key] = (
+                TokenBucket(rpm, rpm / 60.0 * burst_seconds if burst_seconds else None) if rpm else None,
+                TokenBucket(tpm, tpm / 60.0 * burst_seconds if burst_seconds else None) if tpm else None,
+            )
+
+    def load_profile(self, path):
+        """
+        从 JSON 文件加载限额，格式为 {"provider/model": {"rpm": 600, "tpm": 1000000}, ...}，
+        可由 save_profile 或 QwenRater.calibrate 生成。
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+        for key, limit in profile.items():
+            provider, model = key.split('/', 1)
+            self.configure(provider, model, limit.get('rpm'), limit.get('tpm'), limit.get('burst_seconds'))
+
+    def save_profile(self, path):
+        with self._lock:
+            profile = dict(self.limits)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(profile, f, ensure_ascii=False, indent=4)
+
+    def _reserve(self, provider, model, tokens):
+        key = self.make_key(provider, model)
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._blocked_until.get(key, 0.0) - now)
+            buckets = self._buckets.get(key)
+            if buckets is not None:
+                request_bucket, token_bucket = buckets
+                if request_bucket is not None:
+                    wait = max(wait, request_bucket.reserve(1, now))
+                if token_bucket is not None:
+                    wait = max(wait, token_bucket.reserve(tokens, now))
+            if wait > 0:
+                self.waits += 1
+                self.total_wait_time += wait
+            return wait
+
+    def estimated_wait(self, provider, model, tokens=0):
+        """
+        不预约配额，只估算现在发送一个请求需要等待的秒数，供路由器比较各 provider 的剩余额度。
+        """
+        key = self.make_key(provider, model)
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._blocked_until.get(key, 0.0) - now)
+            buckets = self._buckets.get(key)
+            if buckets is not None:
+                for bucket, amount in zip(buckets, (1, tokens)):
+                    if bucket is not None:
+                        bucket._refill(now)
+                        wait = max(wait, (amount - bucket.tokens) / bucket.rate)
+            return max(0.0, wait)
+
+    def acquire(self, provider, model, tokens=0):
+        """
+        发送请求前调用，阻塞到 RPM、TPM 和 Retry-After 都允许为止。返回等待的秒数。
+        """
+        wait = self._reserve(provider, model, tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, provider, model, tokens=0):
+        wait = self._reserve(provider, model, tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def record_usage(self, provider, model, reserved_tokens, actual_tokens):
+        """
+        收到响应后用实际 token 数校正 TPM 预留。
+        """
+        key = self.make_key(provider, model)
+        with self._lock:
+            buckets = self._buckets.get(key)
+            if buckets is not None and buckets[1] is not None:
+                buckets[1].adjust(reserved_tokens - actual_tokens, time.monotonic())
+
+    def pause(self, provider, model, seconds):
+        """
+        收到 429 后让该 provider/model 的所有请求暂停 seconds 秒。
+        """
+        key = self.make_key(provider, model)
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._blocked_until[key] = max(self._blocked_until.get(key, 0.0), until)
+
+    @staticmethod
+    def parse_retry_after(headers, default=DEFAULT_RETRY_AFTER):
+        """
+        解析 Retry-After（秒数或 HTTP 日期）以及 retry-after-ms 响应头，缺失时返回 default。
+        """
+        if not headers:
+            return default
+        value = headers.get('retry-after-ms')
+        if value:
+            try:
+                return float(value) / 1000.0
+            except ValueError:
+                pass
+        value = headers.get('retry-after')
+        if not value:
+            return default
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return default
+
+    def stats(self):
+        with self._lock:
+            return {
+                'limits': dict(self.limits),
+                'waits': self.waits,
+                'total_wait_time': self.total_wait_time,
+            }
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    返回进程内共享的 RateLimiter。设置了环境变量 RATE_LIMIT_PROFILE 时自动加载该限额文件。
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                limiter = RateLimiter()
+                profile_path = os.getenv('RATE_LIMIT_PROFILE')
+                if profile_path and os.path.exists(profile_path):
+                    limiter.load_profile(profile_path)
+                _rate_limiter = limiter
+    return _rate_limiter
@@ -0,0 +1,219 @@
+import time
+import random
+import asyncio
+import threading
+import collections
+
+from .tokens import estimate_tokens
+from .rate_limiter import get_rate_limiter, DEFAULT_COMPLETION_TOKENS
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+def client_name(client):
+    """
+    返回客户端的 "provider/model" 名称，LLM 用 version，MultiLLM / QwenLLM 用 model。
+    """
+    provider = getattr(client, 'provider', type(client).__name__)
+    model = getattr(client, 'version', None) or getattr(client, 'model', None)
+    return f'{provider}/{model}'
+
+
+class ProviderState:
+    """
+    单个客户端的滚动统计与熔断状态。
+
+    参数:
+    client: 提供 ask(prompt) 的客户端。
+    cost (float): 每千 token 的价格，用于路由打分。
+    window (int): 统计最近多少次调用。
+    prior_latency (float): 还没有样本时使用的延迟，默认为 0，保证新客户端会先被试探。
+    """
+
+    def __init__(self, client, cost=0.0, window=50, prior_latency=0.0):
+        self.client = client
+        self.name = client_name(client)
+        self.cost = cost
+        self.latencies = collections.deque(maxlen=window)
+        self.outcomes = collections.deque(maxlen=window)
+        self.prior_latency = prior_latency
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.in_flight = 0
+        self.trial_in_flight = False
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def latency(self):
+        return sum(self.latencies) / len(self.latencies) if self.latencies else self.prior_latency
+
+    @property
+    def error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def snapshot(self):
+        return {
+            'state': self.state,
+            'latency': self.latency,
+            'error_rate': self.error_rate,
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'failures': self.failures,
+        }
+
+
+class LLMRouter:
+    """
+    在多个 LLM 客户端之间路由请求，对外提供同样的 ask 接口，可直接作为 MultiProcessor 的 llm 使用。
+    按滚动平均延迟、错误率、限流器剩余额度和 token 价格为每个客户端打分，分数越低越容易被选中；
+    连续失败的客户端会被熔断一段时间，请求失败时自动切换到下一个客户端。
+
+    参数:
+    clients (list): 客户端列表，元素为客户端对象或 (客户端, 每千 token 价格) 元组。
+    strategy (str): 'weighted' 按分数倒数加权随机选择，把流量分散到健康的客户端；'best' 总是选分数最低的。
+    failure_threshold (int): 连续失败多少次后熔断。
+    error_rate_threshold (float): 窗口内错误率超过该值（且样本数不少于 min_samples）时熔断。
+    cooldown (float): 熔断持续秒数，之后放行一个试探请求（半开）。
+    cost_weight (float): 价格在打分中的权重（秒 / 每千 token 价格）。
+    error_penalty (float): 错误率在打分中的放大系数。
+    """
+
+    def __init__(self, clients, strategy='weighted', failure_threshold=3, error_rate_threshold=0.5, min_samples=10,
+                 cooldown=30.0, cost_weight=1.0, error_penalty=4.0, window=50, rate_limiter=None):
+        self.providers = []
+        for entry in clients:
+            client, cost = entry if isinstance(entry, tuple) else (entry, 0.0)
+            self.providers.append(ProviderState(client, cost, window))
+        if not self.providers:
+            raise ValueError("LLMRouter 至少需要一个客户端。")
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.cost_weight = cost_weight
+        self.error_penalty = error_penalty
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        self._lock = threading.Lock()
+
+    @property
+    def total_tokens_used(self):
+        return sum(getattr(p.client, 'total_tokens_used', 0) for p in self.providers)
+
+    def _available(self, provider, now):
+        if provider.state == OPEN and now >= provider.open_until:
+            provider.state = HALF_OPEN
+            provider.trial_in_flight = False
+        if provider.state == OPEN:
+            return False
+        if provider.state == HALF_OPEN:
+            return not provider.trial_in_flight
+        return True
+
+    def _score(self, provider, tokens):
+        provider_name, model = provider.name.split('/', 1)
+        wait = self.rate_limiter.estimated_wait(provider_name, model, tokens)
+        # 在途请求越多，预期排队越久
+        latency = provider.latency * (1 + 0.1 * provider.in_flight)
+        return (latency + wait) * (1 + self.error_penalty * provider.error_rate) + self.cost_weight * provider.cost * tokens / 1000
+
+    def _select(self, tokens, exclude):
+        with self._lock:
+            now = time.monotonic()
+            candidates = [p for p in self.providers if p not in exclude and self._available(p, now)]
+            if not candidates:
+                # 全部熔断时退而求其次，选最早恢复的客户端
+                candidates = sorted((p for p in self.providers if p not in exclude), key=lambda p: p.open_until)[:1]
+                if not candidates:
+                    return None
+            scores = [self._score(p, tokens) for p in candidates]
+            if self.strategy == 'best' or len(candidates) == 1:
+                chosen = candidates[scores.index(min(scores))]
+            else:
+                weights = [1.0 / max(score, 1e-6) for score in scores]
+                chosen = random.choices(candidates, weights=weights)[0]
+            if chosen.state == HALF_OPEN:
+                chosen.trial_in_flight = True
+            chosen.in_flight += 1
+            chosen.requests += 1
+            return chosen
+
+    def _record(self, provider, latency, success):
+        with self._lock:
+            provider.in_flight -= 1
+            provider.outcomes.append(success)
+            if success:
+                provider.latencies.append(latency)
+                provider.consecutive_failures = 0
+                provider.state = CLOSED
+                return
+            provider.failures += 1
+            provider.consecutive_failures += 1
+            tripped = (provider.state == HALF_OPEN
+                       or provider.consecutive_failures >= self.failure_threshold
+                       or (len(provider.outcomes) >= self.min_samples and provider.error_rate >= self.error_rate_threshold))
+            if tripped:
+                provider.state = OPEN
+                provider.open_until = time.monotonic() + self.cooldown
+                print(f"Circuit opened for {provider.name} for {self.cooldown} seconds.")
+
+    def select(self, prompt, exclude=()):
+        """
+        为 prompt 选择一个客户端并登记为在途请求，调用结束后必须调用 report。
+        """
+        return self._select(estimate_tokens(prompt) + DEFAULT_COMPLETION_TOKENS, exclude)
+
+    def report(self, provider, latency, success):
+        self._record(provider, latency, success)
+
+    def ask(self, prompt):
+        tried = []
+        last_error = None
+        while True:
+            provider = self.select(prompt, tried)
+            if provider is None:
+                break
+            tried.append(provider)
+            start = time.perf_counter()
+            try:
+                answer = provider.client.ask(prompt)
+            except Exception as e:
+                self.report(provider, time.perf_counter() - start, False)
+                last_error = e
+                print(f"Provider {provider.name} failed: {e}. Failing over.")
+                continue
+            self.report(provider, time.perf_counter() - start, True)
+            return answer
+        raise RuntimeError(f"所有 LLM 客户端均请求失败，最后的错误：{last_error}")
+
+    async def ask_async(self, prompt):
+        tried = []
+        last_error = None
+        while True:
+            provider = self.select(prompt, tried)
+            if provider is None:
+                break
+            tried.append(provider)
+            start = time.perf_counter()
+            try:
+                if hasattr(provider.client, 'ask_async'):
+                    answer = await provider.client.ask_async(prompt)
+                else:
+                    # 没有异步接口的客户端（如 QwenLLM）放到线程里执行
+                    answer = await asyncio.to_thread(provider.client.ask, prompt)
+            except Exception as e:
+                self.report(provider, time.perf_counter() - start, False)
+                last_error = e
+                print(f"Provider {provider.name} failed: {e}. Failing over.")
+                continue
+            self.report(provider, time.perf_counter() - start, True)
+            return answer
+        raise RuntimeError(f"所有 LLM 客户端均请求失败，最后的错误：{last_error}")
+
+    def stats(self):
+        with self._lock:
+            return {p.name: p.snapshot() for p in self.providers}
@@ -0,0 +1,186 @@
+import os
+import threading
+import concurrent.futures
+import numpy as np
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024  # 相似度分块计算的内存上限（字节）
+MAX_ROW_BLOCK = 1024
+
+
+def normalize_rows(matrix):
+    """
+    把向量矩阵转换为 float32 并按行归一化，零向量保持为零。
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def tile_shape(n, memory_budget, n_jobs=1):
+    """
+    根据内存预算计算分块大小 (行块, 列块)。每个并行任务持有一个 float32 相似度块和同样形状的布尔掩码。
+    """
+    cells = max(memory_budget // (5 * max(n_jobs, 1)), 1)
+    row_block = max(1, min(n, MAX_ROW_BLOCK))
+    col_block = max(1, min(n, cells // row_block))
+    return row_block, col_block
+
+
+def block_neighbours(normed, rows, threshold, col_block, executor=None):
+    """
+    计算 rows 中每一行与全部行的相似度（按列分块），返回每行相似度 >= threshold 的列下标（升序，不含自身）。
+    """
+    n = normed.shape[0]
+    row_vectors = normed[rows]
+
+    def scan(c0):
+        c1 = min(c0 + col_block, n)
+        tile = row_vectors @ normed[c0:c1].T
+        # 与原实现一致：对角线置 0
+        inside = (rows >= c0) & (rows < c1)
+        tile[np.nonzero(inside)[0], rows[inside] - c0] = 0
+        r, c = np.nonzero(tile >= threshold)
+        return r, c + c0
+
+    starts = range(0, n, col_block)
+    parts = list(executor.map(scan, starts)) if executor is not None else [scan(c0) for c0 in starts]
+
+    r = np.concatenate([p[0] for p in parts])
+    c = np.concatenate([p[1] for p in parts])
+    # 稳定排序保证每行内列下标仍然升序
+    order = np.argsort(r, kind='stable')
+    r, c = r[order], c[order]
+    bounds = np.searchsorted(r, np.arange(len(rows) + 1))
+    return [c[bounds[k]:bounds[k + 1]] for k in range(len(rows))]
+
+
+def partition_by_similarity(keys, matrix, threshold=0.8, memory_budget=DEFAULT_MEMORY_BUDGET, n_jobs=None):
+    """
+    分块计算余弦相似度并贪心合并相似词，结果与原来的稠密矩阵实现一致，但内存占用受 memory_budget 限制。
+
+    参数:
+    keys (list of str): 词列表。
+    matrix (array-like): 与 keys 对应的向量矩阵，形状 (n, dim)。
+    threshold (float): 相似度阈值。
+    memory_budget (int): 相似度分块的内存上限（字节）。
+    n_jobs (int): 并行计算列块的线程数，None 表示使用全部 CPU 核。
+
+    返回:
+    dict: {主词: {'Similar_keys': [相似词, ...]}}。
+    """
+    n = len(keys)
+    result = {}
+    if n == 0:
+        return result
+
+    normed = normalize_rows(matrix)
+    n_jobs = n_jobs or os.cpu_count() or 1
+    row_block, col_block = tile_shape(n, memory_budget, n_jobs)
+    valid = np.ones(n, dtype=bool)
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=n_jobs) if n_jobs > 1 else None
+    try:
+        for r0 in range(0, n, row_block):
+            rows = np.arange(r0, min(r0 + row_block, n))
+            # 块开始前已被合并的行不会成为主词，不必计算
+            rows = rows[valid[rows]]
+            if rows.size == 0:
+                continue
+
+            neighbours = block_neighbours(normed, rows, threshold, col_block, executor)
+            greedy_merge(keys, rows, neighbours, valid, result)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return result
+
+
+def greedy_merge(keys, rows, neighbours, valid, result):
+    """
+    按行号顺序贪心合并：仍有效的行成为主词，它的相似词随即失效。结果写入 result。
+    """
+    for i, similar_indices in zip(rows, neighbours):
+        if not valid[i]:
+            continue
+        similar_keys = [keys[j] for j in similar_indices[valid[similar_indices]]]
+        valid[similar_indices] = False
+        result[keys[i]] = {'Similar_keys': similar_keys}
+
+
+class IncrementalPartition:
+    """
+    增量合并相似词：词按到达顺序依次与已有主词比较，归入第一个相似度 >= threshold 的主词，否则自己成为主词。
+    按到达顺序排列 keys 时，结果与 partition_by_similarity 的贪心合并一致，但已归类的词不会再改变主词，
+    因此可以在流水线中边嵌入边输出。
+
+    参数:
+    threshold (float): 相似度阈值。
+    """
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self.main_words = {}
+        self.leaders = []
+        self._vectors = None
+        self._lock = threading.Lock()
+
+    def add(self, keys, matrix):
+        """
+        加入一批词及其向量，返回每个词的主词。向量为 None 的词不参与合并，主词为自身。
+        """
+        with self._lock:
+            results = [None] * len(keys)
+            rows, new_keys = [], []
+            for k, key in enumerate(keys):
+                if key in self.main_words:
+                    results[k] = self.main_words[key]
+                elif matrix[k] is None:
+                    results[k] = key
+                else:
+                    rows.append(k)
+                    new_keys.append(key)
+            if not rows:
+                return results
+
+            batch = normalize_rows([matrix[k] for k in rows])
+            to_old = batch @ self._vectors.T if self._vectors is not None else None
+            within = batch @ batch.T
+            new_leaders = []
+            for position, (k, key) in enumerate(zip(rows, new_keys)):
+                if key in self.main_words:
+                    # 同一批中重复出现的词
+                    results[k] = self.main_words[key]
+                    continue
+                main_word = None
+                if to_old is not None:
+                    hits = np.nonzero(to_old[position] >= self.threshold)[0]
+                    if hits.size:
+                        main_word = self.leaders[hits[0]]
+                if main_word is None:
+                    for leader in new_leaders:
+                        if within[position, leader] >= self.threshold:
+                            main_word = new_keys[leader]
+                            break
+                if main_word is None:
+                    new_leaders.append(position)
+                    main_word = key
+                self.main_words[key] = main_word
+                results[k] = main_word
+
+            if new_leaders:
+                self.leaders.extend(new_keys[i] for i in new_leaders)
+                added = batch[new_leaders]
+                self._vectors = added if self._vectors is None else np.vstack([self._vectors, added])
+            return results
+
+    def synonyms(self):
+        """
+        返回与 partition_by_similarity 相同格式的结果：{主词: {'Similar_keys': [相似词, ...]}}。
+        """
+        with self._lock:
+            result = {leader: {'Similar_keys': []} for leader in self.leaders}
+            for key, main_word in self.main_words.items():
+                if key != main_word:
+                    result[main_word]['Similar_keys'].append(key)
+            return result
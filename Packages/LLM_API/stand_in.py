@@ -0,0 +1,232 @@
+import json
+import time
+import random
+import hashlib
+import threading
+import numpy as np
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from .tokens import estimate_tokens
+
+
+class StandInServer:
+    """
+    本地 OpenAI 兼容替身服务，实现 /v1/chat/completions（含流式）和 /v1/embeddings，
+    用于在没有 API 密钥或离线环境下对 MultiProcessor、Memory、embed_list、Retriever 等流程做性能测试。
+    相同的 seed 和请求序列得到相同的回答、向量和注入错误。
+
+    用法:
+    with StandInServer(latency=0.2) as server:
+        llm = MultiLLM(base_url=server.base_url)
+
+    参数:
+    latency (float): 每次请求延迟的中位数（秒）。
+    latency_sigma (float): 延迟的对数正态分布标准差，0 表示固定延迟。
+    per_token_latency (float): 每个输出 token 追加的延迟（秒），流式请求按 token 间隔发送。
+    completion_tokens (int): 未设置 answers 时生成的回答长度。
+    rate_429 (float): 随机返回 429 的比例。
+    rate_5xx (float): 随机返回 503 的比例。
+    retry_after (float): 429 响应的 Retry-After 秒数。
+    answers: 脚本化回答，可以是 callable(prompt) -> str、{子串: 回答} 字典或按顺序循环使用的列表。
+    embed_dim (int): 返回向量的维度，向量由文本哈希确定。
+    host, port: 监听地址，port=0 表示自动选择空闲端口。
+    """
+
+    def __init__(self, latency=0.1, latency_sigma=0.0, per_token_latency=0.0, completion_tokens=64, rate_429=0.0,
+                 rate_5xx=0.0, retry_after=0.05, answers=None, embed_dim=256, seed=0, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.per_token_latency = per_token_latency
+        self.completion_tokens = completion_tokens
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self.answers = answers
+        self.embed_dim = embed_dim
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.throttled = 0
+        self.server_errors = 0
+        self._random = random.Random(seed)
+        self._answer_index = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f'http://{self.host}:{self.port}'
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # 响应头和响应体分两次写出，不关闭 Nagle 时 keep-alive 连接上每个请求会多等一个延迟 ACK（约 40ms）
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                try:
+                    server._handle(self)
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端超时或取消后已关闭连接
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            # 默认的 listen 队列只有 5，高并发时连接会因 SYN 重传多等 1 秒
+            request_queue_size = 1024
+
+        self._server = Server((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            return {'requests': self.requests, 'throttled': self.throttled, 'server_errors': self.server_errors}
+
+    def _draw(self):
+        # 在锁内按请求顺序抽取延迟和错误，保证同一 seed 下结果可复现
+        with self._lock:
+            self.requests += 1
+            roll = self._random.random()
+            delay = self.latency
+            if self.latency_sigma > 0:
+                delay *= self._random.lognormvariate(0.0, self.latency_sigma)
+            if roll < self.rate_429:
+                self.throttled += 1
+                return delay, 429
+            if roll < self.rate_429 + self.rate_5xx:
+                self.server_errors += 1
+                return delay, 503
+            return delay, 200
+
+    def answer(self, prompt):
+        if callable(self.answers):
+            return self.answers(prompt)
+        if isinstance(self.answers, dict):
+            for pattern, answer in self.answers.items():
+                if pattern in prompt:
+                    return answer
+        elif self.answers:
+            with self._lock:
+                answer = self.answers[self._answer_index % len(self.answers)]
+                self._answer_index += 1
+            return answer
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        return ' '.join(digest[i % 60:i % 60 + 4] for i in range(self.completion_tokens))
+
+    def embedding(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+        vector = np.random.default_rng(seed).normal(size=self.embed_dim)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def _handle(self, handler):
+        length = int(handler.headers.get('Content-Length', 0))
+        try:
+            request = json.loads(handler.rfile.read(length) or b'{}')
+        except json.JSONDecodeError:
+            return self._send_json(handler, 400, {'error': {'message': 'invalid json'}})
+
+        delay, status = self._draw()
+        time.sleep(delay)
+        if status == 429:
+            return self._send_json(handler, 429, {'error': {'message': 'rate limited', 'code': 'rate_limit_exceeded'}},
+                                   {'Retry-After': str(self.retry_after)})
+        if status != 200:
+            return self._send_json(handler, status, {'error': {'message': 'service unavailable'}})
+
+        path = handler.path.rstrip('/')
+        if path.endswith('/chat/completions'):
+            self._chat(handler, request)
+        elif path.endswith('/embeddings'):
+            self._embeddings(handler, request)
+        else:
+            self._send_json(handler, 404, {'error': {'message': f'unknown path {handler.path}'}})
+
+    def _chat(self, handler, request):
+        prompt = ''
+        for message in request.get('messages', []):
+            content = message.get('content')
+            if isinstance(content, str):
+                prompt += content
+            else:
+                prompt += ''.join(part.get('text', '') for part in content or [])
+        answer = self.answer(prompt)
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(answer)
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                 'total_tokens': prompt_tokens + completion_tokens}
+        model = request.get('model', 'stand-in')
+
+        if not request.get('stream'):
+            time.sleep(self.per_token_latency * completion_tokens)
+            return self._send_json(handler, 200, {
+                'id': 'chatcmpl-stand-in',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': answer}, 'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.send_header('Connection', 'close')
+        handler.end_headers()
+        handler.close_connection = True
+        pieces = answer.split(' ')
+        for i, piece in enumerate(pieces):
+            time.sleep(self.per_token_latency)
+            delta = piece if i == 0 else ' ' + piece
+            chunk = {'id': 'chatcmpl-stand-in', 'object': 'chat.completion.chunk', 'model': model,
+                     'choices': [{'index': 0, 'delta': {'content': delta}, 'finish_reason': None}]}
+            handler.wfile.write(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'.encode('utf-8'))
+            handler.wfile.flush()
+        if (request.get('stream_options') or {}).get('include_usage'):
+            chunk = {'id': 'chatcmpl-stand-in', 'object': 'chat.completion.chunk', 'model': model,
+                     'choices': [], 'usage': usage}
+            handler.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode('utf-8'))
+        handler.wfile.write(b'data: [DONE]\n\n')
+        handler.wfile.flush()
+
+    def _embeddings(self, handler, request):
+        texts = request.get('input', [])
+        if isinstance(texts, str):
+            texts = [texts]
+        prompt_tokens = sum(estimate_tokens(text) for text in texts)
+        self._send_json(handler, 200, {
+            'object': 'list',
+            'model': request.get('model', 'stand-in'),
+            'data': [{'object': 'embedding', 'index': i, 'embedding': self.embedding(text)} for i, text in enumerate(texts)],
+            'usage': {'prompt_tokens': prompt_tokens, 'total_tokens': prompt_tokens},
+        })
+
+    @staticmethod
+    def _send_json(handler, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(body)
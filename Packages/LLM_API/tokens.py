@@ -0,0 +1,41 @@
+def estimate_tokens(text):
+    """
+    粗略估算文本的 token 数：非 ASCII 字符（中文等）按每字 1 个 token，ASCII 字符按每 4 个字符 1 个 token。
+
+    参数:
+    text (str): 输入文本。
+
+    返回:
+    int: 估算的 token 数，至少为 1。
+    """
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    ascii_count = len(text) - non_ascii
+    return non_ascii + ascii_count // 4 + 1
+
+
+def pack_batches(texts, max_items, max_tokens):
+    """
+    按条数上限和估算 token 上限把文本顺序打包成若干批次，单条超限的文本独占一批。
+
+    参数:
+    texts (list of str): 待打包的文本列表。
+    max_items (int): 每批最多条数。
+    max_tokens (int): 每批估算 token 总数上限。
+
+    返回:
+    list of list of int: 每个批次包含的文本下标。
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= max_items or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
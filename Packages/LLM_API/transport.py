@@ -0,0 +1,191 @@
+import time
+import asyncio
+import threading
+import contextlib
+import contextvars
+import weakref
+import itertools
+import requests
+from requests.adapters import HTTPAdapter
+import httpx
+
+try:
+    import h2  # noqa: F401  安装了 h2 时启用 HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+MAX_CONNECTIONS = 1000
+MAX_KEEPALIVE_CONNECTIONS = 200
+KEEPALIVE_EXPIRY = 30.0
+DEFAULT_TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+# httpcore 每次分配连接都要扫描 排队请求 x 连接，代价随并发数平方增长；
+# 把异步连接池拆成若干个分片轮流使用，高并发时 CPU 开销可下降一个数量级
+ASYNC_POOL_SHARDS = 16
+
+_session = None
+_session_lock = threading.Lock()
+# 每个事件循环一组 AsyncClient 分片，连接池不能跨事件循环复用
+_async_clients = weakref.WeakKeyDictionary()
+_async_lock = threading.Lock()
+# 当前任务的截止时间（time.monotonic），线程和 asyncio 任务各自独立
+_deadline = contextvars.ContextVar('llm_deadline', default=None)
+
+
+def get_session():
+    """
+    返回进程内共享的 requests.Session，所有同步请求复用同一个 keep-alive 连接池。
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=16, pool_maxsize=MAX_KEEPALIVE_CONNECTIONS)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def _new_async_client():
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        timeout=DEFAULT_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=max(1, MAX_CONNECTIONS // ASYNC_POOL_SHARDS),
+            max_keepalive_connections=max(1, MAX_KEEPALIVE_CONNECTIONS // ASYNC_POOL_SHARDS),
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_async_client():
+    """
+    返回当前事件循环共享的 httpx.AsyncClient（HTTP/1.1 keep-alive，可用时启用 HTTP/2），
+    每次调用在 ASYNC_POOL_SHARDS 个分片之间轮换。必须在协程内调用。
+    """
+    loop = asyncio.get_running_loop()
+    shards = _async_clients.get(loop)
+    if shards is None:
+        with _async_lock:
+            shards = _async_clients.get(loop)
+            if shards is None:
+                shards = _async_clients[loop] = ([_new_async_client() for _ in range(ASYNC_POOL_SHARDS)], itertools.count())
+    clients, counter = shards
+    position = next(counter) % len(clients)
+    client = clients[position]
+    if client.is_closed:
+        client = clients[position] = _new_async_client()
+    return client
+
+
+async def aclose_async_client():
+    """
+    关闭当前事件循环的共享 AsyncClient，在 asyncio.run 的主协程结束前调用。
+    """
+    loop = asyncio.get_running_loop()
+    shards = _async_clients.pop(loop, None)
+    if shards is not None:
+        for client in shards[0]:
+            if not client.is_closed:
+                await client.aclose()
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """
+    在该上下文内发出的所有 LLM 请求共享一个截止时间，请求的超时取剩余时间，
+    到期后连接被关闭并抛出超时异常，而不是让调用方无限等待。seconds 为 None 时不设限制。
+    嵌套使用时取更早的截止时间。
+    """
+    if seconds is None:
+        yield
+        return
+    until = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(until if current is None else min(current, until))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time():
+    """
+    返回当前截止时间前剩余的秒数，未设置截止时间时返回 None。
+    """
+    until = _deadline.get()
+    if until is None:
+        return None
+    return until - time.monotonic()
+
+
+def request_timeout(default=None):
+    """
+    返回下一次请求应使用的超时秒数；截止时间已过时直接抛出 TimeoutError，不再发出请求。
+    """
+    remaining = remaining_time()
+    if remaining is None:
+        return default
+    if remaining <= 0:
+        raise TimeoutError("任务已超过截止时间，放弃请求。")
+    return remaining if default is None else min(default, remaining)
+
+
+def timeout_kwargs():
+    """
+    只有设置了截止时间时才返回 {'timeout': 剩余秒数}，否则沿用各客户端自己的默认超时。
+    requests 的超时是单次连接或读取的超时，整个请求的总时长由 read_body 在读取响应时检查。
+    """
+    timeout = request_timeout()
+    return {} if timeout is None else {'timeout': timeout}
+
+
+def httpx_timeout_kwargs():
+    """
+    httpx 版本的 timeout_kwargs：连接、读、写和等待连接池（pool）都不超过剩余时间。
+    这些仍是单次操作的超时，整个请求的总时长由 within_deadline 限制。
+    """
+    timeout = request_timeout()
+    return {} if timeout is None else {'timeout': httpx.Timeout(timeout, pool=timeout)}
+
+
+def check_deadline():
+    """
+    截止时间已过时抛出 TimeoutError，在逐块读取响应时调用。
+    """
+    remaining = remaining_time()
+    if remaining is not None and remaining <= 0:
+        raise TimeoutError("请求超过截止时间。")
+
+
+def read_body(response, chunk_size=65536):
+    """
+    读取以 stream=True 发出的 requests 响应体，每读一块检查一次截止时间，
+    服务端慢慢地持续返回数据时也不会超过截止时间太多。
+    """
+    if remaining_time() is None:
+        return response.content
+    chunks = []
+    for chunk in response.iter_content(chunk_size):
+        check_deadline()
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+async def within_deadline(awaitable):
+    """
+    在截止时间内等待 awaitable，超时时取消它并抛出 TimeoutError。
+    """
+    remaining = remaining_time()
+    if remaining is None:
+        return await awaitable
+    if remaining <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise TimeoutError("任务已超过截止时间，放弃请求。")
+    try:
+        return await asyncio.wait_for(awaitable, remaining)
+    except asyncio.TimeoutError:
+        raise TimeoutError("请求超过截止时间。") from None
@@ -5,6 +5,8 @@ import threading
 import collections
 import os
 from dotenv import load_dotenv, find_dotenv
+from Packages.LLM_API.rate_limiter import RateLimiter, get_rate_limiter, DEFAULT_COMPLETION_TOKENS
+from Packages.LLM_API.tokens import estimate_tokens
 
 # 定义一个线程类，用于发送请求
 class RequestThread(threading.Thread):
@@ -20,8 +22,11 @@ class RequestThread(threading.Thread):
 
 # 定义一个类，用于测试每分钟请求数（RPM）
 class QwenRater:
-    def __init__(self):
+    def __init__(self, model="qwen-long", rate_limiter=None):
         load_dotenv()
+        self.model = model
+        self.provider = 'dashscope'
+        self.rate_limiter = rate_limiter or get_rate_limiter()
         self.client = dashscope.Generation()  # 创建一个生成客户端实例
         self.project_root = os.getenv('PROJECT_ROOT')
         self.total_requests = 0  # 总请求数
@@ -53,9 +58,13 @@ class QwenRater:
             {"role": "user", "content": "你好！"}
         ]
         
+        # 从共享限流器取得配额（未配置 dashscope 限额时不等待）
+        reserved_tokens = sum(estimate_tokens(m["content"]) for m in messages) + DEFAULT_COMPLETION_TOKENS
+        self.rate_limiter.acquire(self.provider, self.model, reserved_tokens)
+
         start_time = time.time()  # 记录请求开始时间
         response = self.client.call(
-            model="qwen-long",
+            model=self.model,
             messages=messages,
             seed=random.randint(1, 10000),
             result_format="message"
@@ -75,11 +84,13 @@ class QwenRater:
 
                 self.past_minute_input_tokens += input_tokens  # 增加过去一分钟内的输入tokens数
                 self.past_minute_output_tokens += output_tokens  # 增加过去一分钟内的输出tokens数
+                self.rate_limiter.record_usage(self.provider, self.model, reserved_tokens, input_tokens + output_tokens)
 
                 self.cleanup_past_minute_requests()  # 清理过期的请求信息
 
                 return response  # 返回响应
             elif response['status_code'] == 429:  # 如果请求受限
+                self.rate_limiter.pause(self.provider, self.model, RateLimiter.parse_retry_after(response.get('headers')))
                 self.cleanup_past_minute_requests()  # 清理过期的请求信息
                 return response  # 返回响应
 
@@ -141,4 +152,16 @@ class QwenRater:
                 if recent_rpms[-1]<=avg_rpm:
                     print('rpm_is_stable')
                     print(f"Final RPM: {avg_rpm}")
-                    return avg_rpm  # 返回最终RPM
\ No newline at end of file
+                    return avg_rpm  # 返回最终RPM
+
+    def calibrate(self, profile_path=None, safety_ratio=0.9, **rpm_test_kwargs):
+        """
+        实测 RPM 后按 safety_ratio 折算写入共享限流器，可选保存为限额文件供 RateLimiter.load_profile 使用。
+        测试期间临时去掉本模型的限额，避免限流器干扰测量。
+        """
+        self.rate_limiter.configure(self.provider, self.model)
+        rpm = self.rpm_test(**rpm_test_kwargs)
+        self.rate_limiter.configure(self.provider, self.model, rpm=int(rpm * safety_ratio))
+        if profile_path:
+            self.rate_limiter.save_profile(profile_path)
+        return rpm
@@ -3,6 +3,15 @@ import ast
 import re
 
 class LLMParser:
+    REPAIR_MAX_STARTS = 8  # 最多尝试的起始括号个数
+    REPAIR_MAX_CUTS = 8  # 截断恢复时最多回退的元素个数
+
+    # 字符串之外的中文标点
+    STRUCTURAL_PUNCTUATION = {'，': ',', '：': ':', '【': '[', '】': ']', '（': '(', '）': ')'}
+    QUOTE_CLOSERS = {"'": "'", '"': '"', '“': '”', '‘': '’'}
+    BRACKET_CLOSERS = {'{': '}', '[': ']', '(': ')'}
+    JSON_LITERALS = {'true': 'True', 'false': 'False', 'null': 'None'}
+
     def __init__(self):
         pass
 
@@ -81,6 +90,134 @@ class LLMParser:
         except Exception as e:
             raise RuntimeError(f"解析失败，错误信息：{e}。原文字串为{str_with_pads}")
 
+    def parse_indexed_pads(self, str_with_pads):
+        """
+        提取带编号的 pad：=start_pad_1= ... =end_pad_1=，不区分大小写，同一编号出现多次时取最后一次。
+
+        :param str_with_pads: 包含若干带编号 pad 的文本
+        :return: {编号: pad 中去掉首尾空白的内容}
+        """
+        pattern = r'=start_pad_(\d+)=(.*?)=end_pad_\1='
+        matches = re.findall(pattern, str_with_pads, re.DOTALL | re.IGNORECASE)
+        if not matches:
+            raise RuntimeError(f"解析失败，错误信息：未找到带编号的 pad。原文字串为{str_with_pads}")
+        return {int(index): content.strip() for index, content in matches}
+
+    def repair_literal(self, text, expect=None):
+        """
+        本地修复并解析 LLM 输出中的字典或列表，不发送请求：取出代码块中的内容，补齐被截断的引号和括号，
+        删除多余的逗号，转义字符串中未转义的引号，把 JSON 的 true/false/null 换成 Python 字面量，
+        把结构位置上的中文标点换成英文标点。修复是确定性的，同一输入总得到同一结果。
+
+        :param text: LLM 的原始回答
+        :param expect: 期望的类型（dict 或 list），None 表示两者皆可
+        :return: 解析出的对象
+        """
+        openers = {dict: '{', list: '['}.get(expect, '{[')
+        for source in self._fenced_blocks(text) + [text]:
+            starts = [i for i, ch in enumerate(source) if ch in openers or (ch == '【' and '[' in openers)]
+            for start in starts[:self.REPAIR_MAX_STARTS]:
+                for candidate in self._repair_candidates(source, start):
+                    try:
+                        parsed = ast.literal_eval(candidate)
+                    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+                        continue
+                    if expect is None and isinstance(parsed, (dict, list)) or expect is not None and isinstance(parsed, expect):
+                        return parsed
+        raise RuntimeError(f"修复失败，未能从回答中恢复出{'字典' if expect is dict else '列表' if expect is list else '字典或列表'}。原文字串为{text}")
+
+    @staticmethod
+    def _fenced_blocks(text):
+        # 代码块的结束标记可能被截断
+        return [block for block in re.findall(r'```[\w-]*[ \t]*\n?(.*?)(?:```|$)', text, re.DOTALL) if block.strip()]
+
+    def _repair_candidates(self, text, start):
+        """
+        从 start 处的括号开始扫描，产出若干修复后的候选字符串：先是完整的（或补齐括号的）结果，
+        截断时再依次回退到前面的逗号处补齐括号。
+        """
+        out = []
+        stack = []
+        cuts = []  # (逗号在 out 中的位置, 当时的括号栈)
+        quote = None
+        n = len(text)
+        i = start
+        while i < n:
+            ch = text[i]
+            if quote is not None:
+                opener_out, closer = quote
+                if ch == '\\' and i + 1 < n:
+                    out.append(text[i:i + 2])
+                    i += 2
+                    continue
+                if ch == closer:
+                    following = text[i + 1:].lstrip()[:1]
+                    if not following or following in ',:}])，：】）':
+                        out.append(opener_out)
+                        quote = None
+                    else:
+                        # 字符串内部未转义的引号
+                        out.append('\\' + opener_out)
+                elif ch == opener_out:
+                    out.append('\\' + ch)
+                elif ch == '\n':
+                    out.append('\\n')
+                else:
+                    out.append(ch)
+                i += 1
+                continue
+
+            ch = self.STRUCTURAL_PUNCTUATION.get(ch, ch)
+            if ch in self.QUOTE_CLOSERS:
+                quote = ('"' if ch in '"“' else "'", self.QUOTE_CLOSERS[ch])
+                out.append(quote[0])
+            elif ch in self.BRACKET_CLOSERS:
+                stack.append(self.BRACKET_CLOSERS[ch])
+                out.append(ch)
+            elif ch in '}])':
+                if stack and stack[-1] == ch:
+                    self._drop_trailing_comma(out)
+                    stack.pop()
+                    out.append(ch)
+                    if not stack:
+                        break
+                # 不匹配的右括号直接丢弃
+            elif ch.isalpha() or ch == '_':
+                end = i
+                while end < n and (text[end].isalnum() or text[end] == '_'):
+                    end += 1
+                word = text[i:end]
+                if stack and stack[-1] == '}' and text[end:].lstrip()[:1] in (':', '：') and word not in self.JSON_LITERALS:
+                    # 没有引号的键
+                    out.append(repr(word))
+                else:
+                    out.append(self.JSON_LITERALS.get(word, word))
+                i = end
+                continue
+            else:
+                if ch == ',':
+                    cuts.append((len(out), list(stack)))
+                out.append(ch)
+            i += 1
+
+        if not stack and quote is None:
+            yield ''.join(out)
+            return
+
+        # 回答被截断：补齐引号和括号
+        tail = out + ([quote[0]] if quote is not None else [])
+        self._drop_trailing_comma(tail)
+        yield ''.join(tail) + ''.join(reversed(stack))
+        # 最后一个元素不完整（如只有键没有值）时，回退到前面的逗号
+        for position, cut_stack in reversed(cuts[-self.REPAIR_MAX_CUTS:]):
+            yield ''.join(out[:position]) + ''.join(reversed(cut_stack))
+
+    @staticmethod
+    def _drop_trailing_comma(out):
+        while out and out[-1].isspace():
+            out.pop()
+        if out and out[-1] == ',':
+            out.pop()
 
     def parse_code(self,markdown_text):
         """
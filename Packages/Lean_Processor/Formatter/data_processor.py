@@ -1,3 +1,6 @@
+from Packages.LLM_API.similarity import IncrementalPartition
+
+
 class DataProcessor:
     def __init__(self):
         pass
@@ -74,18 +77,60 @@ class DataProcessor:
         
         return updated_tuple_list
 
-    def convertor(self, embedder, tuple_list):
+    def convertor(self, embedder, tuple_list, method='exact', **partition_kwargs):
+        """
+        嵌入所有字符串并合并近义词。
+
+        参数:
+        embedder: 提供 embed_list 和 partition_by_similarity 的对象，一般是 MultiLLM。
+        tuple_list (list of tuple): 输入的嵌套字符串列表及索引的元组列表。
+        method (str): 'exact' 为精确分块计算，'ann' 为 IVF 近似近邻，适合大词表。
+        partition_kwargs: 透传给 partition_by_similarity 的参数，如 threshold、nprobe、check_recall。
+
+        返回:
+        list of tuple: 合并近义词后的 (main_word, index) 列表。
+        """
         temp_type_list=self.transform_tuple_list(tuple_list)
 
         type_list=self.tuple2string_list(temp_type_list)
 
         embedded_type_list=embedder.embed_list(type_list)
 
-        synonyms=embedder.partition_by_similarity(embedded_type_list)
+        synonyms=embedder.partition_by_similarity(embedded_type_list, method=method, **partition_kwargs)
 
         updated_type_list=self.update_tuple_list(temp_type_list, synonyms)
         
         return updated_type_list
+
+    def convertor_stream(self, embedder, threshold=0.8):
+        """
+        convertor 的流式版本，供 Pipeline.add_batch 使用：返回的函数接收一批 (字符串列表, index) 元组，
+        嵌入本批中的字符串并与之前各批的主词增量合并，返回本批合并近义词后的 (main_word, index) 列表。
+        已输出的词不会因为后来的词改变主词。
+
+        参数:
+        embedder: 提供 embed_list 的对象，一般是 MultiLLM。
+        threshold (float): 相似度阈值。
+
+        返回:
+        function: 批处理函数，属性 partition 为 IncrementalPartition，可用 partition.synonyms() 取得全部合并结果。
+        """
+        partition = IncrementalPartition(threshold)
+
+        def convert(batch):
+            temp_type_list = self.transform_tuple_list(batch)
+            type_list = list(dict.fromkeys(self.tuple2string_list(temp_type_list)))
+            embedded_type_list = embedder.embed_list(type_list)
+            main_words = partition.add(type_list, [embedded_type_list.get(key) for key in type_list])
+            synonyms = {}
+            for key, main_word in zip(type_list, main_words):
+                synonyms.setdefault(main_word, {'Similar_keys': []})
+                if key != main_word:
+                    synonyms[main_word]['Similar_keys'].append(key)
+            return self.update_tuple_list(temp_type_list, synonyms)
+
+        convert.partition = partition
+        return convert
     
     def organize_data(self, type_data, entity_data):
         # 初始化一个字典，用于存储按 index 分组的数据
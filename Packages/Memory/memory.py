@@ -67,9 +67,13 @@ class Memory():
     def summarize_worker(self, queue, output, concern_topic):
         while not queue.empty():
             index, input_text = queue.get()
-            summarized_text = self.summarize(input_text, concern_topic)
-            output[index] = summarized_text
-            queue.task_done()
+            try:
+                output[index] = self.summarize(input_text, concern_topic)
+            except Exception as e:
+                # 单条失败时保留 None，避免线程退出后 queue.join() 永远等待
+                print(f"Error summarizing item {index}: {e}")
+            finally:
+                queue.task_done()
 
     def summarize_list(self, string_list, thread_number, concern_topic=None):
         queue = Queue()
@@ -1 +1,12 @@
-from .multi_process import MultiProcessor
\ No newline at end of file
+from .multi_process import MultiProcessor
+from .worker_pool import WorkerPool
+from .journal import CheckpointJournal
+from .concurrency import AIMDController
+from .cpu_offload import CPUOffloader
+from .coalesce import PromptCoalescer
+from .batching import MicroBatcher
+from .work_queue import SQLiteWorkQueue, RedisWorkQueue, LocalRedis
+from .coordinator import JobCoordinator
+from .profiler import StageProfiler
+from .pipeline import Pipeline, Stage
+from .result_store import ResultStore
\ No newline at end of file
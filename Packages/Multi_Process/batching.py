@@ -0,0 +1,102 @@
+from Packages.LLM_API.tokens import estimate_tokens
+from Packages.LLM_Parser import LLMParser
+
+# 单个任务的提示词中 {data_template} 的替换内容，模板本身只在批量提示词开头出现一次
+DATA_TEMPLATE_REFERENCE = '上方给出的 data_template'
+
+
+class MicroBatcher:
+    """
+    把多个任务打包进一个提示词：data_template 只出现一次，每个任务的回答写在 =start_pad_i= 和 =end_pad_i= 之间，
+    回答按编号拆回各个任务。每批的任务数 k 受 max_batch 和 token_budget 限制：
+    提示词的估算 token 数加上预计的回答 token 数（按最近每个任务的平均回答长度估计）不超过 token_budget。
+    一批中能正确拆分并通过校验的比例低于 min_success 时 k 减半，整批都成功时 k 加 1。
+
+    参数:
+    data_template (str): 数据模板。
+    max_batch (int): 每批最多的任务数。
+    token_budget (int): 每批提示词与预计回答的估算 token 总数上限。
+    min_success (float): 一批中成功比例低于该值时减小 k。
+    """
+
+    def __init__(self, data_template, max_batch=8, token_budget=4000, min_success=0.5):
+        self.data_template = data_template
+        self.max_batch = max_batch
+        self.token_budget = token_budget
+        self.min_success = min_success
+        self.k = max_batch
+        # 初始按数据模板长度的两倍估计每个任务的回答长度
+        self.answer_tokens = 2 * estimate_tokens(data_template)
+        self.overhead_tokens = estimate_tokens(self.build_prompt([]))
+        self.parser = LLMParser()
+        self.batches = 0
+        self.items = 0
+        self.succeeded = 0
+
+    def take(self, queue, render, rejected=None):
+        """
+        从 queue（deque of (位置, 输入元组)）头部取出下一批，返回 [(位置, 输入元组, 单个任务的提示词)]。
+        给定 rejected 列表时，渲染提示词失败（模板占位符与输入不符等）的任务出队后放入 rejected，不进入批次，
+        此时取出的都是渲染失败的任务时返回空列表；否则渲染的异常直接抛出。
+        """
+        batch = []
+        tokens = self.overhead_tokens
+        while queue and len(batch) < self.k:
+            idx, input_tuple = queue[0]
+            try:
+                prompt = render(input_tuple)
+            except Exception:
+                if rejected is None:
+                    raise
+                rejected.append(queue.popleft())
+                continue
+            cost = estimate_tokens(prompt) + self.answer_tokens
+            if batch and tokens + cost > self.token_budget:
+                break
+            queue.popleft()
+            batch.append((idx, input_tuple, prompt))
+            tokens += cost
+        return batch
+
+    def build_prompt(self, prompts):
+        sections = ''.join(f'### 任务 {i}\n{prompt}\n\n' for i, prompt in enumerate(prompts, 1))
+        return (
+            f'以下有 {len(prompts)} 个相互独立的任务，请逐个完成。所有任务的回答都使用同一个数据模板（data_template）：\n\n'
+            f'{self.data_template}\n\n'
+            f'{sections}'
+            '请按任务编号依次输出回答，第 i 个任务的回答写在 =start_pad_i= 和 =end_pad_i= 之间'
+            '（例如 =start_pad_1= 回答 =end_pad_1=），不要输出任何无关内容。'
+        )
+
+    def split(self, answer):
+        """
+        按编号拆分回答，返回 {编号: 回答}，编号从 1 开始；找不到任何 pad 时返回空字典。
+        """
+        try:
+            return self.parser.parse_indexed_pads(answer)
+        except RuntimeError:
+            return {}
+
+    def observe(self, size, succeeded, answer=None):
+        """
+        一批完成后调用，更新每个任务的平均回答长度并调整 k。请求本身失败时 answer 为 None。
+        """
+        self.batches += 1
+        self.items += size
+        self.succeeded += succeeded
+        if answer is not None and succeeded:
+            per_item = estimate_tokens(answer) / size
+            self.answer_tokens = 0.8 * self.answer_tokens + 0.2 * per_item
+        if succeeded < size * self.min_success:
+            self.k = max(1, self.k // 2)
+        elif succeeded == size:
+            self.k = min(self.max_batch, self.k + 1)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'succeeded': self.succeeded,
+            'mean_batch': self.items / self.batches if self.batches else 0.0,
+            'k': self.k,
+        }
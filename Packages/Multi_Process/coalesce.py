@@ -0,0 +1,82 @@
+import copy
+
+
+class PromptCoalescer:
+    """
+    按渲染后的提示词合并相同的任务（single-flight）：同一个提示词只有第一个任务（leader）真正请求 LLM，
+    在它完成之前出现的相同任务（排队中或 leader 在途时）挂在它下面，leader 完成后每个任务都得到一份结果，
+    结果中的标识（输入元组的最后一个元素）换成各自的。leader 完成后再出现的相同提示词会重新请求。
+
+    参数:
+    key_fn: 输入元组 -> 合并键（渲染后的提示词），返回 None 表示不参与合并。
+    """
+
+    def __init__(self, key_fn):
+        self.key_fn = key_fn
+        self.requests = 0
+        self.coalesced = 0
+        # 当前挂在 leader 下、尚未产出的任务数
+        self.waiting = 0
+        self._groups = {}
+        # 不参与合并、已计入 requests 且尚未完成的任务位置，保证重复登记不重复计数
+        self._unkeyed = set()
+
+    def add(self, idx, input_tuple):
+        """
+        登记一个任务，返回 True 表示它是 leader，需要提交；False 表示已挂到相同提示词的 leader 下。
+        leader 和不参与合并的任务重复登记是幂等的，preload 返回的任务在提交时可以再次调用。
+        """
+        key = self.key_fn(input_tuple)
+        if key is None:
+            if idx not in self._unkeyed:
+                self._unkeyed.add(idx)
+                self.requests += 1
+            return True
+        group = self._groups.get(key)
+        if group is None:
+            self._groups[key] = {'leader': idx, 'followers': {}}
+            self.requests += 1
+            return True
+        if group['leader'] == idx:
+            return True
+        if idx not in group['followers']:
+            group['followers'][idx] = input_tuple
+            self.coalesced += 1
+            self.waiting += 1
+        return False
+
+    def preload(self, items):
+        """
+        已知全部输入时先整体登记，列表中相距很远的重复项也能合并。返回需要提交的 leader 列表。
+        """
+        return [(idx, input_tuple) for idx, input_tuple in items if self.add(idx, input_tuple)]
+
+    def resolve(self, idx, input_tuple, result):
+        """
+        leader 完成后调用，返回 [(位置, 输入元组, 结果)]，包含 leader 本身和所有挂在它下面的任务。
+        """
+        completed = [(idx, input_tuple, result)]
+        key = self.key_fn(input_tuple)
+        if key is None:
+            self._unkeyed.discard(idx)
+        group = self._groups.get(key) if key is not None else None
+        if group is None or group['leader'] != idx:
+            return completed
+        del self._groups[key]
+        self.waiting -= len(group['followers'])
+        for follower_idx, follower_tuple in group['followers'].items():
+            follower_result = None if result is None else (copy.deepcopy(result[0]), follower_tuple[-1])
+            completed.append((follower_idx, follower_tuple, follower_result))
+        return completed
+
+    @property
+    def tasks(self):
+        return self.requests + self.coalesced
+
+    def stats(self):
+        return {
+            'tasks': self.tasks,
+            'requests': self.requests,
+            'coalesced': self.coalesced,
+            'dedup_ratio': self.coalesced / self.tasks if self.tasks else 0.0,
+        }
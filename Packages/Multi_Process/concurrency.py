@@ -0,0 +1,95 @@
+import time
+import threading
+import statistics
+import collections
+
+
+class AIMDController:
+    """
+    加性增、乘性减（AIMD）的并发上限控制器。
+    每个成功且延迟正常的任务让上限增加 increase / limit（约每轮增加 increase），遇到限流、超时或延迟尖峰时上限乘以 decrease；
+    一次下降后要再完成约 limit 个任务才会再次下降，避免同一批失败连续把上限压到底。
+    在第一次出现拥塞之前按慢启动每个成功任务加 1，尽快找到服务端的实际容量。
+
+    参数:
+    max_limit (int): 上限的最大值（工作线程数或协程数）。
+    initial (int): 初始上限，默认 min(max_limit, 4)。
+    min_limit (int): 上限的最小值。
+    increase (float): 每轮的加性增量。
+    decrease (float): 拥塞时的乘性系数。
+    latency_tolerance (float): 最近延迟中位数超过基线的该倍数视为延迟尖峰。
+    window (int): 计算最近延迟中位数的样本数。
+    """
+
+    def __init__(self, max_limit, initial=None, min_limit=1, increase=1.0, decrease=0.5, latency_tolerance=2.0, window=20):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self._limit = float(initial if initial is not None else min(max_limit, 4))
+        self._latencies = collections.deque(maxlen=window)
+        self.baseline = None
+        self.slow_start = True
+        self.decreases = 0
+        self.history = [(time.monotonic(), self.limit)]
+        self._since_decrease = 0
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self):
+        return max(self.min_limit, min(self.max_limit, int(self._limit)))
+
+    def _set(self, value, reason):
+        before = self.limit
+        self._limit = max(float(self.min_limit), min(float(self.max_limit), value))
+        if self.limit != before:
+            self.history.append((time.monotonic(), self.limit))
+            if reason:
+                print(f"Concurrency limit {before} -> {self.limit} ({reason}).")
+
+    def on_success(self, latency):
+        with self._lock:
+            self._since_decrease += 1
+            self._latencies.append(latency)
+            if len(self._latencies) < self._latencies.maxlen:
+                self._set(self._limit + (1.0 if self.slow_start else self.increase / self._limit), None)
+                return
+            median = statistics.median(self._latencies)
+            if self.baseline is None or median < self.baseline:
+                self.baseline = median
+            if median > self.baseline * self.latency_tolerance:
+                if self.limit <= self.min_limit:
+                    # 已经降到最低仍然很慢，说明是服务端本身变慢，重新确定基线
+                    self.baseline = median
+                    return
+                self._decrease(f'latency {median:.2f}s > {self.latency_tolerance:g}x baseline {self.baseline:.2f}s')
+            else:
+                self._set(self._limit + (1.0 if self.slow_start else self.increase / self._limit), None)
+
+    def on_congestion(self, reason='throttled'):
+        """
+        任务遇到 429 / 超时时调用。
+        """
+        with self._lock:
+            self._since_decrease += 1
+            self._decrease(reason)
+
+    def _decrease(self, reason):
+        # 每轮（约 limit 个任务）最多下降一次
+        if self._since_decrease < self.limit and not self.slow_start:
+            return
+        self.slow_start = False
+        self.decreases += 1
+        self._since_decrease = 0
+        self._latencies.clear()
+        self._set(self._limit * self.decrease, reason)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'baseline_latency': self.baseline,
+                'decreases': self.decreases,
+                'slow_start': self.slow_start,
+            }
@@ -0,0 +1,64 @@
+import time
+from tqdm import tqdm
+
+from .journal import CheckpointJournal
+
+
+class JobCoordinator:
+    """
+    分布式任务的协调者：把 tuple_list 放进共享队列（SQLiteWorkQueue 或 RedisWorkQueue），
+    等待各节点上的 MultiProcessor.serve_queue 处理完成，再把结果按输入顺序合并成与 multitask_perform 相同的列表。
+
+    用法:
+    coordinator = JobCoordinator(SQLiteWorkQueue('/shared/job.db'))
+    coordinator.submit(tuple_list)
+    # 各节点: processor.serve_queue(SQLiteWorkQueue('/shared/job.db'), num_threads=64)
+    results = coordinator.wait()
+
+    参数:
+    queue: 任务队列。
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self.total = None
+
+    def submit(self, tuple_list):
+        self.queue.put_many(enumerate(tuple_list))
+        self.total = len(tuple_list)
+
+    def wait(self, poll_interval=5.0, timeout=None):
+        """
+        轮询直到所有任务都有结果，返回按位置排列的结果列表；超过 timeout 秒时抛出 TimeoutError。
+        """
+        start = time.monotonic()
+        counts = self.queue.counts()
+        total = self.total if self.total is not None else counts['total']
+        with tqdm(total=total, initial=counts['done']) as pbar:
+            while counts['done'] < total:
+                if timeout is not None and time.monotonic() - start > timeout:
+                    raise TimeoutError(f"{total - counts['done']} 个任务在 {timeout} 秒内未完成。")
+                time.sleep(poll_interval)
+                counts = self.queue.counts()
+                pbar.update(counts['done'] - pbar.n)
+                pbar.set_postfix(leased=counts['leased'], pending=counts['pending'], refresh=False)
+                if counts['pending'] == 0 and counts['leased'] == 0 and counts['done'] < total:
+                    missing = self.queue.requeue_missing()
+                    if missing:
+                        print(f"Requeued {missing} lost tasks.")
+        return self.results()
+
+    def results(self):
+        """
+        按位置合并已完成的结果，未完成的位置为 None。
+        """
+        done = self.queue.results()
+        total = self.total if self.total is not None else self.queue.counts()['total']
+        return [tuple(done[i]) if done.get(i) is not None else None for i in range(total)]
+
+    def save_checkpoint(self, checkpoint_path):
+        # 写成 multitask_perform 的快照格式，Active_Reload 可以直接接着用
+        results = self.results()
+        with CheckpointJournal(checkpoint_path) as journal:
+            journal.compact(results)
+        return results
@@ -0,0 +1,153 @@
+import os
+import time
+import pickle
+import threading
+import multiprocessing
+import concurrent.futures
+
+# 子进程中的解析函数和校验函数，由 _init_worker 在进程启动时设置一次
+_functions = {}
+
+
+def _init_worker(parse_method, validator):
+    _functions['parse'] = parse_method
+    _functions['validate'] = validator
+
+
+def _run_batch(batch):
+    # 在子进程中依次执行一批调用，异常逐个返回，不影响同批的其他调用
+    results = []
+    for op, arg in batch:
+        try:
+            results.append((True, _functions[op](arg)))
+        except Exception as e:
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = RuntimeError(str(e))
+            results.append((False, e))
+    return results
+
+
+class CPUOffloader:
+    """
+    把 parse_method 和 validator 放到进程池中执行，避免解析和校验占用 GIL、拖慢负责网络请求的线程或事件循环。
+    调用先进入队列，由后台线程按 batch_size 条或 batch_interval 秒打包成一批提交，每批只往返一次进程间通信，
+    结果同样按批返回后再分发给各自的 Future。parse_method 和 validator 在进程启动时传入一次，必须可以 pickle
+    （例如 LLMParser().parse_dict 或模块级函数，lambda 不行）。
+
+    参数:
+    parse_method: 解析函数，answer -> 结构化数据。
+    validator: 校验函数，结构化数据 -> bool。
+    num_processes (int): 进程数，默认 os.cpu_count()。
+    batch_size (int): 每批最多的调用数。
+    batch_interval (float): 凑批的最长等待时间（秒）。
+    """
+
+    def __init__(self, parse_method, validator, num_processes=None, batch_size=32, batch_interval=0.002):
+        for function in (parse_method, validator):
+            try:
+                pickle.dumps(function)
+            except Exception as e:
+                raise ValueError(f"{function!r} 无法 pickle，不能放到进程池中执行：{e}")
+        self.num_processes = num_processes or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.batches = 0
+        self.calls = 0
+        # 进程在提交第一批时才启动，此时网络线程已在运行；fork 会复制其他线程持有的锁导致子进程卡死，所以用 spawn
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            self.num_processes, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker,
+            initargs=(parse_method, validator))
+        # 先把进程都启动起来，spawn 的启动开销（约 1 秒）不落在第一批任务上
+        for job in [self._executor.submit(_run_batch, []) for _ in range(self.num_processes)]:
+            job.result()
+        self._pending = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._dispatch, name='cpu-offload', daemon=True)
+        self._thread.start()
+
+    def submit(self, op, arg):
+        """
+        提交一次调用，op 为 'parse' 或 'validate'，返回 concurrent.futures.Future。
+        """
+        future = concurrent.futures.Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("CPUOffloader 已关闭。")
+            self._pending.append((future, op, arg))
+            # 第一条唤醒调度线程开始计时凑批，凑满一批时提前唤醒
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._condition.notify()
+        return future
+
+    def parse(self, answer):
+        return self.submit('parse', answer).result()
+
+    def validate(self, data):
+        return self.submit('validate', data).result()
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                # 批未满时再等一小段时间凑批
+                end = time.monotonic() + self.batch_interval
+                while len(self._pending) < self.batch_size and not self._closed:
+                    remaining = end - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+                self.batches += 1
+                self.calls += len(batch)
+            futures = [future for future, _, _ in batch]
+            try:
+                job = self._executor.submit(_run_batch, [(op, arg) for _, op, arg in batch])
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            job.add_done_callback(lambda job, futures=futures: self._deliver(job, futures))
+
+    @staticmethod
+    def _deliver(job, futures):
+        try:
+            results = job.result()
+        except Exception as e:
+            # 子进程崩溃或参数无法 pickle，整批失败
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future, (ok, value) in zip(futures, results):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'processes': self.num_processes,
+                'calls': self.calls,
+                'batches': self.batches,
+                'mean_batch': self.calls / self.batches if self.batches else 0.0,
+                'pending': len(self._pending),
+            }
+
+    def shutdown(self, wait=True):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class CheckpointJournal:
+    """
+    追加写的检查点日志。每完成一个任务追加一行 {"i": 位置, "r": 结果}，每 fsync_every 条或 fsync_interval 秒 fsync 一次，
+    单条写入代价为 O(1)；compact 把快照与日志合并成完整的结果列表，先写临时文件再原子替换，然后清空日志。
+    快照沿用原来的 checkpoint.json 列表格式，崩溃时日志末尾写了一半的行在重放时被忽略。
+    打开期间持有文件锁，防止两个进程同时写同一个检查点。
+
+    参数:
+    snapshot_path (str): 快照文件路径。
+    journal_path (str): 日志文件路径，默认在快照文件名后加 .journal.jsonl。
+    fsync_every (int): 每追加多少条 fsync 一次。
+    fsync_interval (float): 距上次 fsync 超过该秒数时也会 fsync。
+    """
+
+    def __init__(self, snapshot_path, journal_path=None, fsync_every=100, fsync_interval=1.0):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or os.path.splitext(snapshot_path)[0] + '.journal.jsonl'
+        self.lock_path = self.journal_path + '.lock'
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.appended = 0
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._file = None
+        self._lock_file = None
+        self._lock = threading.Lock()
+
+    def open(self, reset=False):
+        """
+        获取文件锁并打开日志。reset=True 时丢弃已有的快照和日志，开始新的一轮。
+        """
+        directory = os.path.dirname(self.journal_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(self.lock_path, 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self._lock_file.seek(0)
+                msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            raise RuntimeError(f"检查点 {self.journal_path} 正被其他进程使用。")
+        if reset:
+            for path in (self.snapshot_path, self.journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        self._truncate_torn_tail()
+        self._file = open(self.journal_path, 'a', encoding='utf-8')
+        return self
+
+    def _truncate_torn_tail(self):
+        # 崩溃时写了一半的最后一行必须截掉，否则新记录接在半行后面，重放时和它一起被丢弃
+        if not os.path.exists(self.journal_path):
+            return
+        valid_bytes = 0
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    json.loads(line.decode('utf-8'))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    break
+                valid_bytes += len(line)
+        if os.path.getsize(self.journal_path) > valid_bytes:
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(valid_bytes)
+
+    def append(self, index, result):
+        line = json.dumps({'i': index, 'r': result}, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self.appended += 1
+            self._pending += 1
+            if self._pending >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+
+    def replay(self):
+        """
+        读取快照并按顺序重放日志，返回结果列表（未完成的位置为 None）。
+        """
+        results = []
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                results = json.load(f)
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 崩溃时写了一半的最后一行
+                        break
+                    index = record['i']
+                    if index >= len(results):
+                        results.extend([None] * (index + 1 - len(results)))
+                    results[index] = record['r']
+        return results
+
+    def compact(self, results=None):
+        """
+        把结果写成新的快照并清空日志。results 为 None 时先重放现有的快照和日志。
+        """
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+            if results is None:
+                results = self.replay()
+            tmp_path = self.snapshot_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            if self._file is not None:
+                self._file.truncate(0)
+                self._file.seek(0)
+            elif os.path.exists(self.journal_path):
+                open(self.journal_path, 'w').close()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._sync()
+                self._file.close()
+                self._file = None
+            if self._lock_file is not None:
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    self._lock_file.seek(0)
+                    msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+                self._lock_file.close()
+                self._lock_file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,15 +1,41 @@
-import threading
+import copy
 import time
 import random
+import threading
+import asyncio
+import contextvars
+import contextlib
 from queue import Queue
+from collections import deque, Counter
 from tqdm import tqdm
-import json
 import os
+import uuid
+import socket
+from queue import Empty
+from concurrent.futures import Future
+from Packages.LLM_API.hedging import HedgedLLM
+from Packages.LLM_API.router import client_name
+from Packages.LLM_API.metrics import get_metrics, classify_error
+from Packages.LLM_API.transport import remaining_time, deadline, aclose_async_client
+from Packages.LLM_Parser import LLMParser
+from .worker_pool import WorkerPool
+from .journal import CheckpointJournal
+from .concurrency import AIMDController
+from .cpu_offload import CPUOffloader
+from .coalesce import PromptCoalescer
+from .batching import MicroBatcher, DATA_TEMPLATE_REFERENCE
+from .profiler import StageProfiler
+from .result_store import ResultStore
+
+# 当前任务的状态字典，process_tuple 在其中记录是否遇到限流
+_task_state = contextvars.ContextVar('multiprocessor_task', default=None)
 
 class MultiProcessor:
 
-    def __init__(self, llm, parse_method, data_template, prompt_template, correction_template, validator, empty_template, time_limit=60, back_up_llm=None):
-        self.llm = llm
+    def __init__(self, llm, parse_method, data_template, prompt_template, correction_template, validator, empty_template, time_limit=60, back_up_llm=None, hedge_percentile=None, hedge_budget=0.1, timeout_retries=0, cpu_processes=0, coalesce=False,
+                 profile=False, trace_path=None, result_store=None, repair=False):
+        # 设置 hedge_percentile（如 90）后，主 LLM 超过最近延迟的该分位数仍未返回时，向备用 LLM 发出对冲请求
+        self.llm = HedgedLLM(llm, back_up_llm, percentile=hedge_percentile, budget=hedge_budget) if hedge_percentile else llm
         self.back_up_llm = back_up_llm
         self.parse_method = parse_method
         self.data_template = data_template
@@ -17,14 +43,135 @@ class MultiProcessor:
         self.correction_template = correction_template
         self.validator = validator
         self.empty_template = empty_template
+        # time_limit 是单个任务的截止时间，到期后放弃其中的请求；超时的任务最多重新提交 timeout_retries 次
         self.time_limit = time_limit
+        self.timeout_retries = timeout_retries
+        self._pool = None
+        # cpu_processes > 0 时 parse_method 和 validator 在进程池中执行，网络请求仍留在线程或协程中
+        self.cpu_processes = cpu_processes
+        self._offloader = None
+        self._offloader_lock = threading.Lock()
+        # coalesce=True 时渲染后提示词相同的任务只请求一次，结果分发给每个任务；dedup_stats 记录最近一次运行的合并情况。
+        # 默认关闭：相同提示词的任务本来各自请求一次，采样温度不为 0 时会得到不同的回答
+        self.coalesce = coalesce
+        self.dedup_stats = None
+        self.batch_stats = None
+        # perform_one 的在途请求 {提示词: Future}，由调用方的多个线程共享
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        # profile=True 时按阶段计时，运行结束打印汇总表；给定 trace_path 时另写一份 Chrome trace 时间线
+        self.trace_path = trace_path
+        self.profiler = StageProfiler(trace=trace_path is not None) if (profile or trace_path) else None
+        # repair=True 时 parse_method 失败后先在本地修复回答（补齐括号、去掉多余逗号等），修复不了才重新请求；
+        # 期望的类型由 data_template 的第一个括号决定，data_template 不是字典或列表时不修复。
+        # 默认关闭：修复会丢弃截断处不完整的键值对，得到的结果可能比重新请求的少几个字段
+        template_start = data_template.lstrip()[:1] if isinstance(data_template, str) else ''
+        self.repair_type = {'{': dict, '[': list}.get(template_start) if repair else None
+        self.repair_parser = LLMParser()
+        self.repair_stats = Counter()
+        self._stats_lock = threading.Lock()
+        # result_store（ResultStore 或数据库路径）按输入内容保存通过校验的结果，任何位置上内容相同的输入都直接复用
+        self.result_store = ResultStore(result_store) if isinstance(result_store, str) else result_store
         self.checkpoint_dir = "checkpoint"
         self.checkpoint_path = os.path.join(self.checkpoint_dir, 'checkpoint.json')
         
+    def stage(self, name):
+        return self.profiler.stage(name) if self.profiler is not None else contextlib.nullcontext()
+
+    def count(self, name):
+        if self.profiler is not None:
+            self.profiler.count(name)
+
+    def item(self, input_tuple, lane=None):
+        return self.profiler.item(input_tuple[-1], lane) if self.profiler is not None else contextlib.nullcontext()
+
+    def batch_item(self, batch):
+        # 一个批量请求计为 len(batch) 个任务，时间线事件的参数为批内全部任务的标识
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.item([input_tuple[-1] for _, input_tuple, _ in batch], count=len(batch))
+
+    def report_profile(self):
+        if self.profiler is None:
+            return
+        print(self.profiler.summary())
+        if self.trace_path:
+            events = self.profiler.write_chrome_trace(self.trace_path)
+            print(f"Trace with {events} events written to {self.trace_path}.")
+
     def generate_prompt(self, **kwargs):
         kwargs['data_template'] = self.data_template
         return self.prompt_template.format(**kwargs)
 
+    def coalesce_key(self, input_tuple):
+        input_data = input_tuple[:-1]
+        try:
+            return self.generate_prompt(**{f'input_{i+1}': input_data[i] for i in range(len(input_data))})
+        except Exception:
+            return None
+
+    def result_key(self, input_tuple):
+        return ResultStore.make_key(self.prompt_template, self.data_template, input_tuple[:-1], client_name(self.llm))
+
+    def store_result(self, input_tuple, result):
+        if self.result_store is not None and result is not None:
+            self.result_store.put(self.result_key(input_tuple), result[0])
+
+    def stored_result(self, data, input_tuple):
+        # 模板或校验函数变化后，旧结果不一定仍然有效，取出时重新校验
+        try:
+            valid = self.check(data)
+        except Exception:
+            valid = False
+        return (data, input_tuple[-1]) if valid else None
+
+    def reuse_stored(self, journal, results, tuple_list):
+        """
+        从 result_store 中取出尚无结果的输入的已有结果，写入 results 和检查点日志，返回复用的数量。
+        """
+        missing = [(i, self.result_key(t)) for i, t in enumerate(tuple_list) if results[i] is None]
+        found = self.result_store.get_many(key for _, key in missing)
+        reused = 0
+        for i, key in missing:
+            if key in found:
+                result = self.stored_result(found[key], tuple_list[i])
+                if result is not None:
+                    results[i] = result
+                    journal.append(i, result)
+                    reused += 1
+        return reused
+
+    def get_coalescer(self, items=None):
+        """
+        返回 (coalescer, 需要提交的任务)。给定 items 时预先合并其中的重复项；未开启合并时 coalescer 为 None。
+        """
+        if not self.coalesce:
+            return None, items
+        coalescer = PromptCoalescer(self.coalesce_key)
+        return coalescer, None if items is None else coalescer.preload(items)
+
+    def _report_dedup(self, coalescer):
+        if coalescer is None:
+            return
+        self.dedup_stats = coalescer.stats()
+        if coalescer.coalesced:
+            print(f"Coalesced {coalescer.tasks} tasks into {coalescer.requests} requests "
+                  f"(dedup ratio {self.dedup_stats['dedup_ratio']:.1%}).")
+
+    def tally(self, name):
+        with self._stats_lock:
+            self.repair_stats[name] += 1
+        self.count(name)
+
+    def _report_repair(self):
+        stats = self.repair_stats
+        if stats['parse_failed']:
+            print(f"Repaired {stats['repaired']}/{stats['parse_failed']} unparsable answers locally "
+                  f"({stats['repaired'] / stats['parse_failed']:.1%}).")
+        if stats['correction']:
+            print(f"LLM corrections succeeded {stats['corrected']}/{stats['correction']} "
+                  f"({stats['corrected'] / stats['correction']:.1%}).")
+
     def generate_correction_prompt(self, answer):
         return self.correction_template.format(answer=answer, data_template=self.data_template)
 
@@ -33,20 +180,113 @@ class MultiProcessor:
         input_dict = {f'input_{i+1}': input_data[i] for i in range(len(input_data))} 
         return self.parse_method(self.empty_template.format(**input_dict))
 
+    def get_offloader(self):
+        # 工作线程通过 parse_answer / check 并发调用，加锁保证只创建一个进程池
+        if self._offloader is None and self.cpu_processes:
+            with self._offloader_lock:
+                if self._offloader is None:
+                    self._offloader = CPUOffloader(self.parse_method, self.validator, self.cpu_processes)
+        return self._offloader
+
+    @staticmethod
+    def record_parse_error(llm):
+        # 解析失败计入该模型的 parse 错误，便于区分是模型还是解析的问题
+        provider, model = client_name(llm).split('/', 1)
+        get_metrics().record_error(provider, model, 'ask', 'parse')
+
+    def repair_answer(self, answer):
+        """
+        parse_method 失败后在本地修复并解析回答，成功时返回解析结果，否则返回 None。
+        """
+        if self.repair_type is None or not isinstance(answer, str):
+            return None
+        self.tally('parse_failed')
+        with self.stage('repair'):
+            try:
+                data = self.repair_parser.repair_literal(answer, self.repair_type)
+            except RuntimeError:
+                return None
+        self.tally('repaired')
+        return data
+
+    def parse_answer(self, llm, answer):
+        offloader = self.get_offloader()
+        try:
+            if offloader is not None:
+                return offloader.parse(answer)
+            return self.parse_method(answer)
+        except Exception:
+            self.record_parse_error(llm)
+            data = self.repair_answer(answer)
+            if data is None:
+                raise
+            return data
+
+    def check(self, data):
+        offloader = self.get_offloader()
+        if offloader is not None:
+            return offloader.validate(data)
+        return self.validator(data)
+
+    async def parse_answer_async(self, llm, answer):
+        offloader = self.get_offloader()
+        if offloader is None:
+            return self.parse_answer(llm, answer)
+        try:
+            return await asyncio.wrap_future(offloader.submit('parse', answer))
+        except Exception:
+            self.record_parse_error(llm)
+            data = self.repair_answer(answer)
+            if data is None:
+                raise
+            return data
+
+    async def check_async(self, data):
+        offloader = self.get_offloader()
+        if offloader is None:
+            return self.validator(data)
+        return await asyncio.wrap_future(offloader.submit('validate', data))
+
     def task_perform(self, llm, **kwargs):
         try:
-            prompt = self.generate_prompt(**kwargs)
-            answer = llm.ask(prompt)
-            structured_data = self.parse_method(answer)
+            with self.stage('generate_prompt'):
+                prompt = self.generate_prompt(**kwargs)
+            with self.stage('llm.ask'):
+                answer = llm.ask(prompt)
+            with self.stage('parse'):
+                structured_data = self.parse_answer(llm, answer)
             return structured_data
         except Exception as e:
             print(f"Error in task_perform: {str(e)}")
             raise e
 
     def correct_data(self, llm, answer):
+        self.tally('correction')
         correction_prompt = self.generate_correction_prompt(answer)
-        correction = llm.ask(correction_prompt)
-        return self.parse_method(correction)
+        with self.stage('correction.ask'):
+            correction = llm.ask(correction_prompt)
+        with self.stage('correction.parse'):
+            return self.parse_answer(llm, correction)
+
+    @staticmethod
+    def note_error(error):
+        # 供并发控制器判断本任务是否遇到了限流
+        state = _task_state.get()
+        if state is not None and classify_error(error) == '429':
+            state['throttled'] = True
+
+    def run_tuple(self, input_tuple, state):
+        token = _task_state.set(state)
+        start = time.perf_counter()
+        try:
+            with self.item(input_tuple):
+                result = self.process_tuple(input_tuple)
+            if result is None:
+                self.count('failed')
+            return result
+        finally:
+            state['latency'] = time.perf_counter() - start
+            _task_state.reset(token)
 
     def process_tuple(self, input_tuple):
         try:
@@ -61,23 +301,36 @@ class MultiProcessor:
                     input_dict = {f'input_{i+1}': input_data[i] for i in range(len(input_data))}
                     current_llm = self.back_up_llm if (use_backup and self.back_up_llm is not None) else self.llm
                     structured_data = self.task_perform(current_llm, **input_dict)
-                    if self.validator(structured_data):
+                    with self.stage('validate'):
+                        valid = self.check(structured_data)
+                    if valid:
                         return (structured_data, index)
                     corrected_answer = self.correct_data(current_llm, structured_data)
-                    if corrected_answer and self.validator(corrected_answer):
+                    with self.stage('correction.validate'):
+                        valid = corrected_answer and self.check(corrected_answer)
+                    if valid:
+                        self.tally('corrected')
                         return (corrected_answer, index)
                     break
                 except Exception as e:
+                    self.note_error(e)
+                    remaining = remaining_time()
+                    if remaining is not None and remaining <= 0:
+                        # 已超过截止时间，结果会被丢弃，不再重试
+                        break
                     if 'Throttling.RateQuota' in str(e):
                         wait_time = base_wait_time * (2 ** attempts) + random.uniform(0, 1)
                         print(f"Rate limit exceeded. Retrying in {wait_time:.2f} seconds. Attempt {attempts + 1}/2")
-                        time.sleep(wait_time)
+                        with self.stage('backoff'):
+                            time.sleep(wait_time if remaining is None else min(wait_time, remaining))
                     else:
                         print(f"An error occurred: {str(e)}. Attempt {attempts + 1}/2")
                     
                     attempts += 1
+                    self.count('retry')
                     if not use_backup and self.back_up_llm is not None:
                         use_backup = True
+                        self.count('fallback')
                         print("Switching to backup LLM to process:", input_data)
 
             return None  # 如果所有尝试都失败，返回 None
@@ -86,92 +339,642 @@ class MultiProcessor:
             print(f"Error occurred during process_tuple: {str(final_error)}")
             return None  # 返回 None 表示跳过这个任务
 
-    def save_checkpoint(self, results):
-        if not os.path.exists(self.checkpoint_dir):
-            os.makedirs(self.checkpoint_dir)
+    @staticmethod
+    async def ask_async(llm, prompt):
+        if hasattr(llm, 'ask_async'):
+            return await llm.ask_async(prompt)
+        # 没有异步接口的客户端放到线程里执行
+        return await asyncio.to_thread(llm.ask, prompt)
+
+    async def task_perform_async(self, llm, **kwargs):
+        try:
+            with self.stage('generate_prompt'):
+                prompt = self.generate_prompt(**kwargs)
+            with self.stage('llm.ask'):
+                answer = await self.ask_async(llm, prompt)
+            with self.stage('parse'):
+                return await self.parse_answer_async(llm, answer)
+        except Exception as e:
+            print(f"Error in task_perform: {str(e)}")
+            raise e
+
+    async def correct_data_async(self, llm, answer):
+        self.tally('correction')
+        correction_prompt = self.generate_correction_prompt(answer)
+        with self.stage('correction.ask'):
+            correction = await self.ask_async(llm, correction_prompt)
+        with self.stage('correction.parse'):
+            return await self.parse_answer_async(llm, correction)
+
+    async def process_tuple_async(self, input_tuple):
+        """
+        process_tuple 的协程版本，重试、纠错与备用 LLM 的逻辑相同。
+        """
+        try:
+            input_data = input_tuple[:-1]
+            index = input_tuple[-1]
+            attempts = 0
+            base_wait_time = 1
+            use_backup = False
+
+            while attempts < 2:
+                try:
+                    input_dict = {f'input_{i+1}': input_data[i] for i in range(len(input_data))}
+                    current_llm = self.back_up_llm if (use_backup and self.back_up_llm is not None) else self.llm
+                    structured_data = await self.task_perform_async(current_llm, **input_dict)
+                    with self.stage('validate'):
+                        valid = await self.check_async(structured_data)
+                    if valid:
+                        return (structured_data, index)
+                    corrected_answer = await self.correct_data_async(current_llm, structured_data)
+                    with self.stage('correction.validate'):
+                        valid = corrected_answer and await self.check_async(corrected_answer)
+                    if valid:
+                        self.tally('corrected')
+                        return (corrected_answer, index)
+                    break
+                except Exception as e:
+                    self.note_error(e)
+                    if 'Throttling.RateQuota' in str(e):
+                        wait_time = base_wait_time * (2 ** attempts) + random.uniform(0, 1)
+                        print(f"Rate limit exceeded. Retrying in {wait_time:.2f} seconds. Attempt {attempts + 1}/2")
+                        with self.stage('backoff'):
+                            await asyncio.sleep(wait_time)
+                    else:
+                        print(f"An error occurred: {str(e)}. Attempt {attempts + 1}/2")
+
+                    attempts += 1
+                    self.count('retry')
+                    if not use_backup and self.back_up_llm is not None:
+                        use_backup = True
+                        self.count('fallback')
+                        print("Switching to backup LLM to process:", input_data)
+
+            return None
+
+        except Exception as final_error:
+            print(f"Error occurred during process_tuple: {str(final_error)}")
+            return None
+
+    async def run_tuple_async(self, input_tuple, state):
+        # wait_for 到期时取消协程并关闭连接；deadline 让放到线程里的同步客户端也按时超时
+        _task_state.set(state)
+        start = time.perf_counter()
+        try:
+            with deadline(self.time_limit), self.item(input_tuple, lane=id(asyncio.current_task())):
+                result = await asyncio.wait_for(self.process_tuple_async(input_tuple), self.time_limit)
+            if result is None:
+                self.count('failed')
+            return result
+        finally:
+            state['latency'] = time.perf_counter() - start
 
-        # 直接覆写保存所有结果，包括None
-        with open(self.checkpoint_path, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=4)
+    def get_pool(self, num_threads):
+        # 工作线程在多次 multitask_perform 之间复用
+        if self._pool is None or self._pool.num_workers != num_threads:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+            self._pool = WorkerPool(num_threads, name='multiprocessor')
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+        if self._offloader is not None:
+            self._offloader.shutdown()
+            self._offloader = None
+
+    def get_journal(self, checkpoint=100):
+        return CheckpointJournal(self.checkpoint_path, fsync_every=checkpoint)
+
+    def save_checkpoint(self, results):
+        # 把完整结果写成快照（原子替换）并清空日志
+        with self.get_journal() as journal:
+            journal.compact(results)
         print(f"Checkpoint saved at {self.checkpoint_path}.")
 
     def load_checkpoint(self):
-        if os.path.exists(self.checkpoint_path):
-            with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return []
+        # 快照加上日志重放
+        return self.get_journal().replay()
 
-    def multitask_perform(self, tuple_list, num_threads, checkpoint=10, Active_Reload=False):
+    def _start_run(self, journal, tuple_list, Active_Reload):
+        # 进程池在提交任务前创建，避免多个工作线程同时创建
+        self.get_offloader()
+        if self.profiler is not None:
+            self.profiler.reset()
+        self.repair_stats = Counter()
         if Active_Reload:
-            # 加载之前的checkpoint结果
-            previous_results = self.load_checkpoint()
+            # 重放快照和日志恢复之前的结果
+            previous_results = journal.replay()[:len(tuple_list)]
             
             # 使用之前的结果初始化results
             results = previous_results + [None] * (len(tuple_list) - len(previous_results))
-            
-            # 找出未完成的任务
-            remaining_tuple_list = [t for i, t in enumerate(tuple_list) if i >= len(previous_results) or results[i] is None]
             print(f"原始数据数量: {len(tuple_list)}")
             print(f"已完成任务数量: {len([r for r in results if r is not None])}")
-            print(f"剩余待处理数据数量: {len(remaining_tuple_list)}")
         else:
             results = [None] * len(tuple_list)
-            remaining_tuple_list = tuple_list
+        if self.result_store is not None:
+            reused = self.reuse_stored(journal, results, tuple_list)
+            print(f"从结果库复用: {reused}")
+
+        # 找出未完成的任务及其位置
+        remaining = [(i, t) for i, t in enumerate(tuple_list) if results[i] is None]
+        if Active_Reload or self.result_store is not None:
+            print(f"剩余待处理数据数量: {len(remaining)}")
+        return results, remaining
 
-        queue = Queue()
-        checkpoint_counter = 0
+    def _finish_task(self, journal, results, idx, input_tuple, result, compact_every):
+        # 进度之外的结果登记和检查点只在这里更新，调用方保证单线程调用
+        if result is None:
+            print(f"Skipping task for {input_tuple}")
+            empty_response = self.generate_empty_response(input_tuple)
+            results[idx] = (empty_response, input_tuple[-1])
+        else:
+            results[idx] = result
+            self.store_result(input_tuple, result)
 
-        for idx, input_tuple in enumerate(remaining_tuple_list):
-            queue.put((input_tuple, idx + (len(results) - len(remaining_tuple_list))))
+        journal.append(idx, results[idx])
+        if compact_every and journal.appended % compact_every == 0:
+            journal.compact(results)
 
-        def worker(pbar):
-            nonlocal checkpoint_counter
-            while not queue.empty():
-                input_tuple, idx = queue.get()
-                result = None
-                thread_result_queue = Queue()
-
-                thread = threading.Thread(target=lambda q, arg1: q.put(self.process_tuple(arg1)), args=(thread_result_queue, input_tuple))
-                thread.start()
-                thread.join(timeout=self.time_limit)
-
-                if thread.is_alive():
-                    print(f"Thread processing {input_tuple} timed out.")
-                    thread.join()
-                else:
-                    if not thread_result_queue.empty():
-                        result = thread_result_queue.get()
+    def _end_run(self, journal, results):
+        self._report_repair()
+        self.report_profile()
+        print("Final save_checkpoint call")
+        journal.compact(results)
+        print(f"Checkpoint saved at {self.checkpoint_path}.")
+
+    @staticmethod
+    def _observe(controller, state, timed_out):
+        if timed_out:
+            controller.on_congestion('timeout')
+        elif state['throttled']:
+            controller.on_congestion('throttled')
+        elif state['latency'] is not None:
+            controller.on_success(state['latency'])
+
+    def multitask_perform(self, tuple_list, num_threads, checkpoint=10, Active_Reload=False, compact_every=None, engine='threads',
+                          adaptive=False):
+        """
+        每完成一个任务向检查点日志追加一条记录，每 checkpoint 条 fsync 一次；
+        结束时（以及设置 compact_every 时每隔该条数）把日志压缩进快照 checkpoint.json。
+        engine='asyncio' 时改用 multitask_perform_async，num_threads 作为并发协程数。
+        adaptive=True 时由 AIMDController 调整在途任务数，num_threads 为上限，当前上限显示在进度条上。
+        """
+        if engine == 'asyncio':
+            async def run():
+                try:
+                    return await self.multitask_perform_async(tuple_list, num_threads, checkpoint, Active_Reload, compact_every,
+                                                              adaptive)
+                finally:
+                    await aclose_async_client()
+            return asyncio.run(run())
+        elif engine != 'threads':
+            raise ValueError(f"Unknown engine: {engine}")
+
+        journal = self.get_journal(checkpoint).open(reset=not Active_Reload)
+        try:
+            results, remaining = self._start_run(journal, tuple_list, Active_Reload)
+            coalescer, leaders = self.get_coalescer(remaining)
+            with tqdm(total=len(remaining)) as pbar:
+                for idx, input_tuple, result in self._iter_threads(iter(leaders), min(num_threads, len(leaders)), adaptive, pbar,
+                                                                   coalescer=coalescer):
+                    self._finish_task(journal, results, idx, input_tuple, result, compact_every)
+                    pbar.update(1)
+            self._report_dedup(coalescer)
+            self._end_run(journal, results)
+        finally:
+            journal.close()
+
+        return results
+
+    def render_batch_item(self, input_tuple):
+        input_data = input_tuple[:-1]
+        input_dict = {f'input_{i+1}': input_data[i] for i in range(len(input_data))}
+        return self.prompt_template.format(data_template=DATA_TEMPLATE_REFERENCE, **input_dict)
+
+    def run_batch(self, prompt, batch, batcher):
+        """
+        发送一个批量提示词，按编号拆分回答并逐个解析、校验。返回 (回答, {位置: 结果})，未通过的任务结果为 None。
+        """
+        with self.batch_item(batch):
+            with self.stage('batch.ask'):
+                answer = self.llm.ask(prompt)
+            outcomes = {}
+            with self.stage('batch.parse'):
+                pieces = batcher.split(answer)
+                for number, (idx, input_tuple, _) in enumerate(batch, 1):
+                    outcomes[idx] = None
+                    if number not in pieces:
+                        continue
+                    try:
+                        data = self.parse_answer(self.llm, pieces[number])
+                        if self.check(data):
+                            outcomes[idx] = (data, input_tuple[-1])
+                    except Exception:
+                        pass
+        return answer, outcomes
+
+    def batch_perform(self, tuple_list, num_threads, max_batch=8, token_budget=4000, checkpoint=10, Active_Reload=False,
+                      compact_every=None):
+        """
+        multitask_perform 的批量版本，适合提示词很短的分类、抽取任务：每个请求打包多个任务，data_template 只发送一次，
+        回答按 =start_pad_i= / =end_pad_i= 拆回各个任务。拆分、解析或校验失败的任务单独重新排队，
+        走 process_tuple 的纠错、重试和备用 LLM 流程。每批的任务数由 MicroBatcher 按 token_budget 和成功率调整，
+        当前批大小显示在进度条上；检查点与返回值和 multitask_perform 相同。
+        """
+        journal = self.get_journal(checkpoint).open(reset=not Active_Reload)
+        try:
+            results, remaining = self._start_run(journal, tuple_list, Active_Reload)
+            coalescer, leaders = self.get_coalescer(remaining)
+            batcher = MicroBatcher(self.data_template, max_batch=max_batch, token_budget=token_budget)
+            pool = self.get_pool(max(1, min(num_threads, len(leaders))))
+            queue = deque(leaders)
+            singles = deque()
+            done_queue = Queue()
+            tasks = {}
+
+            def fill():
+                while len(tasks) < pool.num_workers:
+                    if singles:
+                        idx, input_tuple = singles.popleft()
+                        state = {'throttled': False, 'latency': None}
+                        future = pool.submit(self.run_tuple, input_tuple, state, timeout=self.time_limit)
+                        tasks[future] = (None, [(idx, input_tuple, None)])
+                    elif queue:
+                        # 提示词渲染失败的任务单独走 run_tuple，与线程引擎一样失败后得到空模板，不影响其他任务
+                        rejected = []
+                        batch = batcher.take(queue, self.render_batch_item, rejected)
+                        singles.extend(rejected)
+                        if not batch:
+                            continue
+                        prompt = batcher.build_prompt([item_prompt for _, _, item_prompt in batch])
+                        future = pool.submit(self.run_batch, prompt, batch, batcher, timeout=self.time_limit)
+                        tasks[future] = (prompt, batch)
+                    else:
+                        return
+                    future.add_done_callback(done_queue.put)
+
+            def finish(idx, input_tuple, result):
+                completed = [(idx, input_tuple, result)] if coalescer is None else coalescer.resolve(idx, input_tuple, result)
+                for idx, input_tuple, result in completed:
+                    self._finish_task(journal, results, idx, input_tuple, result, compact_every)
+                    pbar.update(1)
+
+            fallback = 0
+            with tqdm(total=len(remaining)) as pbar:
+                fill()
+                while tasks:
+                    future = done_queue.get()
+                    prompt, batch = tasks.pop(future)
+                    if prompt is None:
+                        idx, input_tuple, _ = batch[0]
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            print(f"No result obtained for {input_tuple}: {e}")
+                            result = None
+                        finish(idx, input_tuple, result)
+                    else:
+                        try:
+                            answer, outcomes = future.result()
+                        except Exception as e:
+                            # 整批请求失败：多于一个任务时缩小批次放回队首，否则改为单独请求
+                            print(f"Batched request for {len(batch)} tasks failed: {e}")
+                            batcher.observe(len(batch), 0)
+                            if len(batch) > 1:
+                                queue.extendleft((idx, input_tuple) for idx, input_tuple, _ in reversed(batch))
+                            else:
+                                singles.append(batch[0][:2])
+                                fallback += 1
+                        else:
+                            batcher.observe(len(batch), sum(result is not None for result in outcomes.values()), answer)
+                            for idx, input_tuple, _ in batch:
+                                if outcomes[idx] is None:
+                                    singles.append((idx, input_tuple))
+                                    fallback += 1
+                                else:
+                                    finish(idx, input_tuple, outcomes[idx])
+                        pbar.set_postfix(batch=batcher.k, refresh=False)
+                    fill()
+
+            self.batch_stats = dict(batcher.stats(), fallback=fallback)
+            print(f"Packed {batcher.items} tasks into {batcher.batches} batched requests "
+                  f"({self.batch_stats['mean_batch']:.1f} per request); {fallback} tasks fell back to single requests.")
+            self._report_dedup(coalescer)
+            self._end_run(journal, results)
+        finally:
+            journal.close()
+
+        return results
+
+    def perform_one(self, input_tuple):
+        """
+        在当前线程中处理单个输入元组并返回结果，失败时返回空模板，供 Pipeline 等自行管理线程的调用方使用。
+        开启 coalesce 时，与其他线程中在途任务提示词相同的任务等待其结果，不再重复请求。
+        """
+        if self.result_store is not None:
+            stored = self.result_store.get(self.result_key(input_tuple))
+            result = None if stored is None else self.stored_result(stored, input_tuple)
+            if result is not None:
+                return result
+        key = self.coalesce_key(input_tuple) if self.coalesce else None
+        leader = None
+        if key is not None:
+            with self._inflight_lock:
+                future = self._inflight.get(key)
+                if future is None:
+                    future = leader = self._inflight[key] = Future()
+            if leader is None:
+                result = future.result()
+                return (copy.deepcopy(result[0]), input_tuple[-1])
+        try:
+            with deadline(self.time_limit):
+                result = self.run_tuple(input_tuple, {'throttled': False, 'latency': None})
+            self.store_result(input_tuple, result)
+            if result is None:
+                print(f"Skipping task for {input_tuple}")
+                result = (self.generate_empty_response(input_tuple), input_tuple[-1])
+        except BaseException as e:
+            if leader is not None:
+                leader.set_exception(e)
+            raise
+        finally:
+            if leader is not None:
+                with self._inflight_lock:
+                    del self._inflight[key]
+        if leader is not None:
+            leader.set_result(result)
+        return result
+
+    def serve_queue(self, queue, num_threads, worker_id=None, max_attempts=3, poll_interval=1.0, exit_when_empty=True):
+        """
+        作为分布式任务的一个工作节点，从共享队列（SQLiteWorkQueue / RedisWorkQueue）领取任务，用本机线程池执行，
+        处理期间定期续约，完成后把结果（重试后仍未通过校验时为空模板）ack 回队列，结果由 JobCoordinator 合并。
+        超时或抛出异常的任务放弃租约，留给之后的领取重试；领取次数超过 max_attempts 的任务（多次让节点崩溃或超时）直接提交空模板。
+        exit_when_empty=True 时所有任务都有结果后返回，否则一直等待新任务。返回本节点提交的结果数。
+        """
+        worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}'
+        pool = self.get_pool(num_threads)
+        heartbeat_interval = queue.lease_seconds / 3
+        done_queue = Queue()
+        tasks = {}
+        acked = 0
+        last_heartbeat = time.monotonic()
+
+        def ack(idx, input_tuple, result):
+            if result is None:
+                print(f"Skipping task for {input_tuple}")
+                result = (self.generate_empty_response(input_tuple), input_tuple[-1])
+            queue.ack(worker_id, idx, result)
+
+        def lookup(input_tuple):
+            if self.result_store is None:
+                return None
+            stored = self.result_store.get(self.result_key(input_tuple))
+            return None if stored is None else self.stored_result(stored, input_tuple)
+
+        try:
+            while True:
+                if len(tasks) < pool.num_workers:
+                    for idx, input_tuple, attempts in queue.lease(worker_id, pool.num_workers - len(tasks)):
+                        if attempts > max_attempts:
+                            ack(idx, input_tuple, None)
+                            acked += 1
+                            continue
+                        stored = lookup(input_tuple)
+                        if stored is not None:
+                            ack(idx, input_tuple, stored)
+                            acked += 1
+                            continue
+                        state = {'throttled': False, 'latency': None}
+                        future = pool.submit(self.run_tuple, input_tuple, state, timeout=self.time_limit)
+                        tasks[future] = (idx, input_tuple)
+                        future.add_done_callback(done_queue.put)
+
+                if not tasks:
+                    counts = queue.counts()
+                    if exit_when_empty and counts['done'] >= counts['total']:
+                        break
+                    if counts['leased'] == 0:
+                        # 刚才没有领到任务、也没有在租的任务，却还没全部完成，说明有任务丢失（RedisWorkQueue 在 LPOP 后崩溃），找回后继续
+                        queue.requeue_missing()
+                    # 其他节点的租约到期后任务会重新变为空闲
+                    time.sleep(poll_interval)
+                    continue
+
+                try:
+                    future = done_queue.get(timeout=min(poll_interval, heartbeat_interval))
+                except Empty:
+                    future = None
+                while future is not None:
+                    idx, input_tuple = tasks.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # 超时等异常不代表任务本身无解，放弃租约让任务重新排队，超过 max_attempts 后才提交空模板
+                        print(f"No result obtained for {input_tuple}, releasing it: {e}")
+                        queue.release(worker_id, [idx])
                     else:
-                        print(f"No result obtained for {input_tuple}")
+                        self.store_result(input_tuple, result)
+                        ack(idx, input_tuple, result)
+                        acked += 1
+                    future = None if done_queue.empty() else done_queue.get()
+
+                if tasks and time.monotonic() - last_heartbeat >= heartbeat_interval:
+                    queue.heartbeat(worker_id, [idx for idx, _ in tasks.values()])
+                    last_heartbeat = time.monotonic()
+        finally:
+            if tasks:
+                # 异常退出时放弃未完成任务的租约，其他节点可以立即领取
+                for future in tasks:
+                    future.cancel()
+                queue.release(worker_id, [idx for idx, _ in tasks.values()])
+
+        print(f"Worker {worker_id} acknowledged {acked} tasks.")
+        return acked
 
+    def iter_perform(self, iterable, num_threads, ordered=False, max_pending=None, adaptive=False):
+        """
+        multitask_perform 的流式版本：从任意可迭代对象中按需读取输入元组，每完成一个任务就产出 (result, index)，
+        result 与 multitask_perform 返回列表中的元素相同，index 为输入在 iterable 中的位置。
+        同时在途和等待重排的任务不超过 max_pending 个（默认 num_threads 的 4 倍），内存占用与输入总量无关；
+        ordered=True 时按输入顺序产出，先完成的结果在重排缓冲区中等待前面的任务。
+        不写检查点，结果由调用方在下游落盘；提前停止迭代时取消尚未开始的任务。
+        """
+        self.get_offloader()
+        if self.profiler is not None:
+            self.profiler.reset()
+        max_pending = max_pending or num_threads * 4
+        buffer = {}
+        next_index = 0
+        pending = enumerate(iterable)
+        # 重排缓冲区计入在途上限，避免一个慢任务让缓冲区无限增长
+        admit = lambda in_flight: in_flight + len(buffer) < max_pending
+        total = len(iterable) if hasattr(iterable, '__len__') else None
+        # 输入是惰性读取的，只合并排队或在途期间出现的相同提示词
+        coalescer, _ = self.get_coalescer()
+
+        with tqdm(total=total) as pbar:
+            for idx, input_tuple, result in self._iter_threads(pending, num_threads, adaptive, pbar, admit, coalescer):
                 if result is None:
                     print(f"Skipping task for {input_tuple}")
-                    empty_response = self.generate_empty_response(input_tuple)
-                    results[idx] = (empty_response, input_tuple[-1])
-                else:
-                    results[idx] = result
-
-                queue.task_done()
+                    result = (self.generate_empty_response(input_tuple), input_tuple[-1])
                 pbar.update(1)
+                if not ordered:
+                    yield result, idx
+                    continue
+                buffer[idx] = result
+                while next_index in buffer:
+                    yield buffer.pop(next_index), next_index
+                    next_index += 1
+        self._report_dedup(coalescer)
+        self.report_profile()
 
-                checkpoint_counter += 1
-                if checkpoint_counter % checkpoint == 0:
-                    print(f"Saving checkpoint at counter {checkpoint_counter}")
-                    self.save_checkpoint(results)
+    def _iter_threads(self, pending, num_threads, adaptive, pbar, admit=None, coalescer=None):
+        """
+        在线程池上执行 pending 中的 (位置, 输入元组)，按完成顺序产出 (位置, 输入元组, 结果)，失败或超时的结果为 None。
+        admit(在途任务数) 返回 False 时暂停读取新的输入，超时重试的任务不受限制。
+        给定 coalescer 时与在途任务提示词相同的输入不再提交，随 leader 一起产出。
+        """
+        pool = self.get_pool(max(1, num_threads))
+        controller = AIMDController(pool.num_workers) if adaptive else None
+        done_queue = Queue()
+        tasks = {}
+        retry = []
 
-        with tqdm(total=len(remaining_tuple_list)) as pbar:
-            threads = []
-            for _ in range(min(num_threads, len(remaining_tuple_list))):
-                thread = threading.Thread(target=worker, args=(pbar,))
-                threads.append(thread)
-                thread.start()
+        def submit(input_tuple, idx, retries):
+            state = {'throttled': False, 'latency': None}
+            future = pool.submit(self.run_tuple, input_tuple, state, timeout=self.time_limit)
+            tasks[future] = (input_tuple, idx, retries, state)
+            future.add_done_callback(done_queue.put)
 
-            queue.join()
+        def fill():
+            # 在途任务数不超过当前并发上限
+            limit = controller.limit if controller is not None else pool.num_workers
+            while len(tasks) < limit:
+                if retry:
+                    submit(*retry.pop())
+                    continue
+                waiting = coalescer.waiting if coalescer is not None else 0
+                if admit is not None and not admit(len(tasks) + waiting):
+                    return
+                item = next(pending, None)
+                if item is None:
+                    return
+                if coalescer is None or coalescer.add(*item):
+                    submit(item[1], item[0], 0)
 
-            for thread in threads:
-                thread.join()
+        try:
+            fill()
+            while tasks:
+                future = done_queue.get()
+                input_tuple, idx, retries, state = tasks.pop(future)
+                result = None
+                timed_out = False
+                resubmitted = False
+                try:
+                    result = future.result()
+                except TimeoutError:
+                    timed_out = True
+                    if retries < self.timeout_retries:
+                        print(f"Task for {input_tuple} timed out. Resubmitting ({retries + 1}/{self.timeout_retries}).")
+                        retry.append((input_tuple, idx, retries + 1))
+                        resubmitted = True
+                except Exception as e:
+                    print(f"No result obtained for {input_tuple}: {e}")
 
-        print("Final save_checkpoint call")
-        self.save_checkpoint(results)
+                if controller is not None:
+                    self._observe(controller, state, timed_out)
+                    pbar.set_postfix(limit=controller.limit, refresh=False)
+                if not resubmitted:
+                    if timed_out:
+                        print(f"Thread processing {input_tuple} timed out.")
+                    if coalescer is None:
+                        yield idx, input_tuple, result
+                    else:
+                        yield from coalescer.resolve(idx, input_tuple, result)
+                fill()
+        finally:
+            # 调用方提前停止迭代时，排队中的任务不再执行
+            for future in tasks:
+                future.cancel()
+
+        if controller is not None:
+            print(f"Concurrency limit ended at {controller.limit} after {controller.decreases} decreases.")
+
+    async def multitask_perform_async(self, tuple_list, concurrency=1000, checkpoint=10, Active_Reload=False, compact_every=None,
+                                      adaptive=False):
+        """
+        multitask_perform 的 asyncio 版本：每个任务是一个协程，同时在途的任务不超过 concurrency 个，
+        超时由 asyncio.wait_for 取消；进度条和检查点只在主协程中更新。
+        LLM 有 ask_async 时直接使用，否则在默认线程池中调用 ask（并发受线程池大小限制）。
+        """
+        journal = self.get_journal(checkpoint).open(reset=not Active_Reload)
+        try:
+            results, remaining = self._start_run(journal, tuple_list, Active_Reload)
+            controller = AIMDController(concurrency) if adaptive else None
+            coalescer, leaders = self.get_coalescer(remaining)
+            done_queue = asyncio.Queue()
+            tasks = {}
+            pending = iter(leaders)
+            retry = []
+
+            def submit(input_tuple, idx, retries):
+                state = {'throttled': False, 'latency': None}
+                task = asyncio.ensure_future(self.run_tuple_async(input_tuple, state))
+                tasks[task] = (input_tuple, idx, retries, state)
+                task.add_done_callback(done_queue.put_nowait)
+
+            def fill():
+                limit = controller.limit if controller is not None else concurrency
+                while len(tasks) < limit:
+                    if retry:
+                        submit(*retry.pop())
+                        continue
+                    item = next(pending, None)
+                    if item is None:
+                        return
+                    if coalescer is None or coalescer.add(*item):
+                        submit(item[1], item[0], 0)
+
+            with tqdm(total=len(remaining)) as pbar:
+                fill()
+                while tasks:
+                    task = await done_queue.get()
+                    input_tuple, idx, retries, state = tasks.pop(task)
+                    result = None
+                    timed_out = False
+                    resubmitted = False
+                    try:
+                        result = task.result()
+                    except asyncio.TimeoutError:
+                        timed_out = True
+                        if retries < self.timeout_retries:
+                            print(f"Task for {input_tuple} timed out. Resubmitting ({retries + 1}/{self.timeout_retries}).")
+                            retry.append((input_tuple, idx, retries + 1))
+                            resubmitted = True
+                    except Exception as e:
+                        print(f"No result obtained for {input_tuple}: {e}")
+
+                    if controller is not None:
+                        self._observe(controller, state, timed_out)
+                        pbar.set_postfix(limit=controller.limit, refresh=False)
+                    if not resubmitted:
+                        if timed_out:
+                            print(f"Task processing {input_tuple} timed out.")
+                        completed = [(idx, input_tuple, result)] if coalescer is None else coalescer.resolve(idx, input_tuple, result)
+                        for idx, input_tuple, result in completed:
+                            self._finish_task(journal, results, idx, input_tuple, result, compact_every)
+                            pbar.update(1)
+                    fill()
+
+            if controller is not None:
+                print(f"Concurrency limit ended at {controller.limit} after {controller.decreases} decreases.")
+            self._report_dedup(coalescer)
+            self._end_run(journal, results)
+        finally:
+            journal.close()
 
         return results
\ No newline at end of file
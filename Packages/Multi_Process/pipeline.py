@@ -0,0 +1,206 @@
+import time
+import threading
+from queue import Queue, Empty
+
+# 流结束标记，每个阶段的全部工作线程都结束后向下游发送一次
+_END = object()
+
+
+class Stage:
+    """
+    流水线中的一个阶段。fn 处理单个元素（batch_size 为 None）或一批元素（凑满 batch_size 个或等待超过 max_wait 秒时提交），
+    flat=True 时返回值是可迭代对象，其中每个元素分别送往下游。
+
+    参数:
+    name (str): 阶段名。
+    fn: 处理函数。
+    workers (int): 本阶段的工作线程数。
+    queue_size (int): 本阶段输入队列的容量，队列满时上游阻塞（背压）。
+    batch_size (int): 批处理阶段每批的元素数上限。
+    max_wait (float): 批处理阶段凑批的最长等待时间（秒）。
+    flat (bool): 是否展开返回值。
+    """
+
+    def __init__(self, name, fn, workers=1, queue_size=None, batch_size=None, max_wait=0.5, flat=False):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue = Queue(maxsize=queue_size if queue_size is not None else max(2 * workers, 2 * (batch_size or 1)))
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.flat = flat
+        self.received = 0
+        self.emitted = 0
+        self.errors = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+        self._running = workers
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'received': self.received,
+                'emitted': self.emitted,
+                'errors': self.errors,
+                'busy': self.busy,
+                'queued': self.queue.qsize(),
+            }
+
+
+class Pipeline:
+    """
+    由有界队列连接的多阶段流水线：每个阶段有自己的线程数和输入队列，元素处理完立即进入下一阶段，
+    下游跟不上时上游在队列满处阻塞。端到端耗时接近最慢的阶段，而不是各阶段耗时之和。
+    元素在阶段间不保序，需要对齐时让元素自带位置（如输入元组的最后一个元素）。
+    某个元素在某阶段出错时打印错误并丢弃该元素，不影响其他元素。
+
+    用法:
+    pipeline = Pipeline()
+    pipeline.add_processor('extract', extractor, workers=32, flat=False)
+    pipeline.add_batch('embed', data_processor.convertor_stream(llm), batch_size=256, max_wait=1.0)
+    pipeline.add_processor('explain', explainer, workers=32)
+    for result in pipeline.run(tuple_list):
+        ...
+    """
+
+    def __init__(self):
+        self.stages = []
+        self._started = None
+
+    def add(self, name, fn, workers=1, queue_size=None, flat=False):
+        self.stages.append(Stage(name, fn, workers, queue_size, flat=flat))
+        return self
+
+    def add_batch(self, name, fn, batch_size, max_wait=0.5, workers=1, queue_size=None, flat=True):
+        """
+        批处理阶段：fn 接收一批元素的列表，默认把返回的列表展开送往下游。
+        """
+        self.stages.append(Stage(name, fn, workers, queue_size, batch_size=batch_size, max_wait=max_wait, flat=flat))
+        return self
+
+    def add_processor(self, name, processor, workers, queue_size=None, flat=False):
+        """
+        MultiProcessor 阶段：对每个输入元组调用 processor.perform_one，输出与 multitask_perform 结果列表中的元素相同。
+        """
+        return self.add(name, processor.perform_one, workers, queue_size, flat)
+
+    def run(self, source):
+        """
+        从 source 中读取元素送入第一个阶段，按完成顺序产出最后一个阶段的输出。
+        """
+        if not self.stages:
+            yield from source
+            return
+        output = Queue(maxsize=max(2, 2 * self.stages[-1].workers))
+        for stage in self.stages:
+            stage._running = stage.workers
+        threads = [threading.Thread(target=self._feed, args=(source,), name='pipeline-source', daemon=True)]
+        for position, stage in enumerate(self.stages):
+            downstream = self.stages[position + 1].queue if position + 1 < len(self.stages) else output
+            target = self._work_batches if stage.batch_size else self._work
+            for i in range(stage.workers):
+                threads.append(threading.Thread(target=target, args=(stage, downstream), name=f'pipeline-{stage.name}-{i}',
+                                                daemon=True))
+        self._started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        while True:
+            item = output.get()
+            if item is _END:
+                break
+            yield item
+
+    def _feed(self, source):
+        first = self.stages[0]
+        try:
+            for item in source:
+                first.queue.put(item)
+        except Exception as e:
+            print(f"Pipeline source failed: {e}")
+        finally:
+            for _ in range(first.workers):
+                first.queue.put(_END)
+
+    @staticmethod
+    def _emit(stage, downstream, result):
+        items = list(result) if stage.flat else [result]
+        for item in items:
+            downstream.put(item)
+        with stage._lock:
+            stage.emitted += len(items)
+
+    def _call(self, stage, downstream, argument, size):
+        start = time.perf_counter()
+        try:
+            result = stage.fn(argument)
+        except Exception as e:
+            print(f"Stage {stage.name} failed on {size} item(s): {e}")
+            with stage._lock:
+                stage.errors += size
+                stage.busy += time.perf_counter() - start
+            return
+        with stage._lock:
+            stage.busy += time.perf_counter() - start
+        self._emit(stage, downstream, result)
+
+    def _work(self, stage, downstream):
+        while True:
+            item = stage.queue.get()
+            if item is _END:
+                break
+            with stage._lock:
+                stage.received += 1
+            self._call(stage, downstream, item, 1)
+        self._finish(stage, downstream)
+
+    def _work_batches(self, stage, downstream):
+        finished = False
+        while not finished:
+            item = stage.queue.get()
+            if item is _END:
+                break
+            batch = [item]
+            flush_at = time.monotonic() + stage.max_wait
+            while len(batch) < stage.batch_size:
+                remaining = flush_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = stage.queue.get(timeout=remaining)
+                except Empty:
+                    break
+                if item is _END:
+                    finished = True
+                    break
+                batch.append(item)
+            with stage._lock:
+                stage.received += len(batch)
+            self._call(stage, downstream, batch, len(batch))
+        self._finish(stage, downstream)
+
+    def _finish(self, stage, downstream):
+        # 本阶段最后一个结束的线程通知下游
+        with stage._lock:
+            stage._running -= 1
+            last = stage._running == 0
+        if last:
+            position = self.stages.index(stage)
+            workers = self.stages[position + 1].workers if position + 1 < len(self.stages) else 1
+            for _ in range(workers):
+                downstream.put(_END)
+
+    def stats(self):
+        """
+        各阶段的收发数量、错误数、累计处理耗时和当前排队数；busy / workers 最大的阶段即为瓶颈。
+        """
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def summary(self):
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        lines = [f"{'stage':<16} {'workers':>7} {'in':>7} {'out':>7} {'errors':>6} {'busy_s':>8} {'util':>6}"]
+        for name, stats in self.stats().items():
+            utilization = stats['busy'] / (stats['workers'] * elapsed) if elapsed else 0.0
+            lines.append(f"{name:<16} {stats['workers']:>7} {stats['received']:>7} {stats['emitted']:>7} "
+                         f"{stats['errors']:>6} {stats['busy']:>8.2f} {utilization:>6.1%}")
+        return '\n'.join(lines)
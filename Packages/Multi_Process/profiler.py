@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import threading
+import contextlib
+import contextvars
+import collections
+
+from Packages.LLM_API.metrics import Histogram, LATENCY_BUCKETS
+
+# 生成提示词、解析、校验通常在微秒到毫秒级，在请求延迟的桶之前补上细分的桶
+STAGE_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3) + LATENCY_BUCKETS
+
+# 时间线中的行：线程引擎为工作线程，asyncio 引擎为任务位置（协程在同一线程上交错执行）
+_lane = contextvars.ContextVar('profiler_lane', default=None)
+# 当前任务的位置，写入时间线事件的参数
+_item = contextvars.ContextVar('profiler_item', default=None)
+# 最内层的阶段名，用于区分直接属于任务的阶段和嵌套在其他阶段中的阶段（如 parse 中的 repair）
+_parent = contextvars.ContextVar('profiler_parent', default=None)
+
+
+class StageProfiler:
+    """
+    MultiProcessor 的分阶段计时：记录每个任务在 generate_prompt、llm.ask、parse、validate、纠错轮次和退避等待上的耗时，
+    以及纠错、重试、切换备用 LLM 和失败的次数。summary 输出汇总表，write_chrome_trace 输出可以在
+    chrome://tracing 或 Perfetto 中打开的时间线。耗时分位数用与 MetricsRegistry 相同的直方图估算，内存与任务数无关；
+    只有 trace=True 时才保留每个事件。
+
+    参数:
+    trace (bool): 是否保留时间线事件。
+    max_events (int): 时间线事件数上限，超过后不再记录。
+    """
+
+    def __init__(self, trace=False, max_events=1000000):
+        self.trace = trace
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stages = collections.OrderedDict()
+            self._counters = collections.Counter()
+            self._events = []
+            self._origin = time.perf_counter()
+            self._nested = set()
+            self._top_level_total = 0.0
+            self.items = 0
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        parent = _parent.get()
+        token = _parent.set(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            _parent.reset(token)
+            self.add(name, start, end, parent)
+
+    @contextlib.contextmanager
+    def item(self, index, lane=None, count=1):
+        """
+        包住一个任务的全部处理，lane 为时间线中的行，默认当前线程。一次处理多个任务（批量请求）时 count 为任务数。
+        """
+        item_token = _item.set(index)
+        lane_token = _lane.set(lane)
+        parent_token = _parent.set(None)
+        try:
+            with self.stage('item'):
+                yield
+        finally:
+            _parent.reset(parent_token)
+            _lane.reset(lane_token)
+            _item.reset(item_token)
+            with self._lock:
+                self.items += count
+
+    def add(self, name, start, end, parent='item'):
+        """
+        记录一次阶段耗时。parent 为外层阶段名，只有直接属于任务（parent 为 'item'）的阶段计入 other 的扣除，
+        嵌套阶段的耗时已经包含在外层阶段中。
+        """
+        with self._lock:
+            histogram = self._stages.get(name)
+            if histogram is None:
+                histogram = self._stages[name] = Histogram(STAGE_BUCKETS)
+            histogram.observe(end - start)
+            if parent == 'item':
+                self._top_level_total += end - start
+            elif parent is not None:
+                self._nested.add(name)
+            if self.trace and len(self._events) < self.max_events:
+                lane = _lane.get()
+                self._events.append({
+                    'name': name,
+                    'ph': 'X',
+                    'ts': (start - self._origin) * 1e6,
+                    'dur': (end - start) * 1e6,
+                    'pid': os.getpid(),
+                    'tid': lane if lane is not None else threading.get_ident(),
+                    'args': {'index': _item.get()},
+                })
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def snapshot(self):
+        with self._lock:
+            item_total = self._stages['item'].sum if 'item' in self._stages else 0.0
+            stages = {}
+            for name, histogram in self._stages.items():
+                stages[name] = {
+                    'calls': histogram.count,
+                    'total': histogram.sum,
+                    'mean': histogram.sum / histogram.count if histogram.count else None,
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95),
+                    'share': histogram.sum / item_total if item_total and name != 'item' else None,
+                    'nested': name in self._nested,
+                }
+            rates = {name: value / self.items if self.items else 0.0 for name, value in self._counters.items()}
+            # 任务总耗时中不属于任何阶段的部分：排队等待事件循环、日志输出等。只扣除直接属于任务的阶段，嵌套阶段不重复扣除
+            other = item_total - self._top_level_total
+            return {'items': self.items, 'stages': stages, 'other': max(0.0, other), 'counters': dict(self._counters),
+                    'rates': rates}
+
+    def summary(self):
+        """
+        返回汇总表：每个阶段的调用次数、总耗时、平均与分位数耗时、占任务总耗时的比例，以及各计数占任务数的比例。
+        嵌套在其他阶段中的阶段名前加 ' · '，其耗时已包含在外层阶段中。
+        """
+        snapshot = self.snapshot()
+        lines = [f"{'stage':<18} {'calls':>7} {'total_s':>9} {'mean_ms':>9} {'p50_ms':>8} {'p95_ms':>8} {'share':>7}"]
+        for name, stage in snapshot['stages'].items():
+            share = '-' if stage['share'] is None else f"{stage['share']:.1%}"
+            label = f' · {name}' if stage['nested'] else name
+            lines.append(f"{label:<18} {stage['calls']:>7} {stage['total']:>9.2f} {_ms(stage['mean']):>9} "
+                         f"{_ms(stage['p50']):>8} {_ms(stage['p95']):>8} {share:>7}")
+        item_total = snapshot['stages']['item']['total'] if 'item' in snapshot['stages'] else 0.0
+        if item_total:
+            lines.append(f"{'(other)':<18} {'':>7} {snapshot['other']:>9.2f} {'':>9} {'':>8} {'':>8} "
+                         f"{snapshot['other'] / item_total:>7.1%}")
+        for name, value in snapshot['counters'].items():
+            lines.append(f"{name:<18} {value:>7} ({snapshot['rates'][name]:.1%} of {snapshot['items']} items)")
+        return '\n'.join(lines)
+
+    def write_chrome_trace(self, path):
+        with self._lock:
+            events = list(self._events)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        return len(events)
+
+
+def _ms(value):
+    return '-' if value is None else f'{value * 1000:.1f}'
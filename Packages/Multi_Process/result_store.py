@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+class ResultStore:
+    """
+    按内容寻址的持久化结果库：以 (prompt_template, data_template, 输入数据, 模型) 的哈希为键保存通过校验的结果，
+    与任务在 tuple_list 中的位置无关。输入列表插入、删除或重新排序后，已有结果的输入仍能直接复用，
+    只有内容变化的输入需要重新处理。结果不含标识（输入元组的最后一个元素），取出时换成当前输入的。
+    使用 WAL 模式，多个线程、进程可以共享同一个库文件。
+
+    参数:
+    path (str): 数据库文件路径。
+    """
+
+    LOOKUP_CHUNK = 500  # 批量查询时每条 SQL 的键数，低于 SQLite 的参数个数上限
+
+    def __init__(self, path=os.path.join('checkpoint', 'results.sqlite')):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+
+    def _connect(self):
+        # sqlite3 连接不能跨线程共享，每个线程各开一个
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def make_key(prompt_template, data_template, input_data, model):
+        # 非 JSON 类型的输入按 repr 参与哈希
+        payload = json.dumps({'prompt': prompt_template, 'data': data_template, 'input': list(input_data), 'model': model},
+                             ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=repr)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys):
+        """
+        批量读取，返回 {键: 结果}，不含未命中的键。
+        """
+        keys = list(dict.fromkeys(keys))
+        conn = self._connect()
+        found = {}
+        for start in range(0, len(keys), self.LOOKUP_CHUNK):
+            chunk = keys[start:start + self.LOOKUP_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            for key, value in conn.execute(f"SELECT key, value FROM results WHERE key IN ({placeholders})", chunk):
+                found[key] = json.loads(value)
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, key, value):
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO results (key, value, created) VALUES (?, ?, ?)",
+                     (key, json.dumps(value, ensure_ascii=False), time.time()))
+        with self._lock:
+            self.writes += 1
+
+    def discard(self, key):
+        self._connect().execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM results")
+
+    def stats(self):
+        entries = self._connect().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'writes': self.writes,
+                'entries': entries,
+            }
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
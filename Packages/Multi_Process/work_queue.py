@@ -0,0 +1,342 @@
+import json
+import time
+import sqlite3
+import threading
+
+
+def _dump(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _text(value):
+    # redis-py 未设置 decode_responses 时返回 bytes
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class SQLiteWorkQueue:
+    """
+    基于 SQLite 文件的租约式任务队列，多台机器把同一个文件放在共享存储上即可协同处理一个 MultiProcessor 任务，
+    不需要额外的服务。工作进程 lease 一批任务并获得 lease_seconds 秒的租约，处理期间用 heartbeat 续约，
+    完成后 ack 提交结果；租约到期仍未 ack 的任务会被其他工作进程重新领取。同一任务可能被处理多次，只保留第一个结果。
+    共享存储必须支持文件锁（NFSv4、SMB 等），日志模式保持默认的 DELETE，不使用在网络文件系统上不可靠的 WAL。
+    输入元组和结果以 JSON 保存，要求与检查点相同：可以 JSON 序列化。
+
+    参数:
+    path (str): 数据库文件路径。
+    lease_seconds (float): 租约时长（秒），应大于 heartbeat 的间隔。
+    """
+
+    def __init__(self, path, lease_seconds=120):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS items (
+                idx INTEGER PRIMARY KEY,
+                payload TEXT NOT NULL,
+                owner TEXT,
+                expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                done INTEGER NOT NULL DEFAULT 0,
+                result TEXT
+            )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS items_open ON items (done, expires)')
+
+    def _transaction(self, statements):
+        # BEGIN IMMEDIATE 先拿写锁，避免两个工作进程读到同一批空闲任务
+        with self._lock:
+            cursor = self._conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                result = statements(cursor)
+                cursor.execute('COMMIT')
+                return result
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+
+    def put_many(self, items):
+        """
+        加入 (位置, 输入元组)，已存在的位置保持不变，重复提交同一个任务是安全的。
+        """
+        rows = [(idx, _dump(list(input_tuple))) for idx, input_tuple in items]
+        self._transaction(lambda cursor: cursor.executemany(
+            'INSERT OR IGNORE INTO items (idx, payload) VALUES (?, ?)', rows))
+
+    def lease(self, worker_id, count):
+        """
+        领取最多 count 个空闲或租约已过期的任务，返回 [(位置, 输入元组, 已领取次数)]。
+        """
+        def statements(cursor):
+            now = time.time()
+            rows = cursor.execute(
+                'SELECT idx, payload, attempts FROM items WHERE done = 0 AND (expires IS NULL OR expires < ?) '
+                'ORDER BY idx LIMIT ?', (now, count)).fetchall()
+            cursor.executemany(
+                'UPDATE items SET owner = ?, expires = ?, attempts = attempts + 1 WHERE idx = ?',
+                [(worker_id, now + self.lease_seconds, idx) for idx, _, _ in rows])
+            return [(idx, tuple(json.loads(payload)), attempts + 1) for idx, payload, attempts in rows]
+        return self._transaction(statements)
+
+    def heartbeat(self, worker_id, indices):
+        expires = time.time() + self.lease_seconds
+        self._transaction(lambda cursor: cursor.executemany(
+            'UPDATE items SET expires = ? WHERE idx = ? AND owner = ? AND done = 0',
+            [(expires, idx, worker_id) for idx in indices]))
+
+    def ack(self, worker_id, idx, result):
+        """
+        提交结果，返回 False 表示该任务已由其他工作进程完成，本次结果被丢弃。
+        """
+        return self._transaction(lambda cursor: cursor.execute(
+            'UPDATE items SET done = 1, result = ?, owner = ?, expires = NULL WHERE idx = ? AND done = 0',
+            (_dump(result), worker_id, idx)).rowcount == 1)
+
+    def release(self, worker_id, indices):
+        # 主动放弃租约，任务立即可以被重新领取
+        self._transaction(lambda cursor: cursor.executemany(
+            'UPDATE items SET owner = NULL, expires = NULL WHERE idx = ? AND owner = ? AND done = 0',
+            [(idx, worker_id) for idx in indices]))
+
+    def requeue_missing(self):
+        # 事务保证任务不会丢失，无需补救
+        return 0
+
+    def counts(self):
+        with self._lock:
+            total, done, leased = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(done), 0), COALESCE(SUM(done = 0 AND expires >= ?), 0) FROM items',
+                (time.time(),)).fetchone()
+        return {'total': total, 'done': done, 'leased': leased, 'pending': total - done - leased}
+
+    def results(self):
+        """
+        返回 {位置: 结果}。
+        """
+        with self._lock:
+            rows = self._conn.execute('SELECT idx, result FROM items WHERE done = 1').fetchall()
+        return {idx: json.loads(result) for idx, result in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RedisWorkQueue:
+    """
+    基于 Redis 的租约式任务队列，语义与 SQLiteWorkQueue 相同，适合节点较多、共享文件系统锁较慢的场合。
+    只使用单条原子命令（不依赖 Lua 脚本），因此也可以在 LocalRedis 这样的替身上运行。
+    工作进程在 LPOP 之后、登记租约之前崩溃时任务会暂时丢失，由协调者在队列排空后用 requeue_missing 找回。
+
+    参数:
+    client: redis.Redis 兼容的客户端（redis-py 或 LocalRedis）。
+    name (str): 键名前缀，一个任务一个前缀。
+    lease_seconds (float): 租约时长（秒）。
+    """
+
+    def __init__(self, client, name='multiprocessor', lease_seconds=120):
+        self.client = client
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.items_key = f'{name}:items'
+        self.pending_key = f'{name}:pending'
+        self.leases_key = f'{name}:leases'
+        self.owners_key = f'{name}:owners'
+        self.attempts_key = f'{name}:attempts'
+        self.results_key = f'{name}:results'
+
+    def put_many(self, items):
+        for idx, input_tuple in items:
+            if self.client.hsetnx(self.items_key, idx, _dump(list(input_tuple))):
+                self.client.rpush(self.pending_key, idx)
+
+    def reclaim(self):
+        """
+        把租约已过期的任务放回队首，返回放回的数量。ZREM 只对一个调用方返回 1，多个工作进程同时回收也不会重复入队。
+        """
+        reclaimed = 0
+        for idx in self.client.zrangebyscore(self.leases_key, '-inf', time.time()):
+            if self.client.zrem(self.leases_key, idx) and not self.client.hexists(self.results_key, idx):
+                self.client.lpush(self.pending_key, idx)
+                reclaimed += 1
+        return reclaimed
+
+    def lease(self, worker_id, count):
+        self.reclaim()
+        leased = []
+        while len(leased) < count:
+            idx = _text(self.client.lpop(self.pending_key))
+            if idx is None:
+                break
+            if self.client.hexists(self.results_key, idx):
+                continue
+            self.client.zadd(self.leases_key, {idx: time.time() + self.lease_seconds})
+            self.client.hset(self.owners_key, idx, worker_id)
+            attempts = self.client.hincrby(self.attempts_key, idx, 1)
+            payload = _text(self.client.hget(self.items_key, idx))
+            leased.append((int(idx), tuple(json.loads(payload)), int(attempts)))
+        return leased
+
+    def heartbeat(self, worker_id, indices):
+        expires = time.time() + self.lease_seconds
+        for idx in indices:
+            if _text(self.client.hget(self.owners_key, idx)) == worker_id:
+                # xx：租约已被回收时不再续上，避免与重新入队的任务重复
+                self.client.zadd(self.leases_key, {str(idx): expires}, xx=True)
+
+    def ack(self, worker_id, idx, result):
+        first = self.client.hsetnx(self.results_key, idx, _dump(result))
+        self.client.zrem(self.leases_key, str(idx))
+        self.client.hdel(self.owners_key, idx)
+        return bool(first)
+
+    def release(self, worker_id, indices):
+        for idx in indices:
+            if _text(self.client.hget(self.owners_key, idx)) == worker_id and self.client.zrem(self.leases_key, str(idx)):
+                self.client.hdel(self.owners_key, idx)
+                self.client.lpush(self.pending_key, idx)
+
+    def requeue_missing(self):
+        """
+        找回既没有结果、也不在队列或租约中的任务（LPOP 后崩溃造成的），返回找回的数量。需要遍历全部任务，只在队列排空后调用。
+        """
+        queued = {_text(idx) for idx in self.client.lrange(self.pending_key, 0, -1)}
+        missing = 0
+        for idx in self.client.hkeys(self.items_key):
+            idx = _text(idx)
+            if idx in queued or self.client.hexists(self.results_key, idx):
+                continue
+            if self.client.zscore(self.leases_key, idx) is None:
+                self.client.rpush(self.pending_key, idx)
+                missing += 1
+        return missing
+
+    def counts(self):
+        total = self.client.hlen(self.items_key)
+        done = self.client.hlen(self.results_key)
+        leased = self.client.zcard(self.leases_key)
+        return {'total': total, 'done': done, 'leased': leased, 'pending': max(0, total - done - leased)}
+
+    def results(self):
+        return {int(_text(idx)): json.loads(_text(result)) for idx, result in self.client.hgetall(self.results_key).items()}
+
+    def close(self):
+        pass
+
+
+class LocalRedis:
+    """
+    进程内的 Redis 替身，实现 RedisWorkQueue 用到的命令（返回值与 decode_responses=True 的 redis-py 相同），
+    用于在单机上测试分布式流程；多台机器协作时需要真正的 Redis。
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key, factory):
+        return self._data.setdefault(key, factory())
+
+    def hsetnx(self, key, field, value):
+        with self._lock:
+            table = self._get(key, dict)
+            if str(field) in table:
+                return 0
+            table[str(field)] = str(value)
+            return 1
+
+    def hset(self, key, field, value):
+        with self._lock:
+            table = self._get(key, dict)
+            new = str(field) not in table
+            table[str(field)] = str(value)
+            return int(new)
+
+    def hget(self, key, field):
+        with self._lock:
+            return self._get(key, dict).get(str(field))
+
+    def hexists(self, key, field):
+        with self._lock:
+            return str(field) in self._get(key, dict)
+
+    def hdel(self, key, field):
+        with self._lock:
+            return int(self._get(key, dict).pop(str(field), None) is not None)
+
+    def hincrby(self, key, field, amount=1):
+        with self._lock:
+            table = self._get(key, dict)
+            table[str(field)] = str(int(table.get(str(field), 0)) + amount)
+            return int(table[str(field)])
+
+    def hlen(self, key):
+        with self._lock:
+            return len(self._get(key, dict))
+
+    def hkeys(self, key):
+        with self._lock:
+            return list(self._get(key, dict))
+
+    def hgetall(self, key):
+        with self._lock:
+            return dict(self._get(key, dict))
+
+    def rpush(self, key, value):
+        with self._lock:
+            items = self._get(key, list)
+            items.append(str(value))
+            return len(items)
+
+    def lpush(self, key, value):
+        with self._lock:
+            items = self._get(key, list)
+            items.insert(0, str(value))
+            return len(items)
+
+    def lpop(self, key):
+        with self._lock:
+            items = self._get(key, list)
+            return items.pop(0) if items else None
+
+    def lrange(self, key, start, end):
+        with self._lock:
+            items = self._get(key, list)
+            return items[start:] if end == -1 else items[start:end + 1]
+
+    def llen(self, key):
+        with self._lock:
+            return len(self._get(key, list))
+
+    def zadd(self, key, mapping, xx=False):
+        with self._lock:
+            scores = self._get(key, dict)
+            added = 0
+            for member, score in mapping.items():
+                member = str(member)
+                if xx and member not in scores:
+                    continue
+                added += member not in scores
+                scores[member] = float(score)
+            return added
+
+    def zrem(self, key, member):
+        with self._lock:
+            return int(self._get(key, dict).pop(str(member), None) is not None)
+
+    def zscore(self, key, member):
+        with self._lock:
+            return self._get(key, dict).get(str(member))
+
+    def zcard(self, key):
+        with self._lock:
+            return len(self._get(key, dict))
+
+    def zrangebyscore(self, key, minimum, maximum):
+        minimum = float(minimum)
+        maximum = float(maximum)
+        with self._lock:
+            scores = self._get(key, dict)
+            return [member for member, score in sorted(scores.items(), key=lambda item: item[1])
+                    if minimum <= score <= maximum]
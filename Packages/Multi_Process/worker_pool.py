@@ -0,0 +1,158 @@
+import time
+import heapq
+import threading
+import collections
+import concurrent.futures
+
+from Packages.LLM_API.transport import deadline
+
+
+class WorkerPool:
+    """
+    常驻线程池，每个任务从开始执行起计时，超过 timeout 后立即以 TimeoutError 结束它的 Future，
+    调用方可以马上走重试或空模板流程。
+    任务内的 LLM 请求通过 deadline 共享同一个截止时间，到期后连接被关闭，线程随之释放；
+    对不支持截止时间、仍卡住的任务，池会补一个新的工作线程，保证可用并发数不变，
+    卡住的线程结束后自行退出，结果被丢弃。仍卡住的线程达到 max_abandoned 个后不再补线程，
+    池的并发数随之下降，新任务排队等待，直到卡住的线程返回并顶替欠下的工作线程，线程总数因此有上限。
+
+    参数:
+    num_workers (int): 工作线程数。
+    name (str): 线程名前缀。
+    max_abandoned (int): 同时仍在运行的超时线程数上限，默认 num_workers 的 2 倍。
+    """
+
+    def __init__(self, num_workers, name='worker', max_abandoned=None):
+        self.num_workers = num_workers
+        self.name = name
+        self.max_abandoned = max_abandoned if max_abandoned is not None else 2 * num_workers
+        self.abandoned = 0
+        # 已超时但仍在运行的线程数，以及因达到上限而没有补上的工作线程数
+        self.stuck = 0
+        self._owed = 0
+        self._tasks = collections.deque()
+        self._condition = threading.Condition()
+        self._deadlines = []
+        self._running = {}
+        self._threads = set()
+        self._shutdown = False
+        self._counter = 0
+        for _ in range(num_workers):
+            self._spawn()
+        self._monitor = threading.Thread(target=self._watch, name=f'{name}-monitor', daemon=True)
+        self._monitor.start()
+
+    def _spawn(self):
+        self._counter += 1
+        thread = threading.Thread(target=self._work, name=f'{self.name}-{self._counter}', daemon=True)
+        self._threads.add(thread)
+        thread.start()
+
+    def submit(self, fn, *args, timeout=None, **kwargs):
+        """
+        提交任务，返回 concurrent.futures.Future。timeout 为 None 时不限时。
+        """
+        future = concurrent.futures.Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("WorkerPool 已关闭。")
+            self._tasks.append((future, fn, args, kwargs, timeout))
+            self._condition.notify_all()
+        return future
+
+    def _work(self):
+        current = threading.current_thread()
+        while True:
+            with self._condition:
+                while not self._tasks and not self._shutdown:
+                    self._condition.wait()
+                if not self._tasks:
+                    self._threads.discard(current)
+                    return
+                future, fn, args, kwargs, timeout = self._tasks.popleft()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._running[future] = current
+                if timeout is not None:
+                    heapq.heappush(self._deadlines, (time.monotonic() + timeout, id(future), future))
+                    self._condition.notify_all()
+
+            try:
+                with deadline(timeout):
+                    result = fn(*args, **kwargs)
+            except BaseException as e:
+                finished = self._finish(future, exception=e)
+            else:
+                finished = self._finish(future, result=result)
+
+            if not finished:
+                with self._condition:
+                    self.stuck -= 1
+                    if self._owed and not self._shutdown:
+                        # 达到上限时没有补线程，当前线程回到池中顶替
+                        self._owed -= 1
+                        self._threads.add(current)
+                        continue
+                    # 替补线程已经启动，当前线程退出
+                    self._threads.discard(current)
+                return
+
+    def _finish(self, future, result=None, exception=None):
+        with self._condition:
+            self._running.pop(future, None)
+            if future.done():
+                return False
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+            return True
+
+    def _watch(self):
+        with self._condition:
+            while not (self._shutdown and not self._running):
+                now = time.monotonic()
+                while self._deadlines and (self._deadlines[0][0] <= now or self._deadlines[0][2].done()):
+                    _, _, future = heapq.heappop(self._deadlines)
+                    if future.done():
+                        continue
+                    # 卡住的线程不再计入池内，关闭时也不等待它
+                    self._threads.discard(self._running.pop(future, None))
+                    future.set_exception(TimeoutError("任务超过时间限制。"))
+                    self.abandoned += 1
+                    self.stuck += 1
+                    if self.stuck <= self.max_abandoned:
+                        self._spawn()
+                    else:
+                        self._owed += 1
+                timeout = self._deadlines[0][0] - now if self._deadlines else None
+                self._condition.wait(timeout)
+
+    def stats(self):
+        with self._condition:
+            return {
+                'workers': len(self._threads),
+                'queued': len(self._tasks),
+                'running': len(self._running),
+                'abandoned': self.abandoned,
+                'stuck': self.stuck,
+                'owed': self._owed,
+            }
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        with self._condition:
+            self._shutdown = True
+            if cancel_pending:
+                while self._tasks:
+                    self._tasks.popleft()[0].cancel()
+            self._condition.notify_all()
+            threads = list(self._threads)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
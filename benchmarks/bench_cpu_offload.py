@@ -0,0 +1,108 @@
+"""
+CPU 卸载基准：在 StandInServer 上运行 MultiProcessor，回答是包含大量中文标点的大字典，
+对比 parse_method/validator 在工作线程内执行与放到进程池（cpu_processes）执行时，不同并发数下的吞吐量和请求延迟，
+找出 GIL 争用使进程池开始占优的并发数（交叉点）。
+
+用法:
+python benchmarks/bench_cpu_offload.py --threads 4 16 64 --processes 0 2 4 --answer-keys 400
+python benchmarks/bench_cpu_offload.py --engine asyncio --threads 64 256 --processes 0 4
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Packages.LLM_API import MultiLLM, StandInServer, RateLimiter, MetricsRegistry
+from Packages.LLM_Parser import LLMParser
+from Packages.Multi_Process import MultiProcessor
+
+
+def make_answer(keys):
+    # 中文标点让 parse_dict 的替换链和 literal_eval 都有实际工作量
+    body = '，'.join(f"'key_{i}'：'第{i}项，值：{i * 7}；备注（无）！'" for i in range(keys))
+    return '回答如下：{' + body + '}。'
+
+
+def validate(data):
+    # 模块级函数，可以 pickle 到子进程
+    return isinstance(data, dict) and all(isinstance(key, str) and str(value) for key, value in data.items())
+
+
+def run(args, threads, processes):
+    answer = make_answer(args.answer_keys)
+    server = StandInServer(latency=args.latency, latency_sigma=args.sigma, answers=lambda prompt: answer, seed=args.seed)
+    metrics = MetricsRegistry()
+    with server, tempfile.TemporaryDirectory() as workdir:
+        llm = MultiLLM(model='stand-in', api_key='stand-in', base_url=server.base_url, rate_limiter=RateLimiter(),
+                       metrics=metrics)
+        processor = MultiProcessor(
+            llm,
+            LLMParser().parse_dict,
+            data_template="{'key_0': str}",
+            prompt_template="请按 data_template 格式回答：{input_1}\n{data_template}",
+            correction_template="请纠正以下回答使其符合格式：{answer}\n{data_template}",
+            validator=validate,
+            empty_template="{{'key_0': None, 'input': '{input_1}'}}",
+            time_limit=args.time_limit,
+            cpu_processes=processes,
+        )
+        processor.checkpoint_dir = workdir
+        processor.checkpoint_path = os.path.join(workdir, 'checkpoint.json')
+        tuple_list = [(f'question {i}', i) for i in range(args.items)]
+        try:
+            # 进程池的启动不计入耗时
+            processor.get_offloader()
+            start = time.perf_counter()
+            processor.multitask_perform(tuple_list, threads, checkpoint=max(1, args.items // 10), engine=args.engine)
+            wall = time.perf_counter() - start
+            offload = processor.get_offloader().stats() if processes else None
+        finally:
+            processor.close()
+    series = next(iter(next(iter(metrics.snapshot().values())).values()))
+    return wall, series, offload
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, nargs='+', default=[4, 16, 64])
+    parser.add_argument('--processes', type=int, nargs='+', default=[0, 2, 4], help='0 表示在工作线程内解析')
+    parser.add_argument('--items', type=int, default=400)
+    parser.add_argument('--answer-keys', type=int, default=300, help='回答字典的键数，决定单次解析的 CPU 开销')
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--sigma', type=float, default=0.0)
+    parser.add_argument('--time-limit', type=float, default=120)
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], default='threads')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    LLMParser().parse_dict(make_answer(args.answer_keys))
+    print(f"单次 parse_dict 耗时 {(time.perf_counter() - start) * 1000:.2f} ms，CPU 核数 {os.cpu_count()}")
+
+    rows = []
+    for threads in args.threads:
+        for processes in args.processes:
+            wall, series, offload = run(args, threads, processes)
+            rows.append((threads, processes, wall, series, offload))
+
+    print(f"{'threads':>8} {'procs':>6} {'wall_s':>8} {'items/s':>8} {'p50_s':>7} {'p95_s':>7} {'batch':>6}")
+    for threads, processes, wall, series, offload in rows:
+        batch = f"{offload['mean_batch']:.1f}" if offload else '-'
+        print(f"{threads:>8} {processes:>6} {wall:>8.2f} {args.items / wall:>8.1f} "
+              f"{series['latency_p50']:>7.3f} {series['latency_p95']:>7.3f} {batch:>6}")
+
+    # 每个并发数下最快的配置；进程池开始胜出的最小并发数即为交叉点
+    crossover = None
+    for threads in args.threads:
+        best = min((row for row in rows if row[0] == threads), key=lambda row: row[2])
+        print(f"threads={threads}: 最快的是 {'线程内解析' if best[1] == 0 else f'{best[1]} 个进程'}")
+        if best[1] and crossover is None:
+            crossover = threads
+    print(f"交叉点: {crossover if crossover is not None else '未出现'}")
+
+
+if __name__ == '__main__':
+    main()
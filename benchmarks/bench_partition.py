@@ -0,0 +1,94 @@
+"""
+partition_by_similarity 基准：对比原稠密实现与分块实现在不同词表规模下的耗时和峰值内存。
+
+用法:
+python benchmarks/bench_partition.py --sizes 1000 4000 16000 --dim 256 --budget-mb 64
+python benchmarks/bench_partition.py --sizes 20000 80000 --nprobe 1 2 3
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Packages.LLM_API.similarity import partition_by_similarity, normalize_rows
+from Packages.LLM_API.ann import IVFIndex, measure_recall
+
+
+def dense_partition(keys, matrix, threshold):
+    # 原 MultiLLM.partition_by_similarity 的稠密实现
+    norm = np.linalg.norm(matrix, axis=1)
+    similarity_matrix = np.dot(matrix, matrix.T) / np.outer(norm, norm)
+    np.fill_diagonal(similarity_matrix, 0)
+
+    result = {}
+    valid_indices = set(range(len(keys)))
+    for i in range(len(keys)):
+        if i not in valid_indices:
+            continue
+        similar_indices = np.where(similarity_matrix[i] >= threshold)[0]
+        similar_keys = [keys[j] for j in similar_indices if j in valid_indices]
+        for idx in similar_indices:
+            valid_indices.discard(idx)
+        result[keys[i]] = {'Similar_keys': similar_keys}
+    return result
+
+
+def make_vocabulary(n, dim, seed=0):
+    # 若干聚类中心加噪声，保证有一定比例的近义词可合并
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(n // 5, 1), dim))
+    labels = rng.integers(0, centers.shape[0], size=n)
+    matrix = centers[labels] + rng.normal(scale=0.35, size=(n, dim))
+    keys = [f'term_{i}' for i in range(n)]
+    return keys, matrix
+
+
+def measure(fn, *args, **kwargs):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 2000, 4000, 8000, 16000])
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--threshold', type=float, default=0.8)
+    parser.add_argument('--budget-mb', type=int, default=64)
+    parser.add_argument('--n-jobs', type=int, default=None)
+    parser.add_argument('--dense-max', type=int, default=8000, help='超过该规模不再运行稠密实现')
+    parser.add_argument('--nprobe', type=int, nargs='*', default=[], help='同时测试 IVF 近似近邻的 nprobe 取值')
+    args = parser.parse_args()
+
+    print(f"{'n':>8} {'dense_s':>9} {'dense_MB':>9} {'tiled_s':>9} {'tiled_MB':>9} {'groups':>8} {'same':>6}")
+    for n in args.sizes:
+        keys, matrix = make_vocabulary(n, args.dim)
+        tiled, tiled_s, tiled_mb = measure(partition_by_similarity, keys, matrix, args.threshold,
+                                           memory_budget=args.budget_mb * 1024 * 1024, n_jobs=args.n_jobs)
+        if n <= args.dense_max:
+            dense, dense_s, dense_mb = measure(dense_partition, keys, matrix, args.threshold)
+            same = 'yes' if dense == tiled else 'NO'
+            print(f"{n:>8} {dense_s:>9.2f} {dense_mb:>9.1f} {tiled_s:>9.2f} {tiled_mb:>9.1f} {len(tiled):>8} {same:>6}")
+        else:
+            print(f"{n:>8} {'-':>9} {'-':>9} {tiled_s:>9.2f} {tiled_mb:>9.1f} {len(tiled):>8} {'-':>6}")
+
+        normed = normalize_rows(matrix)
+        for nprobe in args.nprobe:
+            start = time.perf_counter()
+            index = IVFIndex(nprobe=nprobe, n_jobs=args.n_jobs).fit(normed)
+            neighbours = index.neighbours(normed, args.threshold)
+            ann_s = time.perf_counter() - start
+            recall = measure_recall(normed, neighbours, args.threshold, sample_size=500)
+            print(f"{'':>8} ann nprobe={nprobe}: {ann_s:.2f}s, recall={recall:.4f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+端到端流程基准：在本地 StandInServer 上运行 MultiProcessor、Memory.summarize_list、MultiLLM.embed_list 和 Retriever，
+不需要任何 API 密钥，报告吞吐量、请求延迟分位数以及注入错误的数量。
+
+用法:
+python benchmarks/bench_pipelines.py --items 200 --threads 16 --latency 0.2 --sigma 0.5
+python benchmarks/bench_pipelines.py --pipelines multiprocess embed --rate-429 0.05 --rate-5xx 0.02
+python benchmarks/bench_pipelines.py --pipelines multiprocess --engine asyncio --items 2000 --threads 1000
+python benchmarks/bench_pipelines.py --pipelines multiprocess --adaptive --threads 64 --rate-429 0.05
+python benchmarks/bench_pipelines.py --pipelines sequential dag --items 500 --threads 32
+"""
+import os
+import re
+import ast
+import sys
+import json
+import time
+import argparse
+import tempfile
+import concurrent.futures
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Packages.LLM_API import MultiLLM, StandInServer, RateLimiter, MetricsRegistry
+from Packages.LLM_Parser import LLMParser
+from Packages.Memory import Memory
+from Packages.Multi_Process import MultiProcessor, Pipeline
+from Packages.Lean_Processor import Retriever
+from Packages.Lean_Processor.Formatter import DataProcessor
+
+CHILDREN_PATTERN = re.compile(r'最相关: (\[.*?\])，以list格式返回')
+
+
+def scripted_answer(prompt):
+    # Retriever 的提问：选择前两个子节点
+    match = CHILDREN_PATTERN.search(prompt)
+    if match:
+        return str(ast.literal_eval(match.group(1))[:2])
+    # MultiProcessor 的提问与纠错：返回可解析的字典
+    if 'data_template' in prompt or '纠正' in prompt:
+        return "{'answer': 'ok', 'length': %d}" % len(prompt)
+    return '压缩后的文本。' * 8
+
+
+def make_tree(depth, fan_out):
+    def build(name, level):
+        if level == depth:
+            return {'name': name, 'type': 'lean', 'level': level}
+        children = [build(f'{name}.{i}', level + 1) for i in range(fan_out)]
+        return {'name': name, 'type': 'folder', 'level': level, 'children': children}
+    return build('Mathlib', 0)
+
+
+def make_processor(llm, args, workdir, name='checkpoint'):
+    processor = MultiProcessor(
+        llm,
+        LLMParser().parse_dict,
+        data_template="{'answer': str, 'length': int}",
+        prompt_template="请按 data_template 格式回答：{input_1}\n{data_template}",
+        correction_template="请纠正以下回答使其符合格式：{answer}\n{data_template}",
+        validator=lambda data: isinstance(data, dict) and 'answer' in data,
+        empty_template="{{'answer': None, 'input': '{input_1}'}}",
+        time_limit=args.time_limit,
+    )
+    processor.checkpoint_dir = workdir
+    processor.checkpoint_path = os.path.join(workdir, f'{name}.json')
+    return processor
+
+
+def run_multiprocess(llm, args, workdir):
+    processor = make_processor(llm, args, workdir)
+    tuple_list = [(f'question {i}', i) for i in range(args.items)]
+    processor.multitask_perform(tuple_list, args.threads, checkpoint=max(1, args.items // 10), engine=args.engine,
+                                adaptive=args.adaptive)
+    return args.items
+
+
+def extracted_terms(result):
+    # 抽取 -> 合并近义词 -> 解释 三段流程中，把抽取结果换成两个词。词互不重复，
+    # 两种流程的请求数相同（重复的词在 sequential 中会被整体合并，在 dag 中只合并在途的）
+    index = result[-1]
+    return [f'term {index}', f'concept {index}'], index
+
+
+def run_sequential(llm, args, workdir):
+    # 每个阶段全部完成后才开始下一阶段
+    extractor = make_processor(llm, args, workdir, 'extract')
+    explainer = make_processor(llm, args, workdir, 'explain')
+    extracted = extractor.multitask_perform([(f'question {i}', i) for i in range(args.items)], args.threads,
+                                            checkpoint=max(1, args.items // 10))
+    terms = DataProcessor().convertor(llm, [extracted_terms(result) for result in extracted])
+    explainer.multitask_perform(terms, args.threads, checkpoint=max(1, len(terms) // 10))
+    return args.items
+
+
+def run_dag(llm, args, workdir):
+    # 同样三个阶段由有界队列串联，元素完成一个阶段立即进入下一阶段
+    pipeline = Pipeline()
+    pipeline.add_processor('extract', make_processor(llm, args, workdir, 'extract'), args.threads)
+    pipeline.add('terms', extracted_terms)
+    pipeline.add_batch('convert', DataProcessor().convertor_stream(llm), batch_size=64, max_wait=0.2)
+    pipeline.add_processor('explain', make_processor(llm, args, workdir, 'explain'), args.threads)
+    for _ in pipeline.run((f'question {i}', i) for i in range(args.items)):
+        pass
+    print(pipeline.summary())
+    return args.items
+
+
+def run_summarize(llm, args, workdir):
+    memory = Memory(threshold=500, overlap=50, llm=llm)
+    texts = [f'第 {i} 段长文本。' * 40 for i in range(args.items)]
+    memory.summarize_list(texts, args.threads)
+    return args.items
+
+
+def run_embed(llm, args, workdir):
+    # 约一半文本重复，覆盖去重路径
+    texts = [f'term {i % max(1, args.items * 5 // 2)}' for i in range(args.items * 5)]
+    llm.embed_list(texts, num_threads=args.threads, batch_size=64)
+    return len(texts)
+
+
+def run_retriever(llm, args, workdir):
+    tree_path = os.path.join(workdir, 'mathlib_tree.json')
+    with open(tree_path, 'w', encoding='utf-8') as f:
+        json.dump(make_tree(args.tree_depth, args.tree_fan_out), f, ensure_ascii=False)
+    retriever = Retriever(llm, LLMParser(), tree_path=tree_path)
+    statements = [f'theorem t{i} : {i} + 0 = {i}' for i in range(max(1, args.items // 10))]
+    failures = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.threads) as executor:
+        for future in concurrent.futures.as_completed([executor.submit(retriever.retrieve, s) for s in statements]):
+            if future.exception() is not None:
+                failures += 1
+    if failures:
+        print(f"Retriever: {failures}/{len(statements)} statements failed.")
+    return len(statements)
+
+
+PIPELINES = {
+    'multiprocess': run_multiprocess,
+    'sequential': run_sequential,
+    'dag': run_dag,
+    'summarize': run_summarize,
+    'embed': run_embed,
+    'retriever': run_retriever,
+}
+
+
+def format_seconds(value):
+    return '-' if value is None else f'{value:.3f}'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pipelines', nargs='+', choices=list(PIPELINES), default=['multiprocess', 'summarize', 'embed', 'retriever'])
+    parser.add_argument('--items', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.1, help='服务端延迟中位数（秒）')
+    parser.add_argument('--sigma', type=float, default=0.5, help='延迟的对数正态标准差')
+    parser.add_argument('--per-token-latency', type=float, default=0.0)
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--rate-5xx', type=float, default=0.0)
+    parser.add_argument('--time-limit', type=float, default=60)
+    parser.add_argument('--engine', choices=['threads', 'asyncio'], default='threads', help='MultiProcessor 的执行引擎')
+    parser.add_argument('--adaptive', action='store_true', help='MultiProcessor 使用 AIMD 自适应并发，--threads 为上限')
+    parser.add_argument('--tree-depth', type=int, default=3)
+    parser.add_argument('--tree-fan-out', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'pipeline':>13} {'items':>6} {'wall_s':>8} {'items/s':>8} {'requests':>9} "
+          f"{'p50_s':>7} {'p95_s':>7} {'p99_s':>7} {'429':>5} {'5xx':>5}")
+    for name in args.pipelines:
+        server = StandInServer(latency=args.latency, latency_sigma=args.sigma, per_token_latency=args.per_token_latency,
+                               rate_429=args.rate_429, rate_5xx=args.rate_5xx, answers=scripted_answer, seed=args.seed)
+        metrics = MetricsRegistry()
+        with server, tempfile.TemporaryDirectory() as workdir:
+            llm = MultiLLM(model='stand-in', embed_model='stand-in-embed', api_key='stand-in', base_url=server.base_url,
+                           rate_limiter=RateLimiter(), metrics=metrics)
+            start = time.perf_counter()
+            items = PIPELINES[name](llm, args, workdir)
+            wall = time.perf_counter() - start
+
+        for methods in metrics.snapshot().values():
+            for series in methods.values():
+                stats = server.stats()
+                print(f"{name:>13} {items:>6} {wall:>8.2f} {items / wall:>8.1f} {series['requests']:>9} "
+                      f"{format_seconds(series['latency_p50']):>7} {format_seconds(series['latency_p95']):>7} "
+                      f"{format_seconds(series['latency_p99']):>7} {stats['throttled']:>5} {stats['server_errors']:>5}")
+
+
+if __name__ == '__main__':
+    main()
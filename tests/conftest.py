@@ -0,0 +1,51 @@
+import os
+import re
+
+import pytest
+
+from Packages.LLM_API import MultiLLM, StandInServer, RateLimiter, MetricsRegistry
+from Packages.LLM_Parser import LLMParser
+from Packages.Multi_Process import MultiProcessor
+
+
+QUESTION_PATTERN = re.compile(r'格式回答：(.*?)\n')
+
+
+def scripted_answer(prompt):
+    # 返回可解析的字典，answer 为提示词中的输入，用于核对结果属于哪个输入
+    match = QUESTION_PATTERN.search(prompt)
+    return "{'answer': %r, 'length': %d}" % (match.group(1) if match else 'ok', len(prompt))
+
+
+@pytest.fixture
+def server():
+    with StandInServer(latency=0.005, answers=scripted_answer) as server:
+        yield server
+
+
+@pytest.fixture
+def make_llm():
+    def make(server, model='stand-in', **kwargs):
+        return MultiLLM(model=model, embed_model='stand-in-embed', api_key='stand-in', base_url=server.base_url,
+                        rate_limiter=RateLimiter(), metrics=MetricsRegistry(), **kwargs)
+    return make
+
+
+@pytest.fixture
+def make_processor(tmp_path):
+    def make(llm, name='checkpoint', **kwargs):
+        processor = MultiProcessor(
+            llm,
+            LLMParser().parse_dict,
+            data_template="{'answer': str, 'length': int}",
+            prompt_template="请按 data_template 格式回答：{input_1}\n{data_template}",
+            correction_template="请纠正以下回答使其符合格式：{answer}\n{data_template}",
+            validator=lambda data: isinstance(data, dict) and 'answer' in data,
+            empty_template="{{'answer': None, 'input': '{input_1}'}}",
+            time_limit=10,
+            **kwargs,
+        )
+        processor.checkpoint_dir = str(tmp_path)
+        processor.checkpoint_path = os.path.join(str(tmp_path), f'{name}.json')
+        return processor
+    return make
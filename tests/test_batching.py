@@ -0,0 +1,76 @@
+import re
+from collections import deque
+
+import pytest
+
+from Packages.LLM_API import StandInServer
+from Packages.Multi_Process import MicroBatcher
+
+TASK_PATTERN = re.compile(r'格式回答：(.*?)\n')
+
+
+def batched_answer(skip=()):
+    # 批量提示词按 pad 逐个回答，skip 中的输入不回答；单个提示词直接回答字典
+    def answer(prompt):
+        questions = TASK_PATTERN.findall(prompt)
+        if '=start_pad_i=' not in prompt:
+            return "{'answer': %r, 'length': 0}" % (questions[0] if questions else 'ok')
+        return ''.join(f"=start_pad_{i}={{'answer': {question!r}, 'length': 0}}=end_pad_{i}=\n"
+                       for i, question in enumerate(questions, 1) if question not in skip)
+    return answer
+
+
+def test_take_respects_batch_size_and_rejects_unrenderable_items():
+    batcher = MicroBatcher("{'answer': str}", max_batch=3)
+    queue = deque([(0, ('a', 0)), (1, ('bad', 1)), (2, ('b', 2)), (3, ('c', 3)), (4, ('d', 4))])
+
+    def render(input_tuple):
+        if input_tuple[0] == 'bad':
+            raise KeyError('input_2')
+        return f'prompt {input_tuple[0]}'
+
+    rejected = []
+    batch = batcher.take(queue, render, rejected)
+
+    assert [idx for idx, _, _ in batch] == [0, 2, 3]
+    assert rejected == [(1, ('bad', 1))]
+    assert list(queue) == [(4, ('d', 4))]
+    with pytest.raises(KeyError):
+        batcher.take(deque([(1, ('bad', 1))]), render)
+
+
+def test_batch_perform_packs_tasks_into_few_requests(make_llm, make_processor):
+    with StandInServer(latency=0.005, answers=batched_answer()) as server:
+        processor = make_processor(make_llm(server))
+        tuple_list = [(f'question {i}', i) for i in range(16)]
+
+        results = processor.batch_perform(tuple_list, 2, max_batch=4)
+
+        assert [(data['answer'], index) for data, index in results] == [(f'question {i}', i) for i in range(16)]
+        assert server.stats()['requests'] < len(tuple_list)
+        assert processor.batch_stats['fallback'] == 0
+
+
+def test_batch_perform_falls_back_to_single_requests(make_llm, make_processor):
+    with StandInServer(latency=0.005, answers=batched_answer(skip={'question 5'})) as server:
+        processor = make_processor(make_llm(server))
+        tuple_list = [(f'question {i}', i) for i in range(8)]
+
+        results = processor.batch_perform(tuple_list, 2, max_batch=4)
+
+        assert [data['answer'] for data, _ in results] == [f'question {i}' for i in range(8)]
+        assert processor.batch_stats['fallback'] == 1
+
+
+def test_unrenderable_input_fails_alone(make_llm, make_processor):
+    with StandInServer(latency=0.005, answers=batched_answer()) as server:
+        processor = make_processor(make_llm(server))
+        processor.prompt_template = "请按 data_template 格式回答：{input_1}\n{input_2}\n{data_template}"
+        tuple_list = [(f'question {i}', 'extra', i) for i in range(6)]
+        tuple_list[2] = ('question 2', 2)  # 缺少 input_2，提示词无法渲染
+
+        results = processor.batch_perform(tuple_list, 2, max_batch=4)
+
+        assert results[2] == ({'answer': None, 'input': 'question 2'}, 2)
+        assert [data['answer'] for i, (data, _) in enumerate(results) if i != 2] == \
+            [f'question {i}' for i in range(6) if i != 2]
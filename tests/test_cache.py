@@ -0,0 +1,48 @@
+import time
+
+from Packages.LLM_API import ResponseCache
+
+
+def test_get_returns_stored_value_and_counts_hits(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'))
+    key = ResponseCache.make_key('model', [{'role': 'user', 'content': 'hi'}])
+
+    assert cache.get(key) is None
+    cache.put(key, {'answer': 'hello'})
+
+    assert cache.get(key) == {'answer': 'hello'}
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_make_key_depends_on_parameters():
+    messages = [{'role': 'user', 'content': 'hi'}]
+    assert ResponseCache.make_key('m', messages, temperature=0) != ResponseCache.make_key('m', messages, temperature=1)
+    assert ResponseCache.make_key('m', messages, a=1, b=2) == ResponseCache.make_key('m', messages, b=2, a=1)
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), ttl=0.05)
+    cache.put('key', 'value')
+    assert cache.get('key') == 'value'
+
+    time.sleep(0.1)
+
+    assert cache.get('key') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_evict_removes_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), max_bytes=100)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, 'x' * 38)  # 每条编码后 40 字节
+        time.sleep(0.01)
+    # 读取 a 后 b 成为最久未访问的条目
+    assert cache.get('a') is not None
+    time.sleep(0.01)
+
+    assert cache.evict() == 1
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
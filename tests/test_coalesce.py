@@ -0,0 +1,50 @@
+import pytest
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_duplicates_are_requested_separately_by_default(server, make_llm, make_processor, engine):
+    processor = make_processor(make_llm(server))
+    tuple_list = [('same question', i) for i in range(5)]
+
+    results = processor.multitask_perform(tuple_list, 5, engine=engine)
+
+    assert [index for _, index in results] == list(range(5))
+    assert server.stats()['requests'] == len(tuple_list)
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_coalesce_shares_one_request(server, make_llm, make_processor, engine):
+    processor = make_processor(make_llm(server), coalesce=True)
+    tuple_list = [('same question', i) for i in range(5)] + [('other question', 5)]
+
+    results = processor.multitask_perform(tuple_list, 6, engine=engine)
+
+    assert [index for _, index in results] == list(range(6))
+    assert [data['answer'] for data, _ in results] == ['same question'] * 5 + ['other question']
+    assert server.stats()['requests'] == 2
+
+
+def test_unkeyed_items_are_counted_once():
+    from Packages.Multi_Process import PromptCoalescer
+
+    coalescer = PromptCoalescer(lambda input_tuple: None if input_tuple[0] is None else input_tuple[0])
+    items = [(0, ('a', 0)), (1, (None, 1)), (2, ('a', 2)), (3, (None, 3))]
+
+    leaders = coalescer.preload(items)
+    # 提交时再次登记
+    assert all(coalescer.add(*item) for item in leaders)
+
+    assert leaders == [(0, ('a', 0)), (1, (None, 1)), (3, (None, 3))]
+    assert coalescer.stats() == {'tasks': 4, 'requests': 3, 'coalesced': 1, 'dedup_ratio': 0.25}
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_dedup_stats_with_unrenderable_inputs(server, make_llm, make_processor, engine):
+    processor = make_processor(make_llm(server), coalesce=True)
+    processor.prompt_template = "请按 data_template 格式回答：{input_1}\n{input_2}\n{data_template}"
+    tuple_list = [('same', 'x', 0), ('same', 'x', 1), ('broken', 2), ('other', 'y', 3)]
+
+    processor.multitask_perform(tuple_list, 4, engine=engine)
+
+    assert processor.dedup_stats['tasks'] == len(tuple_list)
+    assert processor.dedup_stats['requests'] == 3
@@ -0,0 +1,29 @@
+from Packages.Multi_Process import AIMDController
+
+
+def test_slow_start_grows_until_max_limit():
+    controller = AIMDController(max_limit=16, initial=2)
+    for _ in range(30):
+        controller.on_success(0.1)
+
+    assert controller.limit == 16
+
+
+def test_congestion_halves_limit_once_per_round():
+    controller = AIMDController(max_limit=64, initial=32)
+
+    controller.on_congestion('throttled')
+    assert controller.limit == 16
+    # 同一轮内的后续拥塞不再下降
+    controller.on_congestion('throttled')
+    assert controller.limit == 16
+    assert controller.decreases == 1
+    assert not controller.slow_start
+
+
+def test_limit_never_drops_below_min_limit():
+    controller = AIMDController(max_limit=8, initial=2, min_limit=2)
+    for _ in range(10):
+        controller.on_congestion('timeout')
+
+    assert controller.limit == 2
@@ -0,0 +1,53 @@
+import numpy as np
+
+
+def test_embed_list_deduplicates_texts(server, make_llm):
+    llm = make_llm(server)
+    texts = [f'term {i % 5}' for i in range(20)]
+
+    embeddings = llm.embed_list(texts, num_threads=2, batch_size=64)
+
+    assert set(embeddings) == set(texts)
+    assert server.stats()['requests'] == 1
+    for text, vector in embeddings.items():
+        assert np.allclose(vector, server.embedding(text))
+
+
+def test_embed_list_packs_batches_by_size(server, make_llm):
+    llm = make_llm(server)
+    texts = [f'term {i}' for i in range(10)]
+
+    embeddings = llm.embed_list(texts, num_threads=3, batch_size=4)
+
+    assert len(embeddings) == 10
+    assert server.stats()['requests'] == 3
+
+
+def test_embed_list_packs_batches_by_token_budget(server, make_llm):
+    llm = make_llm(server)
+    texts = [f'长文本 {i} ' + '词' * 200 for i in range(6)]
+
+    embeddings = llm.embed_list(texts, num_threads=2, batch_size=64, max_batch_tokens=250)
+
+    assert all(embeddings[text] is not None for text in texts)
+    assert server.stats()['requests'] == 6
+
+
+def test_embed_list_marks_failed_batches_as_none(make_llm):
+    from Packages.LLM_API import StandInServer
+
+    with StandInServer(latency=0.0, rate_5xx=1.0) as server:
+        embeddings = make_llm(server).embed_list(['a', 'b', 'c'], batch_size=2)
+
+    assert embeddings == {'a': None, 'b': None, 'c': None}
+
+
+def test_embed_list_rejects_short_batches(server, make_llm):
+    llm = make_llm(server)
+    embed_batch = llm.embed_batch
+    # 接口少返回一条时，整批按失败处理，而不是把向量错配或悄悄丢掉文本
+    llm.embed_batch = lambda texts: embed_batch(texts)[:-1]
+
+    embeddings = llm.embed_list(['a', 'b', 'c', 'd'], batch_size=2)
+
+    assert embeddings == {'a': None, 'b': None, 'c': None, 'd': None}
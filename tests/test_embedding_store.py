@@ -0,0 +1,72 @@
+import numpy as np
+
+from Packages.LLM_API import EmbeddingStore
+
+
+def unit(seed, dim=8):
+    vector = np.random.default_rng(seed).normal(size=dim)
+    return vector / np.linalg.norm(vector)
+
+
+def test_vectors_survive_reload(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.add(['a', 'b'], [unit(0), unit(1)])
+
+    reloaded = EmbeddingStore(str(tmp_path))
+
+    assert len(reloaded) == 2
+    assert np.allclose(reloaded.get(['b'])[0], unit(1))
+
+
+def test_torn_index_line_is_truncated_before_next_append(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.add(['a', 'b'], [unit(0), unit(1)])
+    # 模拟写入 c 时崩溃：向量已写入，索引只写了半行
+    with open(store.vectors_path, 'ab') as f:
+        f.write(unit(2).astype(np.float32).tobytes())
+    with open(store.index_path, 'a', encoding='utf-8') as f:
+        f.write('{"hash": "')
+
+    store = EmbeddingStore(str(tmp_path))
+    assert len(store) == 2
+    store.add(['d', 'e'], [unit(3), unit(4)])
+
+    reloaded = EmbeddingStore(str(tmp_path))
+    assert reloaded.texts == ['a', 'b', 'd', 'e']
+    assert np.allclose(reloaded.get(['e'])[0], unit(4))
+    assert np.allclose(reloaded.get(['d'])[0], unit(3))
+
+
+
+class FixedEmbedder:
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.requested = []
+
+    def embed_list(self, texts):
+        self.requested.extend(texts)
+        return {text: self.vectors[text] for text in texts if text in self.vectors}
+
+
+def test_top_k_does_not_store_or_return_the_query(tmp_path):
+    query = unit(0)
+    near = query + 0.3 * unit(1)
+    embedder = FixedEmbedder({'query': query})
+    store = EmbeddingStore(str(tmp_path), embedder=embedder)
+    store.add(['a', 'b', 'c'], [unit(2), near, unit(3)])
+
+    hits = store.top_k('query', k=2)
+
+    assert [text for text, _ in hits][0] == 'b'
+    assert 'query' not in [text for text, _ in hits]
+    assert len(store.texts) == 3 and 'query' not in store
+    assert EmbeddingStore(str(tmp_path)).texts == ['a', 'b', 'c']
+
+
+def test_top_k_excludes_stored_query(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.add(['a', 'b', 'c'], [unit(0), unit(1), unit(2)])
+
+    hits = store.top_k('a', k=5)
+    assert sorted(text for text, _ in hits) == ['b', 'c']
+    assert [text for text, _ in store.top_k('a', k=5, candidates=['a', 'c'])] == ['c']
@@ -0,0 +1,86 @@
+import time
+import threading
+import concurrent.futures
+
+from Packages.LLM_API import HedgedLLM
+
+
+class SleepyClient:
+    def __init__(self, model, delay, answer):
+        self.provider = 'fake'
+        self.model = model
+        self.delay = delay
+        self.answer = answer
+        self.threads = []
+
+    def ask(self, prompt):
+        self.threads.append(threading.current_thread())
+        time.sleep(self.delay)
+        return self.answer
+
+
+def warmed_up(primary, secondary, latency, **kwargs):
+    hedged = HedgedLLM(primary, secondary, min_samples=5, **kwargs)
+    for _ in range(5):
+        hedged._record_latency(latency)
+    return hedged
+
+
+def test_primary_runs_in_caller_thread_without_samples():
+    primary = SleepyClient('primary', 0.0, 'p')
+    hedged = HedgedLLM(primary, SleepyClient('secondary', 0.0, 's'), min_samples=5)
+
+    assert hedged.ask('q') == 'p'
+    assert primary.threads == [threading.current_thread()]
+    assert len(hedged.latencies) == 1
+
+
+def test_slow_primary_is_hedged_and_its_latency_still_recorded():
+    primary = SleepyClient('primary', 0.3, 'p')
+    hedged = warmed_up(primary, SleepyClient('secondary', 0.0, 's'), 0.05, budget=1.0)
+
+    assert hedged.ask('q') == 's'
+    assert hedged.stats()['hedge_wins'] == 1
+    # 输掉的主请求结束后仍计入延迟统计
+    time.sleep(0.4)
+    assert max(hedged.latencies) >= 0.3
+
+
+def test_concurrent_callers_do_not_queue_behind_the_hedge_pool():
+    primary = SleepyClient('primary', 0.05, 'p')
+    secondary = SleepyClient('secondary', 0.0, 's')
+    hedged = warmed_up(primary, secondary, 0.5, budget=1.0, max_workers=1)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        start = time.perf_counter()
+        answers = list(executor.map(hedged.ask, ['q'] * 16))
+        elapsed = time.perf_counter() - start
+
+    assert answers == ['p'] * 16
+    assert hedged.stats()['hedges_fired'] == 0
+    assert elapsed < 0.4
+    assert max(list(hedged.latencies)[5:]) < 0.3
+
+
+def test_hedges_are_skipped_when_no_slot_is_free():
+    primary = SleepyClient('primary', 0.2, 'p')
+    hedged = warmed_up(primary, SleepyClient('secondary', 0.5, 's'), 0.01, budget=1.0, max_workers=1)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        answers = list(executor.map(hedged.ask, ['q'] * 4))
+
+    assert answers == ['p'] * 4
+    stats = hedged.stats()
+    assert stats['hedges_fired'] == 1
+    assert stats['slots_skipped'] == 3
+
+
+def test_ask_async_records_cancelled_primary():
+    import asyncio
+
+    primary = SleepyClient('primary', 0.3, 'p')
+    hedged = warmed_up(primary, SleepyClient('secondary', 0.0, 's'), 0.05, budget=1.0)
+
+    assert asyncio.run(hedged.ask_async('q')) == 's'
+    assert len(hedged.latencies) == 6
+    assert hedged.latencies[-1] >= 0.05
@@ -0,0 +1,52 @@
+import time
+
+from Packages.LLM_API import StandInServer
+
+from .conftest import scripted_answer
+
+
+def slow_first(prompt):
+    # 第一个输入明显慢于其他输入
+    if '格式回答：question 0\n' in prompt:
+        time.sleep(0.3)
+    return scripted_answer(prompt)
+
+
+def test_ordered_output_follows_input_order(make_llm, make_processor):
+    with StandInServer(latency=0.005, answers=slow_first) as server:
+        processor = make_processor(make_llm(server))
+        tuple_list = [(f'question {i}', i) for i in range(8)]
+
+        produced = list(processor.iter_perform(tuple_list, 4, ordered=True))
+
+    assert [idx for _, idx in produced] == list(range(8))
+    assert [result[0]['answer'] for result, _ in produced] == [q for q, _ in tuple_list]
+
+
+def test_unordered_output_follows_completion_order(make_llm, make_processor):
+    with StandInServer(latency=0.005, answers=slow_first) as server:
+        processor = make_processor(make_llm(server))
+        tuple_list = [(f'question {i}', i) for i in range(8)]
+
+        produced = list(processor.iter_perform(tuple_list, 4))
+
+    assert sorted(idx for _, idx in produced) == list(range(8))
+    assert produced[-1][1] == 0
+    assert all(result[1] == idx for result, idx in produced)
+
+
+def test_inputs_are_read_lazily(server, make_llm, make_processor):
+    processor = make_processor(make_llm(server))
+    consumed = []
+
+    def inputs():
+        for i in range(100):
+            consumed.append(i)
+            yield (f'question {i}', i)
+
+    stream = processor.iter_perform(inputs(), 2, ordered=True, max_pending=4)
+    first = [next(stream) for _ in range(3)]
+    stream.close()
+
+    assert [idx for _, idx in first] == [0, 1, 2]
+    assert len(consumed) < 20
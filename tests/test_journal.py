@@ -0,0 +1,56 @@
+from Packages.Multi_Process import CheckpointJournal
+
+
+def test_replay_merges_snapshot_and_journal(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    with CheckpointJournal(path) as journal:
+        journal.append(0, 'a')
+        journal.append(2, 'c')
+        journal.compact()
+        journal.append(1, 'b')
+
+    assert CheckpointJournal(path).replay() == ['a', 'b', 'c']
+
+
+def test_replay_ignores_torn_last_line(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    with CheckpointJournal(path) as journal:
+        journal.append(0, 'a')
+        journal.append(1, 'b')
+    with open(journal.journal_path, 'a', encoding='utf-8') as f:
+        f.write('{"i": 2, "r": "c')
+
+    assert CheckpointJournal(path).replay() == ['a', 'b']
+
+
+def test_open_with_reset_discards_previous_run(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    with CheckpointJournal(path) as journal:
+        journal.append(0, 'a')
+        journal.compact()
+    with CheckpointJournal(path).open(reset=True) as journal:
+        assert journal.replay() == []
+
+
+def test_second_writer_is_rejected(tmp_path):
+    import pytest
+
+    path = str(tmp_path / 'checkpoint.json')
+    with CheckpointJournal(path):
+        with pytest.raises(RuntimeError):
+            CheckpointJournal(path).open()
+
+
+def test_reopen_after_torn_line_keeps_new_records(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    with CheckpointJournal(path) as journal:
+        journal.append(0, 'a')
+    with open(journal.journal_path, 'a', encoding='utf-8') as f:
+        f.write('{"i": 1, "r": "b')
+
+    # Active_Reload 时以 reset=False 重新打开并继续追加
+    with CheckpointJournal(path) as journal:
+        journal.append(1, 'b')
+        journal.append(2, 'c')
+
+    assert CheckpointJournal(path).replay() == ['a', 'b', 'c']
@@ -0,0 +1,57 @@
+import pytest
+
+from Packages.LLM_API import StandInServer
+from Packages.LLM_Parser import LLMParser
+
+
+@pytest.fixture
+def parser():
+    return LLMParser()
+
+
+@pytest.mark.parametrize('text, expect, repaired', [
+    # 截断在值之前的键整个丢弃，不补成 None
+    ('{"name": "x", "k":', dict, {'name': 'x'}),
+    ('{"name": "x", "k": "abc', dict, {'name': 'x', 'k': 'abc'}),
+    ("{'a': 1, 'b': [1, 2,", dict, {'a': 1, 'b': [1, 2]}),
+    ('{"a": {"b": [1, {"c": 2', dict, {'a': {'b': [1, {'c': 2}]}}),
+    ("{'a': 1,}", dict, {'a': 1}),
+    ('```json\n{"ok": true, "v": null}\n```', dict, {'ok': True, 'v': None}),
+    ("前言 {'a'：1，'b'：2}", dict, {'a': 1, 'b': 2}),
+    ('{"q": "he said "hi" ok"}', dict, {'q': 'he said "hi" ok'}),
+    ('[1, 2, 3', list, [1, 2, 3]),
+    ('【1，2】', list, [1, 2]),
+    ("{'a': 1, 'b': [1, 2,", list, [1, 2]),
+])
+def test_repair_literal(parser, text, expect, repaired):
+    assert parser.repair_literal(text, expect) == repaired
+
+
+@pytest.mark.parametrize('text, expect', [
+    ('no brackets', None),
+    ('{"name": "x", "k":', list),
+    ('[1, 2, 3', dict),
+])
+def test_repair_literal_fails_loudly(parser, text, expect):
+    with pytest.raises(RuntimeError):
+        parser.repair_literal(text, expect)
+
+
+def test_repair_literal_is_deterministic(parser):
+    text = '{"name": "x", "items": [1, 2, {"k": "v'
+    assert parser.repair_literal(text, dict) == parser.repair_literal(text, dict) == {'name': 'x', 'items': [1, 2, {'k': 'v'}]}
+
+
+def test_repair_is_opt_in(make_llm, make_processor):
+    truncated = "{'answer': 'cut', 'length': 3"
+    with StandInServer(latency=0.005, answers=[truncated]) as server:
+        results = make_processor(make_llm(server)).multitask_perform([('a', 0)], 1)
+        assert results == [({'answer': None, 'input': 'a'}, 0)]
+
+    with StandInServer(latency=0.005, answers=[truncated]) as server:
+        processor = make_processor(make_llm(server), repair=True)
+        results = processor.multitask_perform([('a', 0)], 1)
+        # 本地修复成功，不再发纠错请求
+        assert results == [({'answer': 'cut', 'length': 3}, 0)]
+        assert server.stats()['requests'] == 1
+        assert processor.repair_stats['repaired'] == 1
@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+import requests
+
+from Packages.LLM_API import MetricsRegistry, StandInServer
+from Packages.LLM_API.metrics import Histogram, classify_error
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f'HTTP {status_code}')
+        self.status_code = status_code
+
+
+@pytest.mark.parametrize('error, expected', [
+    (StatusError(429), '429'),
+    (StatusError(503), '5xx'),
+    (StatusError(404), '4xx'),
+    (requests.exceptions.ReadTimeout(), 'timeout'),
+    (requests.exceptions.ConnectionError(), 'connection'),
+    (KeyError('choices'), 'parse'),
+    (RuntimeError('boom'), 'other'),
+])
+def test_classify_error(error, expected):
+    assert classify_error(error) == expected
+
+
+def test_wrapped_errors_are_classified_by_cause():
+    try:
+        try:
+            raise StatusError(429)
+        except StatusError as e:
+            raise ValueError('Error occurred during the API request') from e
+    except ValueError as wrapped:
+        assert classify_error(wrapped) == '429'
+
+
+def test_histogram_quantiles():
+    histogram = Histogram(buckets=(1.0, 2.0, float('inf')))
+    assert histogram.quantile(0.5) is None
+    for value in (0.5, 0.5, 1.5, 1.5):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == pytest.approx(1.0)
+    assert histogram.quantile(1.0) == pytest.approx(2.0)
+    assert histogram.sum == pytest.approx(4.0)
+
+
+def test_track_records_success_and_errors_from_many_threads():
+    registry = MetricsRegistry()
+
+    def work(i):
+        try:
+            with registry.track('p', 'm', 'ask') as call:
+                call.prompt_tokens = 3
+                call.completion_tokens = 2
+                if i % 4 == 0:
+                    raise StatusError(503)
+        except StatusError:
+            pass
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    series = registry.snapshot()['p/m']['ask']
+    assert series['requests'] == 40
+    assert series['errors'] == {'5xx': 10}
+    assert (series['prompt_tokens'], series['completion_tokens']) == (120, 80)
+
+
+def test_prometheus_export():
+    registry = MetricsRegistry()
+    registry.record('p', 'm"x', 'ask', 0.2, prompt_tokens=5, error='429')
+    text = registry.to_prometheus()
+
+    assert 'llm_requests_total{provider="p",model="m\\"x",method="ask"} 1' in text
+    assert 'llm_errors_total{provider="p",model="m\\"x",method="ask",class="429"} 1' in text
+    assert 'le="+Inf"} 1' in text
+    assert text.endswith('\n')
+
+
+def test_client_calls_are_recorded(make_llm):
+    with StandInServer(latency=0.0) as server:
+        llm = make_llm(server)
+        llm.ask('hi')
+    with StandInServer(latency=0.0, rate_5xx=1.0) as server:
+        failing = make_llm(server)
+        with pytest.raises(ValueError):
+            failing.ask('hi')
+
+    series = llm.metrics.snapshot()[f'{llm.provider}/{llm.model}']['ask']
+    assert series['requests'] == 1 and series['errors'] == {}
+    assert series['completion_tokens'] > 0 and series['bytes_sent'] > 0
+    assert failing.metrics.snapshot()[f'{failing.provider}/{failing.model}']['ask']['errors'] == {'5xx': 1}
@@ -0,0 +1,73 @@
+import pytest
+
+from Packages.Multi_Process import CheckpointJournal
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_multitask_perform_returns_results_in_input_order(server, make_llm, make_processor, engine):
+    processor = make_processor(make_llm(server))
+    tuple_list = [(f'question {i}', i) for i in range(40)]
+
+    results = processor.multitask_perform(tuple_list, 8, engine=engine)
+
+    assert len(results) == len(tuple_list)
+    for i, (data, index) in enumerate(results):
+        assert index == i
+        assert data['answer'] == f'question {i}'
+    assert server.stats()['requests'] == len(tuple_list)
+    # 检查点快照与返回值一致
+    assert [list(r) for r in results] == CheckpointJournal(processor.checkpoint_path).replay()
+
+
+@pytest.mark.parametrize('engine', ['threads', 'asyncio'])
+def test_multitask_perform_falls_back_to_empty_template(make_llm, make_processor, engine):
+    from Packages.LLM_API import StandInServer
+
+    with StandInServer(latency=0.005, answers=['没有字典的回答']) as server:
+        processor = make_processor(make_llm(server))
+        results = processor.multitask_perform([('a', 0), ('b', 1)], 2, engine=engine)
+
+    assert results == [({'answer': None, 'input': 'a'}, 0), ({'answer': None, 'input': 'b'}, 1)]
+
+
+def test_active_reload_only_runs_missing_tasks(server, make_llm, make_processor):
+    processor = make_processor(make_llm(server))
+    tuple_list = [(f'question {i}', i) for i in range(10)]
+    processor.multitask_perform(tuple_list[:6], 4)
+    before = server.stats()['requests']
+
+    results = processor.multitask_perform(tuple_list, 4, Active_Reload=True)
+
+    assert server.stats()['requests'] - before == 4
+    assert [index for _, index in results] == list(range(10))
+
+
+def test_offloader_is_created_once_across_threads(server, make_llm, make_processor, monkeypatch):
+    import time
+    import threading
+    from Packages.Multi_Process import multi_process
+
+    created = []
+
+    class SlowOffloader:
+        def __init__(self, *args):
+            time.sleep(0.05)
+            created.append(self)
+
+    monkeypatch.setattr(multi_process, 'CPUOffloader', SlowOffloader)
+    processor = make_processor(make_llm(server), cpu_processes=2)
+    barrier = threading.Barrier(8)
+    seen = []
+
+    def worker():
+        barrier.wait()
+        seen.append(processor.get_offloader())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 1
+    assert all(offloader is created[0] for offloader in seen)
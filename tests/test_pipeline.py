@@ -0,0 +1,49 @@
+import time
+
+from Packages.Multi_Process import Pipeline
+
+
+def test_stages_run_in_order_and_flatten_batches():
+    pipeline = Pipeline()
+    pipeline.add('double', lambda x: x * 2, workers=3)
+    pipeline.add_batch('pairs', lambda batch: [(x, len(batch)) for x in batch], batch_size=4, max_wait=0.05)
+    pipeline.add('first', lambda item: item[0], workers=2)
+
+    results = sorted(pipeline.run(range(20)))
+
+    assert results == [2 * i for i in range(20)]
+    stats = pipeline.stats()
+    assert stats['pairs']['received'] == 20
+    assert stats['first']['emitted'] == 20
+
+
+def test_failed_items_are_dropped_and_counted():
+    def fail_on_three(x):
+        if x == 3:
+            raise ValueError('bad item')
+        return x
+
+    pipeline = Pipeline().add('check', fail_on_three, workers=2)
+
+    assert sorted(pipeline.run(range(6))) == [0, 1, 2, 4, 5]
+    assert pipeline.stats()['check']['errors'] == 1
+
+
+def test_stages_overlap():
+    # 两个阶段各 0.05 秒，流水线总耗时应接近最慢的阶段而不是两者之和
+    pipeline = Pipeline()
+    pipeline.add('a', lambda x: time.sleep(0.05) or x, workers=4)
+    pipeline.add('b', lambda x: time.sleep(0.05) or x, workers=4)
+
+    start = time.perf_counter()
+    assert sorted(pipeline.run(range(16))) == list(range(16))
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 16 * 0.1 / 4
+
+
+def test_pipeline_can_run_twice():
+    pipeline = Pipeline().add('inc', lambda x: x + 1, workers=2)
+
+    assert sorted(pipeline.run(range(3))) == [1, 2, 3]
+    assert sorted(pipeline.run(range(3))) == [1, 2, 3]
@@ -0,0 +1,43 @@
+import time
+
+from Packages.Multi_Process import StageProfiler
+
+
+def test_nested_stages_are_not_subtracted_twice():
+    profiler = StageProfiler()
+    with profiler.item(0):
+        with profiler.stage('parse'):
+            with profiler.stage('repair'):
+                time.sleep(0.05)
+        time.sleep(0.05)
+
+    snapshot = profiler.snapshot()
+    item_total = snapshot['stages']['item']['total']
+    assert snapshot['items'] == 1
+    assert snapshot['stages']['repair']['nested'] and not snapshot['stages']['parse']['nested']
+    # other 约为 parse 之外的 0.05 秒，而不是被 repair 再扣一次后归零
+    assert 0.04 < snapshot['other'] < 0.08
+    assert abs(item_total - snapshot['stages']['parse']['total'] - snapshot['other']) < 1e-6
+    assert all(stage['share'] is None or stage['share'] <= 1 for stage in snapshot['stages'].values())
+    assert ' · repair' in profiler.summary()
+
+
+def test_item_count_for_batches():
+    profiler = StageProfiler()
+    with profiler.item([0, 1, 2], count=3):
+        with profiler.stage('batch.ask'):
+            pass
+    assert profiler.snapshot()['items'] == 3
+
+
+def test_batch_perform_profiles_batched_requests(server, make_llm, make_processor):
+    processor = make_processor(make_llm(server), profile=True)
+    tuple_list = [(f'question {i}', i) for i in range(12)]
+
+    processor.batch_perform(tuple_list, 2, max_batch=4)
+
+    snapshot = processor.profiler.snapshot()
+    assert snapshot['stages']['batch.ask']['calls'] >= 1
+    assert 'batch.parse' in snapshot['stages']
+    assert snapshot['items'] >= len(tuple_list)
+    assert snapshot['other'] <= snapshot['stages']['item']['total']
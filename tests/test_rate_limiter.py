@@ -0,0 +1,76 @@
+import time
+from email.utils import formatdate
+
+import pytest
+
+from Packages.LLM_API import RateLimiter, StandInServer
+
+
+def test_unconfigured_keys_are_not_limited():
+    limiter = RateLimiter()
+    assert all(limiter.acquire('p', 'm', 10 ** 9) == 0 for _ in range(100))
+
+
+def test_rpm_bucket_spaces_out_requests_after_burst():
+    limiter = RateLimiter()
+    limiter.configure('p', 'm', rpm=600)  # 每秒 10 个，突发 1 秒的配额
+
+    assert all(limiter.acquire('p', 'm') == 0 for _ in range(10))
+    assert limiter.estimated_wait('p', 'm') == pytest.approx(0.1, abs=0.03)
+    start = time.monotonic()
+    waited = limiter.acquire('p', 'm')
+    assert waited == pytest.approx(0.1, abs=0.03)
+    assert time.monotonic() - start >= waited
+    assert limiter.stats()['waits'] == 1
+
+
+def test_tpm_reservation_is_corrected_by_actual_usage():
+    limiter = RateLimiter()
+    limiter.configure('p', 'm', tpm=6000)  # 每秒 100 个 token
+
+    assert limiter.acquire('p', 'm', 100) == 0
+    assert limiter.estimated_wait('p', 'm', 100) == pytest.approx(1.0, abs=0.05)
+    # 实际只用了 20 个 token，退还 80 个
+    limiter.record_usage('p', 'm', 100, 20)
+    assert limiter.estimated_wait('p', 'm', 100) == pytest.approx(0.2, abs=0.05)
+
+
+def test_pause_blocks_only_that_model():
+    limiter = RateLimiter()
+    limiter.pause('p', 'm', 0.5)
+    assert limiter.estimated_wait('p', 'm') == pytest.approx(0.5, abs=0.05)
+    assert limiter.estimated_wait('p', 'other') == 0
+
+
+@pytest.mark.parametrize('headers, expected', [
+    ({'retry-after': '3'}, 3.0),
+    ({'retry-after-ms': '250'}, 0.25),
+    ({}, 1.0),
+    ({'retry-after': 'garbage'}, 1.0),
+])
+def test_parse_retry_after(headers, expected):
+    assert RateLimiter.parse_retry_after(headers) == expected
+
+
+def test_parse_retry_after_http_date():
+    headers = {'retry-after': formatdate(time.time() + 5, usegmt=True)}
+    assert 3 < RateLimiter.parse_retry_after(headers) <= 5
+
+
+def test_profile_round_trip(tmp_path):
+    limiter = RateLimiter()
+    limiter.configure('p', 'm', rpm=60, tpm=1000)
+    path = str(tmp_path / 'limits.json')
+    limiter.save_profile(path)
+
+    loaded = RateLimiter()
+    loaded.load_profile(path)
+    assert loaded.stats()['limits'] == limiter.stats()['limits']
+
+
+def test_429_pauses_the_model(make_llm):
+    with StandInServer(latency=0.0, rate_429=1.0, retry_after=0.5) as server:
+        llm = make_llm(server)
+        with pytest.raises(ValueError):
+            llm.ask('hi')
+        assert llm.rate_limiter.estimated_wait(llm.provider, llm.model) > 0.3
@@ -0,0 +1,41 @@
+from Packages.Multi_Process import ResultStore
+
+
+def test_put_get_and_stats(tmp_path):
+    store = ResultStore(str(tmp_path / 'results.sqlite'))
+    key = ResultStore.make_key('prompt', 'data', ('a',), 'model')
+
+    assert store.get(key) is None
+    store.put(key, [{'answer': 'a'}, None])
+
+    assert store.get_many([key, 'missing']) == {key: [{'answer': 'a'}, None]}
+    stats = store.stats()
+    assert (stats['hits'], stats['misses'], stats['writes'], stats['entries']) == (1, 2, 1, 1)
+    # 键只取决于内容
+    assert key == ResultStore.make_key('prompt', 'data', ['a'], 'model')
+    assert key != ResultStore.make_key('prompt', 'data', ('b',), 'model')
+
+
+def test_rerun_reuses_results_regardless_of_position(server, make_llm, make_processor, tmp_path):
+    path = str(tmp_path / 'results.sqlite')
+    first = make_processor(make_llm(server), name='first', result_store=path)
+    first.multitask_perform([(f'question {i}', i) for i in range(6)], 3)
+    requests = server.stats()['requests']
+
+    # 重新排序并插入一个新输入，标识也换了
+    tuple_list = [('question 5', 'e'), ('new question', 'n'), ('question 0', 'a'), ('question 3', 'c')]
+    second = make_processor(make_llm(server), name='second', result_store=path)
+    results = second.multitask_perform(tuple_list, 3)
+
+    assert server.stats()['requests'] == requests + 1
+    assert [(data['answer'], ident) for data, ident in results] == tuple_list
+    assert second.result_store.stats()['hits'] == 3
+
+
+def test_failed_results_are_not_stored(make_llm, make_processor, tmp_path):
+    from Packages.LLM_API import StandInServer
+
+    path = str(tmp_path / 'results.sqlite')
+    with StandInServer(latency=0.005, answers=['没有字典的回答']) as server:
+        make_processor(make_llm(server), result_store=path).multitask_perform([('a', 0)], 1)
+    assert ResultStore(path).stats()['entries'] == 0
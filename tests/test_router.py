@@ -0,0 +1,45 @@
+import pytest
+
+from Packages.LLM_API import LLMRouter, StandInServer
+
+
+def test_ask_fails_over_to_healthy_client(make_llm):
+    with StandInServer(latency=0.0, rate_5xx=1.0) as broken, StandInServer(latency=0.0, answers=['ok']) as healthy:
+        router = LLMRouter([make_llm(broken, model='broken'), make_llm(healthy, model='healthy')], strategy='best',
+                           failure_threshold=2, cooldown=60)
+
+        answers = [router.ask(f'question {i}') for i in range(5)]
+
+    assert answers == ['ok'] * 5
+    stats = router.stats()
+    # 连续失败 2 次后熔断，之后不再请求故障客户端
+    assert stats['openai-next/broken']['state'] == 'open'
+    assert broken.stats()['requests'] == 2
+    assert healthy.stats()['requests'] == 5
+
+
+def test_ask_raises_when_every_client_fails(make_llm):
+    with StandInServer(latency=0.0, rate_5xx=1.0) as first, StandInServer(latency=0.0, rate_5xx=1.0) as second:
+        router = LLMRouter([make_llm(first, model='first'), make_llm(second, model='second')])
+
+        with pytest.raises(RuntimeError):
+            router.ask('question')
+
+
+def test_ask_async_fails_over(make_llm):
+    import asyncio
+    from Packages.LLM_API import aclose_async_client
+
+    async def run(router):
+        try:
+            return await router.ask_async('question')
+        finally:
+            await aclose_async_client()
+
+    with StandInServer(latency=0.0, rate_5xx=1.0) as broken, StandInServer(latency=0.0, answers=['ok']) as healthy:
+        router = LLMRouter([make_llm(broken, model='broken'), make_llm(healthy, model='healthy')], strategy='best')
+        # 两个客户端都还没有样本，'best' 选第一个，即故障客户端
+        assert asyncio.run(run(router)) == 'ok'
+
+    assert broken.stats()['requests'] == 1
+    assert healthy.stats()['requests'] == 1
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from Packages.LLM_API import StandInServer
+from Packages.LLM_API.transport import get_session
+
+
+def test_stream_yields_the_full_answer(server, make_llm):
+    llm = make_llm(server)
+
+    parts = list(llm.ask('请按 data_template 格式回答：streamed\n', stream=True))
+
+    assert len(parts) > 1
+    assert ''.join(parts) == llm.ask('请按 data_template 格式回答：streamed\n')
+    stats = llm.stream_stats[-1]
+    assert stats['ttft'] is not None and stats['ttft'] <= stats['duration']
+    assert stats['completion_tokens'] > 0
+
+
+def test_async_stream_matches_sync_stream(server, make_llm):
+    llm = make_llm(server)
+
+    async def collect():
+        return [part async for part in llm.ask_stream_async('请按 data_template 格式回答：a\n')]
+
+    assert ''.join(asyncio.run(collect())) == ''.join(llm.ask('请按 data_template 格式回答：a\n', stream=True))
+
+
+def test_failed_stream_closes_the_response(make_llm, monkeypatch):
+    session = get_session()
+    responses = []
+    post = session.post
+
+    def tracking_post(*args, **kwargs):
+        response = post(*args, **kwargs)
+        responses.append(response)
+        return response
+
+    monkeypatch.setattr(session, 'post', tracking_post)
+    with StandInServer(latency=0.0, rate_5xx=1.0) as server:
+        llm = make_llm(server)
+        with pytest.raises(ValueError):
+            list(llm.ask('hi', stream=True))
+
+    assert len(responses) == 1
+    # 连接已释放回连接池
+    assert responses[0].raw.closed
@@ -0,0 +1,32 @@
+import time
+import asyncio
+
+import pytest
+
+from Packages.LLM_API import StandInServer, deadline
+
+
+def test_stream_respects_total_deadline(make_llm):
+    # 每个 token 都在单次读超时内到达，但总时长超过期限
+    with StandInServer(latency=0.0, per_token_latency=0.03, completion_tokens=40) as server:
+        llm = make_llm(server)
+        start = time.monotonic()
+        with pytest.raises(TimeoutError):
+            with deadline(0.3):
+                for _ in llm.ask('hi', stream=True):
+                    pass
+        assert time.monotonic() - start < 0.9
+
+
+def test_async_request_respects_total_deadline(make_llm):
+    with StandInServer(latency=3.0) as server:
+        llm = make_llm(server)
+
+        async def ask():
+            with deadline(0.2):
+                return await llm.ask_async('hi')
+
+        start = time.monotonic()
+        with pytest.raises((TimeoutError, ValueError)):
+            asyncio.run(ask())
+        assert time.monotonic() - start < 2.0
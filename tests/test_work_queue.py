@@ -0,0 +1,70 @@
+import collections
+
+import pytest
+
+from Packages.Multi_Process import SQLiteWorkQueue, RedisWorkQueue, LocalRedis
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def make_queue(request, tmp_path):
+    def make():
+        if request.param == 'sqlite':
+            return SQLiteWorkQueue(str(tmp_path / 'queue.sqlite'), lease_seconds=30)
+        return RedisWorkQueue(LocalRedis(), name='job', lease_seconds=30)
+    return make
+
+
+def flaky(processor, failures):
+    # 每个输入的前 failures 次执行抛出 TimeoutError，之后正常执行
+    run_tuple = processor.run_tuple
+    calls = collections.Counter()
+
+    def run(input_tuple, state):
+        calls[input_tuple] += 1
+        if calls[input_tuple] <= failures:
+            raise TimeoutError('stand-in timeout')
+        return run_tuple(input_tuple, state)
+
+    processor.run_tuple = run
+    return calls
+
+
+def test_timed_out_tasks_are_retried(server, make_llm, make_processor, make_queue):
+    queue = make_queue()
+    tuple_list = [(f'question {i}', i) for i in range(6)]
+    queue.put_many(enumerate(tuple_list))
+    processor = make_processor(make_llm(server))
+    calls = flaky(processor, failures=1)
+
+    acked = processor.serve_queue(queue, 3, max_attempts=3, poll_interval=0.01)
+
+    assert acked == len(tuple_list)
+    results = queue.results()
+    assert [results[i][0]['answer'] for i in range(len(tuple_list))] == [q for q, _ in tuple_list]
+    assert all(count == 2 for count in calls.values())
+
+
+def test_tasks_over_max_attempts_get_empty_template(server, make_llm, make_processor, make_queue):
+    queue = make_queue()
+    queue.put_many(enumerate([('a', 0), ('b', 1)]))
+    processor = make_processor(make_llm(server))
+    calls = flaky(processor, failures=10)
+
+    processor.serve_queue(queue, 2, max_attempts=2, poll_interval=0.01)
+
+    assert queue.results() == {0: [{'answer': None, 'input': 'a'}, 0], 1: [{'answer': None, 'input': 'b'}, 1]}
+    assert all(count == 2 for count in calls.values())
+
+
+def test_worker_recovers_lost_redis_items(server, make_llm, make_processor):
+    client = LocalRedis()
+    queue = RedisWorkQueue(client, name='job', lease_seconds=30)
+    queue.put_many(enumerate([(f'question {i}', i) for i in range(4)]))
+    # 模拟另一个节点 LPOP 之后、登记租约之前崩溃
+    client.lpop(queue.pending_key)
+    processor = make_processor(make_llm(server))
+
+    acked = processor.serve_queue(queue, 2, poll_interval=0.01)
+
+    assert acked == 4
+    assert sorted(queue.results()) == [0, 1, 2, 3]
@@ -0,0 +1,57 @@
+import time
+import threading
+import concurrent.futures
+
+import pytest
+
+from Packages.Multi_Process import WorkerPool
+
+
+def test_results_and_exceptions_are_delivered():
+    with WorkerPool(2) as pool:
+        assert pool.submit(lambda x: x * 2, 21).result() == 42
+        with pytest.raises(ZeroDivisionError):
+            pool.submit(lambda: 1 / 0).result()
+
+
+def test_timed_out_task_is_replaced():
+    release = threading.Event()
+    pool = WorkerPool(1)
+    try:
+        stuck = pool.submit(release.wait, timeout=0.05)
+        with pytest.raises(TimeoutError):
+            stuck.result()
+        # 替补线程接手后续任务
+        assert pool.submit(lambda: 'ok').result(timeout=1) == 'ok'
+        assert pool.stats()['stuck'] == 1
+    finally:
+        release.set()
+        pool.shutdown()
+
+
+def test_abandoned_threads_are_capped():
+    release = threading.Event()
+    pool = WorkerPool(2, max_abandoned=2)
+    try:
+        hung = [pool.submit(release.wait, timeout=0.05) for _ in range(8)]
+        done, _ = concurrent.futures.wait(hung[:4], timeout=2)
+        assert len(done) == 4
+        stats = pool.stats()
+        # 2 个卡住的线程有替补，之后的不再补线程，线程总数不超过 num_workers + max_abandoned
+        assert stats['stuck'] == 4
+        assert stats['owed'] == 2
+        assert stats['workers'] == 0
+        assert not any(f.done() for f in hung[4:])
+
+        # 卡住的线程返回后顶替欠下的工作线程，排队的任务继续执行
+        release.set()
+        assert pool.submit(lambda: 'ok').result(timeout=2) == 'ok'
+        concurrent.futures.wait(hung, timeout=2)
+        deadline = time.monotonic() + 2
+        while pool.stats()['stuck'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        stats = pool.stats()
+        assert (stats['stuck'], stats['owed']) == (0, 0)
+    finally:
+        release.set()
+        pool.shutdown()